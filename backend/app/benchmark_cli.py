@@ -0,0 +1,296 @@
+import argparse
+import json
+import locale
+import random
+import time
+from datetime import datetime, timedelta
+from typing import Callable, List
+import numpy as np
+from app import text_utils
+from app.services.mmr import mmr_select, normalize_relevance_scores
+
+
+def time_per_call(function: Callable, repeat: int) -> float:
+    """Return the best time of repeat runs of function, in seconds"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def print_comparison(name: str, baseline: float, optimized: float):
+    print(f"{name}")
+    print(f"  baseline:  {baseline * 1000:9.3f} ms")
+    print(f"  optimized: {optimized * 1000:9.3f} ms")
+    print(f"  speedup:   {baseline / optimized:9.1f}x")
+
+
+def legacy_format_date(date, locale_name: str):
+    """The locale based formatting that text_utils used before, as the baseline"""
+    if isinstance(date, str):
+        try:
+            date = datetime.fromisoformat(date)
+        except ValueError:
+            return "Invalid date format"
+    try:
+        locale.setlocale(locale.LC_TIME, locale_name)
+    except locale.Error:
+        pass
+    return date.strftime('%A, %d %B %Y')
+
+
+def random_publication_dates(count: int, seed: int) -> List[str]:
+    generator = random.Random(seed)
+    start = datetime(2010, 1, 1)
+    return [
+        (start + timedelta(days=generator.randrange(15 * 365), seconds=generator.randrange(86400))).isoformat()
+        for _ in range(count)
+    ]
+
+
+def benchmark_dates(args):
+    """Format the publication dates of the rerank candidates of a number of requests"""
+    requests = [random_publication_dates(args.candidates, seed) for seed in range(args.requests)]
+
+    def baseline():
+        for dates in requests:
+            for date in dates:
+                legacy_format_date(date, 'en_US.UTF-8')
+
+    def optimized():
+        for dates in requests:
+            for date in dates:
+                text_utils.get_formatted_date_english(date)
+
+    for dates in requests:
+        for date in dates:
+            expected = legacy_format_date(date, 'en_US.UTF-8')
+            if text_utils.get_formatted_date_english(date) != expected:
+                raise SystemExit(f"Output differs for {date}: {expected!r}")
+
+    print(f"Formatting {args.candidates} publication dates for each of {args.requests} requests")
+    baseline_time = time_per_call(baseline, args.repeat)
+    optimized_time = time_per_call(optimized, args.repeat)
+    print_comparison("Total", baseline_time, optimized_time)
+    print(f"  per request: {baseline_time / args.requests * 1e6:.1f} us -> {optimized_time / args.requests * 1e6:.1f} us")
+
+
+def legacy_mmr(relevance_scores, similarity_matrix, lambda_param: float, top_n: int) -> List[int]:
+    """The MMR loop that QdrantService used before, on sklearn's nested list input, as the baseline"""
+    selected = []
+    candidate_indices = list(range(len(relevance_scores)))
+    relevance_scores = normalize_relevance_scores(relevance_scores)
+
+    while len(selected) < top_n and candidate_indices:
+        mmr_scores = []
+        for idx in candidate_indices:
+            if selected:
+                sim_to_selected = max([similarity_matrix[idx][sel_idx] for sel_idx in selected])
+            else:
+                sim_to_selected = 0
+            mmr_scores.append((lambda_param * relevance_scores[idx] - (1 - lambda_param) * sim_to_selected, idx))
+        mmr_scores.sort(reverse=True)
+        selected_idx = mmr_scores[0][1]
+        selected.append(selected_idx)
+        candidate_indices.remove(selected_idx)
+    return selected
+
+
+def legacy_cosine_similarity(embeddings: List[List[float]]) -> np.ndarray:
+    """sklearn's cosine_similarity for dense input, without the dependency"""
+    matrix = np.asarray(embeddings, dtype=np.float64)
+    norms = np.sqrt(np.einsum("ij,ij->i", matrix, matrix))
+    norms[norms == 0.0] = 1.0
+    matrix /= norms[:, np.newaxis]
+    return matrix @ matrix.T
+
+
+def random_candidates(count: int, dimensions: int, seed: int):
+    """Dense vectors with groups of near-duplicates, like chunks of the same document, and rerank scores"""
+    generator = np.random.default_rng(seed)
+    documents = generator.normal(size=(max(1, count // 5), dimensions))
+    embeddings = documents[generator.integers(0, len(documents), count)]
+    embeddings = (embeddings + 0.05 * generator.normal(size=(count, dimensions))).astype(np.float32)
+    return embeddings, generator.random(count).tolist()
+
+
+def benchmark_mmr(args):
+    """MMR selection of the reranked candidates, as in QdrantService._select_relevant_documents"""
+    for count in args.sizes:
+        embeddings, relevance_scores = random_candidates(count, args.dimensions, count)
+        nested_embeddings = embeddings.tolist()
+
+        def baseline():
+            return legacy_mmr(relevance_scores, legacy_cosine_similarity(nested_embeddings), args.lambda_param, args.top_n)
+
+        def optimized():
+            return mmr_select(embeddings, relevance_scores, args.lambda_param, args.top_n)
+
+        if baseline() != optimized():
+            raise SystemExit(f"Selection differs for {count} candidates")
+        quantized = (embeddings * 16 + 128).clip(0, 255).astype(np.uint8)
+        expected = legacy_mmr(relevance_scores, legacy_cosine_similarity(quantized.tolist()), args.lambda_param, args.top_n)
+        if mmr_select(quantized, relevance_scores, args.lambda_param, args.top_n) != expected:
+            raise SystemExit(f"Selection differs for {count} uint8 candidates")
+
+        print_comparison(
+            f"{count} candidates, {args.dimensions} dimensions, top {args.top_n}",
+            time_per_call(baseline, args.repeat),
+            time_per_call(optimized, args.repeat)
+        )
+
+
+def benchmark_payload(args):
+    """
+    Bytes and deserialization time of Qdrant search results, with all vectors and
+    the full payload against the projection QdrantService requests. Uses the REST
+    API of the configured Qdrant, so the response size can be measured.
+    """
+    import httpx
+    from qdrant_client import models
+    from app.config import settings
+    from app.services.qdrant_service import QdrantService
+
+    base_url = f"http://{settings.QDRANT_HOST}:{settings.QDRANT_PORT}/collections/{settings.QDRANT_COLLECTION}/points"
+    projections = {
+        "full": {"with_payload": True, "with_vector": True},
+        "lean": {"with_payload": {"include": QdrantService.DOCUMENT_PAYLOAD_FIELDS}, "with_vector": QdrantService.SEARCH_VECTORS},
+    }
+
+    with httpx.Client(timeout=settings.QDRANT_TIMEOUT) as client:
+        # Search with the dense vectors of stored chunks, so no embedding API is needed
+        response = client.post(f"{base_url}/scroll", json={"limit": args.queries, "with_payload": False, "with_vector": [QdrantService.DENSE_VECTORS_NAME]})
+        response.raise_for_status()
+        query_vectors = [point["vector"][QdrantService.DENSE_VECTORS_NAME] for point in response.json()["result"]["points"]]
+
+        def fetch(projection) -> List[bytes]:
+            bodies = []
+            for query_vector in query_vectors:
+                response = client.post(f"{base_url}/query", json={
+                    "query": query_vector,
+                    "using": QdrantService.DENSE_VECTORS_NAME,
+                    "limit": args.limit,
+                    **projection
+                })
+                response.raise_for_status()
+                bodies.append(response.content)
+            return bodies
+
+        def deserialize(bodies: List[bytes]):
+            for body in bodies:
+                for point in json.loads(body)["result"]["points"]:
+                    models.ScoredPoint(**point)
+
+        print(f"{len(query_vectors)} searches of {args.limit} chunks in {settings.QDRANT_COLLECTION}")
+        results = {}
+        for name, projection in projections.items():
+            bodies = fetch(projection)
+            results[name] = (
+                sum(len(body) for body in bodies) / len(bodies),
+                time_per_call(lambda: fetch(projection), args.repeat) / len(bodies),
+                time_per_call(lambda: deserialize(bodies), args.repeat) / len(bodies),
+            )
+            size, request_time, deserialize_time = results[name]
+            print(f"{name}")
+            print(f"  response:    {size / 1024:9.1f} KiB per search")
+            print(f"  request:     {request_time * 1000:9.3f} ms per search")
+            print(f"  deserialize: {deserialize_time * 1000:9.3f} ms per search")
+        print(f"{results['full'][0] / results['lean'][0]:.1f}x fewer bytes, {results['full'][2] / results['lean'][2]:.1f}x faster deserialization")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Micro-benchmarks for the retrieval pipeline')
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+
+    dates_parser = subparsers.add_parser('dates', help='Date formatting of rerank candidates and documents')
+    dates_parser.add_argument(
+        '--candidates',
+        '-c',
+        type=int,
+        default=300,
+        help='Number of candidates per request'
+    )
+    dates_parser.add_argument(
+        '--requests',
+        '-n',
+        type=int,
+        default=100,
+        help='Number of requests'
+    )
+    dates_parser.add_argument(
+        '--repeat',
+        '-r',
+        type=int,
+        default=5,
+        help='Number of runs, the best one is reported'
+    )
+    dates_parser.set_defaults(run=benchmark_dates)
+
+    mmr_parser = subparsers.add_parser('mmr', help='MMR selection of reranked candidates')
+    mmr_parser.add_argument(
+        '--sizes',
+        type=int,
+        nargs='+',
+        default=[50, 200, 1000],
+        help='Numbers of candidates'
+    )
+    mmr_parser.add_argument(
+        '--dimensions',
+        '-d',
+        type=int,
+        default=1024,
+        help='Dimensions of the dense vectors'
+    )
+    mmr_parser.add_argument(
+        '--top-n',
+        '-k',
+        type=int,
+        default=20,
+        help='Number of documents to select'
+    )
+    mmr_parser.add_argument(
+        '--lambda-param',
+        '-l',
+        type=float,
+        default=0.7,
+        help='Weight of relevance against diversity'
+    )
+    mmr_parser.add_argument(
+        '--repeat',
+        '-r',
+        type=int,
+        default=5,
+        help='Number of runs, the best one is reported'
+    )
+    mmr_parser.set_defaults(run=benchmark_mmr)
+
+    payload_parser = subparsers.add_parser('payload', help='Size and deserialization of Qdrant search results, needs a running Qdrant')
+    payload_parser.add_argument(
+        '--queries',
+        '-q',
+        type=int,
+        default=20,
+        help='Number of searches'
+    )
+    payload_parser.add_argument(
+        '--limit',
+        type=int,
+        default=100,
+        help='Number of chunks per search'
+    )
+    payload_parser.add_argument(
+        '--repeat',
+        '-r',
+        type=int,
+        default=3,
+        help='Number of runs, the best one is reported'
+    )
+    payload_parser.set_defaults(run=benchmark_payload)
+
+    args = parser.parse_args()
+    args.run(args)
+
+if __name__ == "__main__":
+    main()
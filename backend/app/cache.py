@@ -0,0 +1,471 @@
+import asyncio
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from .config import settings
+from .concurrency import run_blocking
+from . import metrics
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def normalize_text(text: str) -> str:
+    """Normalize a query for use in a cache key: case-insensitive, with collapsed whitespace"""
+    return " ".join(text.casefold().split())
+
+
+def make_key(*parts: Any) -> str:
+    """Build a fixed-length cache key from any JSON-serializable parts"""
+    serialized = json.dumps(parts, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha256(serialized.encode("utf-8")).hexdigest()
+
+
+class LRUCache:
+    """
+    Thread-safe in-process LRU cache with an optional time-to-live per entry.
+    With max_bytes set, entries are also evicted once the sizes reported by
+    sizeof add up to more than max_bytes.
+    """
+
+    def __init__(
+        self, 
+        name: str, 
+        max_entries: int, 
+        ttl: Optional[float] = None, 
+        max_bytes: Optional[int] = None, 
+        sizeof: Callable[[Any], int] = None
+    ):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._sizeof = sizeof or (lambda value: 0)
+        self._entries: "OrderedDict[str, Tuple[Any, Optional[float], int]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at, _ = entry
+            if expires_at is not None and expires_at < time.time():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any):
+        expires_at = time.time() + self.ttl if self.ttl else None
+        size = self._sizeof(value)
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (value, expires_at, size)
+            self._bytes += size
+            while self._entries and (
+                len(self._entries) > self.max_entries or 
+                (self.max_bytes is not None and self._bytes > self.max_bytes)
+            ):
+                self._remove(next(iter(self._entries)))
+                metrics.increment(f"cache.{self.name}.evictions")
+
+    def delete(self, key: str):
+        with self._lock:
+            self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[2]
+
+    @property
+    def size_bytes(self) -> int:
+        return self._bytes
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SharedCache:
+    """
+    SQLite-backed cache tier that every uvicorn worker on the host can read.
+    Values are stored as bytes, entries expire after ttl seconds and the
+    oldest entries are evicted once the table holds more than max_entries.
+    Failures are logged and treated as misses, the shared tier never breaks
+    a request.
+    """
+    EVICTION_INTERVAL = 100  # writes between eviction passes
+
+    def __init__(self, name: str, path: str, max_entries: int, ttl: Optional[float] = None):
+        self.name = name
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._table = "cache_" + re.sub(r"\W", "_", name)
+        self._local = threading.local()
+        self._writes = 0
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite3 connections can't be shared between threads, so every thread gets its own
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(
+                f"CREATE TABLE IF NOT EXISTS {self._table} ("
+                "key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL, created_at REAL NOT NULL)"
+            )
+            connection.execute(f"CREATE INDEX IF NOT EXISTS {self._table}_created_at ON {self._table} (created_at)")
+            self._local.connection = connection
+        return connection
+
+    def get(self, key: str) -> Optional[bytes]:
+        try:
+            return self.lookup(key)
+        except sqlite3.Error as e:
+            self._error("reading", e)
+            return None
+
+    def lookup(self, key: str) -> Optional[bytes]:
+        """Like get(), but raises sqlite3.Error instead of treating a failure as a miss"""
+        row = self._connection().execute(
+            f"SELECT value, expires_at FROM {self._table} WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        value, expires_at = row
+        if expires_at is not None and expires_at < time.time():
+            return None
+        return value
+
+    def set(self, key: str, value: bytes):
+        now = time.time()
+        expires_at = now + self.ttl if self.ttl else None
+        try:
+            connection = self._connection()
+            connection.execute(
+                f"INSERT OR REPLACE INTO {self._table} (key, value, expires_at, created_at) VALUES (?, ?, ?, ?)",
+                (key, value, expires_at, now)
+            )
+            self._writes += 1
+            if self._writes % self.EVICTION_INTERVAL == 0:
+                self._evict(connection, now)
+        except sqlite3.Error as e:
+            self._error("writing", e)
+
+    def _evict(self, connection: sqlite3.Connection, now: float):
+        expired = connection.execute(f"DELETE FROM {self._table} WHERE expires_at < ?", (now,)).rowcount
+        overflow = connection.execute(
+            f"DELETE FROM {self._table} WHERE key IN ("
+            f"SELECT key FROM {self._table} ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,)
+        ).rowcount
+        if expired or overflow:
+            metrics.increment(f"cache.{self.name}.shared_evictions", expired + overflow)
+
+    def delete(self, key: str):
+        try:
+            self._connection().execute(f"DELETE FROM {self._table} WHERE key = ?", (key,))
+        except sqlite3.Error as e:
+            self._error("deleting from", e)
+
+    def clear(self):
+        try:
+            self._connection().execute(f"DELETE FROM {self._table}")
+        except sqlite3.Error as e:
+            self._error("clearing", e)
+
+    def _error(self, action: str, error: Exception):
+        logger.warning(f"Error {action} shared cache {self.name}: {error}")
+        metrics.increment(f"cache.{self.name}.shared_errors")
+
+
+class CacheGeneration:
+    """
+    A token that is part of cache keys, so bumping it makes every entry made
+    before unreachable. With SHARED_CACHE_PATH set, the token lives in the
+    shared SQLite file and a bump invalidates the caches of all workers.
+    """
+    INITIAL = "initial"
+
+    def __init__(self, name: str):
+        self.name = name
+        self._token = self.INITIAL
+        self.shared = None
+        if settings.SHARED_CACHE_PATH:
+            self.shared = SharedCache("generation", settings.SHARED_CACHE_PATH, max_entries=1000)
+
+    def get(self) -> Optional[str]:
+        """The current token, or None when it can't be read and the cache should be bypassed"""
+        if self.shared is None:
+            return self._token
+        try:
+            token = self.shared.lookup(self.name)
+        except sqlite3.Error as e:
+            logger.warning(f"Error reading cache generation {self.name}: {e}")
+            return None
+        return token.decode("ascii") if token is not None else self.INITIAL
+
+    async def get_async(self) -> Optional[str]:
+        """get() for the event loop, reading the shared token on the blocking executor"""
+        if self.shared is None:
+            return self._token
+        return await run_blocking(self.get)
+
+    def bump(self) -> str:
+        self._token = f"{time.time_ns()}-{os.getpid()}"
+        if self.shared is not None:
+            self.shared.set(self.name, self._token.encode("ascii"))
+        logger.info(f"Bumped cache generation {self.name} to {self._token}")
+        return self._token
+
+
+class _FlightAborted(Exception):
+    """The caller computing a value was cancelled before it finished"""
+
+
+class TieredCache:
+    """
+    In-process LRU in front of an optional SharedCache (enabled by
+    SHARED_CACHE_PATH), with single-flight computation: concurrent misses for
+    the same key in this process wait for one upstream call instead of each
+    making their own. Works for both threads and coroutines.
+
+    A miss waits at most CACHE_FLIGHT_TIMEOUT seconds for the flight of another
+    caller, then computes the value itself, so a hung upstream call can't hold
+    up every request for the same key.
+
+    dumps and loads convert values to and from the bytes kept in the shared tier,
+    pass shared=False to keep a cache in-process only. With track_savings, every
+    value served without computing it is credited with the average compute
+    time of this worker, reported as cache.<name>.saved_seconds(_per_hour).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_entries: int,
+        ttl: Optional[float] = None,
+        shared_max_entries: Optional[int] = None,
+        dumps: Callable[[Any], bytes] = None,
+        loads: Callable[[bytes], Any] = None,
+        max_bytes: Optional[int] = None,
+        sizeof: Callable[[Any], int] = None,
+        shared: bool = True,
+        track_savings: bool = False
+    ):
+        self.name = name
+        self.local = LRUCache(name, max_entries, ttl, max_bytes=max_bytes, sizeof=sizeof)
+        self.shared = None
+        if shared and settings.SHARED_CACHE_PATH:
+            self.shared = SharedCache(name, settings.SHARED_CACHE_PATH, shared_max_entries or max_entries * 10, ttl)
+        self._dumps = dumps or (lambda value: json.dumps(value).encode("utf-8"))
+        self._loads = loads or (lambda data: json.loads(data.decode("utf-8")))
+        self._flights: Dict[str, Future] = {}
+        self._flights_lock = threading.Lock()
+        self._hits = 0
+        self._lookups = 0
+        self.track_savings = track_savings
+        self._saved_seconds = 0.0
+        self._started_at = time.time()
+
+    def get(self, key: str) -> Optional[Any]:
+        value = self.local.get(key)
+        if value is not None:
+            self._record_lookup("local")
+            return value
+        return self._get_shared(key)
+
+    async def get_async(self, key: str) -> Optional[Any]:
+        """get() for the event loop: a local hit is served right away, the shared tier is read on the blocking executor"""
+        value = self.local.get(key)
+        if value is not None:
+            self._record_lookup("local")
+            return value
+        if self.shared is None:
+            self._record_lookup(None)
+            return None
+        return await run_blocking(self._get_shared, key)
+
+    def _get_shared(self, key: str) -> Optional[Any]:
+        if self.shared is not None:
+            data = self.shared.get(key)
+            if data is not None:
+                try:
+                    value = self._loads(data)
+                except Exception as e:
+                    logger.warning(f"Discarding unreadable shared cache entry in {self.name}: {e}")
+                    self.shared.delete(key)
+                else:
+                    self.local.set(key, value)
+                    self._record_lookup("shared")
+                    return value
+
+        self._record_lookup(None)
+        return None
+
+    def set(self, key: str, value: Any):
+        self.local.set(key, value)
+        if self.shared is not None:
+            self.shared.set(key, self._dumps(value))
+
+    def _set_shared(self, key: str, value: Any):
+        self.shared.set(key, self._dumps(value))
+
+    def delete(self, key: str):
+        self.local.delete(key)
+        if self.shared is not None:
+            self.shared.delete(key)
+
+    def clear(self):
+        self.local.clear()
+        if self.shared is not None:
+            self.shared.clear()
+
+    def get_or_compute(self, key: str, compute: Callable[[], Any]) -> Any:
+        value = self.get(key)
+        if value is not None:
+            self._record_saving()
+            return value
+
+        flight, leader = self._join_flight(key)
+        if not leader:
+            try:
+                value = flight.result(timeout=settings.CACHE_FLIGHT_TIMEOUT)
+            except FutureTimeoutError:
+                if flight.done():
+                    # The flight itself failed with a timeout
+                    raise
+                self._record_flight_timeout()
+                return compute()
+            except _FlightAborted:
+                return compute()
+            self._record_saving()
+            return value
+
+        try:
+            with self._timed_compute():
+                value = compute()
+        except Exception as e:
+            self._land_flight(key, flight, exception=e)
+            raise
+        except BaseException:
+            self._land_flight(key, flight, exception=_FlightAborted())
+            raise
+        return self._store_and_land(key, flight, value)
+
+    async def get_or_compute_async(self, key: str, compute: Callable[[], Awaitable[Any]]) -> Any:
+        value = await self.get_async(key)
+        if value is not None:
+            self._record_saving()
+            return value
+
+        flight, leader = self._join_flight(key)
+        if not leader:
+            try:
+                # Shielded, so a cancelled or timed out follower doesn't cancel the shared flight
+                value = await asyncio.wait_for(
+                    asyncio.shield(asyncio.wrap_future(flight)),
+                    timeout=settings.CACHE_FLIGHT_TIMEOUT
+                )
+            except asyncio.TimeoutError:
+                if flight.done():
+                    raise
+                self._record_flight_timeout()
+                return await compute()
+            except _FlightAborted:
+                return await compute()
+            self._record_saving()
+            return value
+
+        try:
+            with self._timed_compute():
+                value = await compute()
+        except Exception as e:
+            self._land_flight(key, flight, exception=e)
+            raise
+        except BaseException:
+            self._land_flight(key, flight, exception=_FlightAborted())
+            raise
+
+        # Followers get the value before it is written to the shared tier
+        if value is not None:
+            self.local.set(key, value)
+        self._land_flight(key, flight, value=value)
+        if value is not None and self.shared is not None:
+            await run_blocking(self._set_shared, key, value)
+        return value
+
+    def _timed_compute(self):
+        if self.track_savings:
+            return metrics.timed(f"cache.{self.name}.compute_seconds")
+        return contextlib.nullcontext()
+
+    def _record_saving(self):
+        if not self.track_savings:
+            return
+        with self._flights_lock:
+            self._saved_seconds += metrics.average(f"cache.{self.name}.compute_seconds")
+            hours = max(time.time() - self._started_at, 1.0) / 3600
+            metrics.set_gauge(f"cache.{self.name}.saved_seconds", self._saved_seconds)
+            metrics.set_gauge(f"cache.{self.name}.saved_seconds_per_hour", self._saved_seconds / hours)
+
+    def _record_flight_timeout(self):
+        logger.warning(f"Timed out waiting for a concurrent computation in cache {self.name}, computing it again")
+        metrics.increment(f"cache.{self.name}.flight_timeouts")
+
+    def _store_and_land(self, key: str, flight: Future, value: Any) -> Any:
+        if value is not None:
+            self.set(key, value)
+        self._land_flight(key, flight, value=value)
+        return value
+
+    def _join_flight(self, key: str) -> Tuple[Future, bool]:
+        with self._flights_lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                metrics.increment(f"cache.{self.name}.collapsed")
+                return flight, False
+            flight = self._flights[key] = Future()
+            return flight, True
+
+    def _land_flight(self, key: str, flight: Future, value: Any = None, exception: BaseException = None):
+        with self._flights_lock:
+            self._flights.pop(key, None)
+        if exception is not None:
+            flight.set_exception(exception)
+        else:
+            flight.set_result(value)
+
+    def _record_lookup(self, tier: Optional[str]):
+        self._lookups += 1
+        if tier is None:
+            metrics.increment(f"cache.{self.name}.misses")
+        else:
+            self._hits += 1
+            metrics.increment(f"cache.{self.name}.hits.{tier}")
+        metrics.set_gauge(f"cache.{self.name}.hit_rate", self._hits / self._lookups)
+        metrics.set_gauge(f"cache.{self.name}.entries", len(self.local))
+        if self.local.max_bytes is not None:
+            metrics.set_gauge(f"cache.{self.name}.bytes", self.local.size_bytes)
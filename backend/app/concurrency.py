@@ -0,0 +1,74 @@
+import asyncio
+import contextvars
+import functools
+import logging
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import AsyncGenerator, Callable, Iterable
+from .config import settings
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Bounded pool for the blocking parts of the chat pipeline (Cohere SDK calls,
+# Qdrant calls, SQLAlchemy sessions). Keeping these off the event loop means a
+# slow upstream call only occupies a worker thread, not every SSE stream that
+# the uvicorn worker is serving.
+_blocking_executor = ThreadPoolExecutor(
+    max_workers=settings.BLOCKING_EXECUTOR_MAX_WORKERS,
+    thread_name_prefix="bron-blocking"
+)
+
+_STOP = object()
+
+
+async def run_blocking(func: Callable, *args, **kwargs):
+    """Run a blocking callable on the bounded executor and await its result"""
+    return await submit_blocking(func, *args, **kwargs)
+
+
+def submit_blocking(func: Callable, *args, **kwargs) -> asyncio.Future:
+    """
+    Schedule a blocking callable on the bounded executor right away. The call
+    runs to completion even if the returned future is never awaited.
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    call = functools.partial(context.run, func, *args, **kwargs)
+    return loop.run_in_executor(_blocking_executor, call)
+
+
+def submit_blocking_sync(func: Callable, *args, **kwargs) -> Future:
+    """
+    Variant of submit_blocking for sync code, such as the sync retrieval path,
+    so that work shares the same bounded executor.
+    """
+    context = contextvars.copy_context()
+    return _blocking_executor.submit(context.run, func, *args, **kwargs)
+
+
+async def iterate_blocking(iterable: Iterable) -> AsyncGenerator:
+    """
+    Iterate a blocking (sync) iterable without blocking the event loop.
+    Every call to next() runs on the bounded executor, so a stream that waits
+    for its next upstream chunk does not hold up other streams.
+    """
+    iterator = await run_blocking(iter, iterable)
+    try:
+        while True:
+            item = await run_blocking(next, iterator, _STOP)
+            if item is _STOP:
+                break
+            yield item
+    finally:
+        close = getattr(iterator, "close", None)
+        if close is not None:
+            # Don't await: this may run while the generator is being cancelled
+            _blocking_executor.submit(_close_quietly, close)
+
+
+def _close_quietly(close: Callable):
+    try:
+        close()
+    except Exception as e:
+        logger.debug(f"Error closing blocking iterator: {e}")
@@ -21,12 +21,54 @@ class Settings(BaseSettings):
     RERANK_RELEVANCE_THRESHOLD: float = float(os.getenv("RERANK_RELEVANCE_THRESHOLD"))    
     MMR_DOC_LAMBDA_PARAM: float = float(os.getenv("MMR_DOC_LAMBDA_PARAM"))
     
+    # Grouped retrieval: the best chunks of the top source documents (meta.source_id) instead of raw chunks,
+    # the default for /chat, which can override it per request
+    QDRANT_GROUP_BY_DOCUMENT: bool = os.getenv("QDRANT_GROUP_BY_DOCUMENT", "false").lower() == "true"
+    QDRANT_GROUP_RETRIEVE_LIMIT: int = int(os.getenv("QDRANT_GROUP_RETRIEVE_LIMIT", 40))
+    QDRANT_GROUP_CHUNK_LIMIT: int = int(os.getenv("QDRANT_GROUP_CHUNK_LIMIT", 3))
+    
+    # Query planner: exact search or HNSW, and the prefetch limits, from the estimated number of points matching the filters
+    QDRANT_PLANNER_ENABLED: bool = os.getenv("QDRANT_PLANNER_ENABLED", "true").lower() == "true"
+    # Filters matching at most this many points are searched exactly
+    QDRANT_PLANNER_EXACT_THRESHOLD: int = int(os.getenv("QDRANT_PLANNER_EXACT_THRESHOLD", 10000))
+    # Filters matching less than this share of the collection are searched with QDRANT_PLANNER_FILTERED_HNSW_EF
+    QDRANT_PLANNER_SELECTIVE_RATIO: float = float(os.getenv("QDRANT_PLANNER_SELECTIVE_RATIO", 0.05))
+    QDRANT_PLANNER_FILTERED_HNSW_EF: int = int(os.getenv("QDRANT_PLANNER_FILTERED_HNSW_EF", 256))
+    # Scales the sparse and dense prefetch limits of broad searches, which match at least QDRANT_PLANNER_SELECTIVE_RATIO,
+    # selective HNSW searches get a share of it in proportion to the share of the collection they match
+    QDRANT_PLANNER_BROAD_LIMIT_FACTOR: float = float(os.getenv("QDRANT_PLANNER_BROAD_LIMIT_FACTOR", 2.0))
+    # The estimated counts per filter are counted again after the TTL
+    QDRANT_PLANNER_COUNT_TTL: int = int(os.getenv("QDRANT_PLANNER_COUNT_TTL", 3600))
+    QDRANT_PLANNER_COUNT_CACHE_MAX_ENTRIES: int = int(os.getenv("QDRANT_PLANNER_COUNT_CACHE_MAX_ENTRIES", 10000))
+    
+    # Per-stage timeouts (seconds) for the concurrent query embedding step
+    SPARSE_EMBEDDING_TIMEOUT: float = float(os.getenv("SPARSE_EMBEDDING_TIMEOUT", 5))
+    DENSE_EMBEDDING_TIMEOUT: float = float(os.getenv("DENSE_EMBEDDING_TIMEOUT", 15))
+    
+    # Speculative retrieval: prefetch candidates for the raw query while it is being rewritten
+    SPECULATIVE_RETRIEVAL: bool = os.getenv("SPECULATIVE_RETRIEVAL", "false").lower() == "true"
+    SPECULATIVE_RETRIEVAL_MAX_WORDS: int = int(os.getenv("SPECULATIVE_RETRIEVAL_MAX_WORDS", 8))
+    SPECULATIVE_RETRIEVAL_SIMILARITY_THRESHOLD: float = float(os.getenv("SPECULATIVE_RETRIEVAL_SIMILARITY_THRESHOLD", 0.95))
+    
+    # Background session naming
+    SESSION_NAMING_WORKERS: int = int(os.getenv("SESSION_NAMING_WORKERS", 2))
+    SESSION_NAMING_QUEUE_SIZE: int = int(os.getenv("SESSION_NAMING_QUEUE_SIZE", 1000))
+    SESSION_NAMING_MAX_ATTEMPTS: int = int(os.getenv("SESSION_NAMING_MAX_ATTEMPTS", 3))
+    SESSION_NAMING_RETRY_DELAY: float = float(os.getenv("SESSION_NAMING_RETRY_DELAY", 2))
+    # How long an open chat stream waits for the LLM name before closing
+    SESSION_NAMING_STREAM_WAIT: float = float(os.getenv("SESSION_NAMING_STREAM_WAIT", 3))
+    
     ALLOWED_ORIGINS: str = os.getenv("ALLOWED_ORIGINS", "").split(",")
     ENVIRONMENT: str = os.getenv("ENVIRONMENT")
     # Qdrant settings
     QDRANT_POOL_SIZE: int = int(os.getenv("QDRANT_POOL_SIZE"))
     QDRANT_POOL_TIMEOUT: int = int(os.getenv("QDRANT_POOL_TIMEOUT"))
     QDRANT_TIMEOUT: int = int(os.getenv("QDRANT_TIMEOUT"))
+    # Optional local Qdrant location (e.g. ":memory:" or a path) for the async pool, instead of host and port
+    QDRANT_LOCATION: str = os.getenv("QDRANT_LOCATION")
+    
+    # Thread pool for blocking calls made from the async chat pipeline
+    BLOCKING_EXECUTOR_MAX_WORKERS: int = int(os.getenv("BLOCKING_EXECUTOR_MAX_WORKERS", 64))
     SENTRY_DSN: str = os.getenv("SENTRY_DSN")
 
     OTEL_EXPORTER_OTLP_HEADER: str = os.getenv("OTEL_EXPORTER_OTLP_HEADER")
@@ -36,4 +78,101 @@ class Settings(BaseSettings):
     PHOENIX_PROJECT_NAME: str = os.getenv("PHOENIX_PROJECT_NAME")
     LLM_SERVICE: str = os.getenv("LLM_SERVICE", "cohere")
     
+    # Shared Cohere HTTP clients
+    COHERE_TIMEOUT: float = float(os.getenv("COHERE_TIMEOUT", 60))
+    COHERE_MAX_CONNECTIONS: int = int(os.getenv("COHERE_MAX_CONNECTIONS", 50))
+    COHERE_KEEPALIVE_EXPIRY: float = float(os.getenv("COHERE_KEEPALIVE_EXPIRY", 120))
+    
+    # End a chat stream that produced no new delta for this many seconds (0 disables the watchdog)
+    CHAT_STREAM_IDLE_TIMEOUT: float = float(os.getenv("CHAT_STREAM_IDLE_TIMEOUT", 30))
+    
+    # Admission control for /chat, per worker
+    CHAT_MAX_IN_FLIGHT: int = int(os.getenv("CHAT_MAX_IN_FLIGHT", 16))
+    CHAT_ADMISSION_QUEUE_SIZE: int = int(os.getenv("CHAT_ADMISSION_QUEUE_SIZE", 32))
+    CHAT_ADMISSION_QUEUE_TIMEOUT: float = float(os.getenv("CHAT_ADMISSION_QUEUE_TIMEOUT", 10))
+    CHAT_ADMISSION_RETRY_AFTER: int = int(os.getenv("CHAT_ADMISSION_RETRY_AFTER", 5))
+    CHAT_ADMISSION_PER_CLIENT_FAIRNESS: bool = os.getenv("CHAT_ADMISSION_PER_CLIENT_FAIRNESS", "false").lower() == "true"
+    # Maximum running plus queued chat requests per client IP (0 means no limit)
+    CHAT_ADMISSION_MAX_PER_CLIENT: int = int(os.getenv("CHAT_ADMISSION_MAX_PER_CLIENT", 0))
+    
+    # SQLite file shared by all workers on the host as second cache tier (empty disables it)
+    SHARED_CACHE_PATH: str = os.getenv("SHARED_CACHE_PATH", "")
+    # Seconds a cache miss waits for a concurrent computation of the same key before computing it itself
+    CACHE_FLIGHT_TIMEOUT: float = float(os.getenv("CACHE_FLIGHT_TIMEOUT", 15))
+    
+    # Dense query embedding cache
+    EMBEDDING_CACHE_ENABLED: bool = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+    EMBEDDING_CACHE_MAX_ENTRIES: int = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", 10000))
+    EMBEDDING_CACHE_SHARED_MAX_ENTRIES: int = int(os.getenv("EMBEDDING_CACHE_SHARED_MAX_ENTRIES", 100000))
+    EMBEDDING_CACHE_TTL: int = int(os.getenv("EMBEDDING_CACHE_TTL", 7 * 24 * 3600))
+    
+    # Sparse query embedding cache, persisted in SHARED_CACHE_PATH when enabled
+    SPARSE_EMBEDDING_CACHE_ENABLED: bool = os.getenv("SPARSE_EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+    SPARSE_EMBEDDING_CACHE_MAX_ENTRIES: int = int(os.getenv("SPARSE_EMBEDDING_CACHE_MAX_ENTRIES", 50000))
+    SPARSE_EMBEDDING_CACHE_MAX_BYTES: int = int(os.getenv("SPARSE_EMBEDDING_CACHE_MAX_BYTES", 32 * 1024 * 1024))
+    SPARSE_EMBEDDING_CACHE_TTL: int = int(os.getenv("SPARSE_EMBEDDING_CACHE_TTL", 30 * 24 * 3600))
+    SPARSE_EMBEDDING_CACHE_PERSIST: bool = os.getenv("SPARSE_EMBEDDING_CACHE_PERSIST", "false").lower() == "true"
+    
+    # Query rewrite cache, keyed on the query, its history and the prompt version
+    QUERY_REWRITE_CACHE_ENABLED: bool = os.getenv("QUERY_REWRITE_CACHE_ENABLED", "true").lower() == "true"
+    QUERY_REWRITE_CACHE_MAX_ENTRIES: int = int(os.getenv("QUERY_REWRITE_CACHE_MAX_ENTRIES", 10000))
+    QUERY_REWRITE_CACHE_SHARED_MAX_ENTRIES: int = int(os.getenv("QUERY_REWRITE_CACHE_SHARED_MAX_ENTRIES", 100000))
+    QUERY_REWRITE_CACHE_TTL: int = int(os.getenv("QUERY_REWRITE_CACHE_TTL", 7 * 24 * 3600))
+    
+    # Rerank score cache, per query, chunk and rerank model
+    RERANK_CACHE_ENABLED: bool = os.getenv("RERANK_CACHE_ENABLED", "true").lower() == "true"
+    RERANK_CACHE_MAX_ENTRIES: int = int(os.getenv("RERANK_CACHE_MAX_ENTRIES", 200000))
+    RERANK_CACHE_SHARED_MAX_ENTRIES: int = int(os.getenv("RERANK_CACHE_SHARED_MAX_ENTRIES", 2000000))
+    RERANK_CACHE_TTL: int = int(os.getenv("RERANK_CACHE_TTL", 7 * 24 * 3600))
+    
+    # Pre-rerank compaction: exact and near-duplicate candidates are dropped, and content is cut to a token budget (0 disables)
+    RERANK_DEDUP_ENABLED: bool = os.getenv("RERANK_DEDUP_ENABLED", "true").lower() == "true"
+    # Minimum cosine similarity between the dense vectors of two candidates to drop the lower ranked one
+    RERANK_DEDUP_SIMILARITY_THRESHOLD: float = float(os.getenv("RERANK_DEDUP_SIMILARITY_THRESHOLD", 0.98))
+    RERANK_MAX_TOKENS: int = int(os.getenv("RERANK_MAX_TOKENS", 1000))
+    # Serialized rerank form per chunk payload and token budget
+    RERANK_DOCUMENT_CACHE_ENABLED: bool = os.getenv("RERANK_DOCUMENT_CACHE_ENABLED", "true").lower() == "true"
+    RERANK_DOCUMENT_CACHE_MAX_ENTRIES: int = int(os.getenv("RERANK_DOCUMENT_CACHE_MAX_ENTRIES", 50000))
+    RERANK_DOCUMENT_CACHE_MAX_BYTES: int = int(os.getenv("RERANK_DOCUMENT_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+    
+    # Retrieval result cache, per query, location filter, date range and retrieval settings
+    RETRIEVAL_CACHE_ENABLED: bool = os.getenv("RETRIEVAL_CACHE_ENABLED", "true").lower() == "true"
+    RETRIEVAL_CACHE_MAX_ENTRIES: int = int(os.getenv("RETRIEVAL_CACHE_MAX_ENTRIES", 1000))
+    RETRIEVAL_CACHE_SHARED_MAX_ENTRIES: int = int(os.getenv("RETRIEVAL_CACHE_SHARED_MAX_ENTRIES", 10000))
+    RETRIEVAL_CACHE_TTL: int = int(os.getenv("RETRIEVAL_CACHE_TTL", 15 * 60))
+    
+    # Semantic query cache, reuses the documents of a near-duplicate query with the same filters
+    SEMANTIC_CACHE_ENABLED: bool = os.getenv("SEMANTIC_CACHE_ENABLED", "false").lower() == "true"
+    # Minimum cosine similarity between dense query embeddings, tune with app.semantic_cache_cli
+    SEMANTIC_CACHE_SIMILARITY_THRESHOLD: float = float(os.getenv("SEMANTIC_CACHE_SIMILARITY_THRESHOLD", 0.95))
+    SEMANTIC_CACHE_MAX_ENTRIES: int = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", 5000))
+    SEMANTIC_CACHE_TTL: int = int(os.getenv("SEMANTIC_CACHE_TTL", 15 * 60))
+    
+    # Chunk payload cache for the session view, per chunk id and corpus version, needs SHARED_CACHE_PATH to purge every worker
+    CHUNK_PAYLOAD_CACHE_ENABLED: bool = os.getenv("CHUNK_PAYLOAD_CACHE_ENABLED", "true").lower() == "true"
+    CHUNK_PAYLOAD_CACHE_MAX_ENTRIES: int = int(os.getenv("CHUNK_PAYLOAD_CACHE_MAX_ENTRIES", 50000))
+    CHUNK_PAYLOAD_CACHE_MAX_BYTES: int = int(os.getenv("CHUNK_PAYLOAD_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+    CHUNK_PAYLOAD_CACHE_SHARED_MAX_ENTRIES: int = int(os.getenv("CHUNK_PAYLOAD_CACHE_SHARED_MAX_ENTRIES", 500000))
+    CHUNK_PAYLOAD_CACHE_TTL: int = int(os.getenv("CHUNK_PAYLOAD_CACHE_TTL", 30 * 24 * 3600))
+    
+    # Bron locations, refreshed in the background once older than the TTL
+    LOCATIONS_CACHE_TTL: int = int(os.getenv("LOCATIONS_CACHE_TTL", 24 * 3600))
+    LOCATIONS_REFRESH_RETRY_INTERVAL: int = int(os.getenv("LOCATIONS_REFRESH_RETRY_INTERVAL", 60))
+    LOCATIONS_FETCH_TIMEOUT: float = float(os.getenv("LOCATIONS_FETCH_TIMEOUT", 10))
+    # JSON snapshot of the last refresh, so workers start warm without the external API
+    LOCATIONS_SNAPSHOT_PATH: str = os.getenv("LOCATIONS_SNAPSHOT_PATH", "")
+    # How long browsers may use /locations without revalidating it
+    LOCATIONS_HTTP_MAX_AGE: int = int(os.getenv("LOCATIONS_HTTP_MAX_AGE", 3600))
+    
+    # Rendered GET /sessions/{id} responses, needs SHARED_CACHE_PATH for the per-session versions
+    SESSION_CACHE_ENABLED: bool = os.getenv("SESSION_CACHE_ENABLED", "true").lower() == "true"
+    SESSION_CACHE_MAX_ENTRIES: int = int(os.getenv("SESSION_CACHE_MAX_ENTRIES", 2000))
+    SESSION_CACHE_MAX_BYTES: int = int(os.getenv("SESSION_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+    SESSION_CACHE_SHARED_MAX_ENTRIES: int = int(os.getenv("SESSION_CACHE_SHARED_MAX_ENTRIES", 20000))
+    SESSION_CACHE_TTL: int = int(os.getenv("SESSION_CACHE_TTL", 24 * 3600))
+    SESSION_VERSIONS_MAX_ENTRIES: int = int(os.getenv("SESSION_VERSIONS_MAX_ENTRIES", 1000000))
+    
+    # Token for the admin endpoints (X-Admin-Token header), admin endpoints are disabled when unset
+    ADMIN_TOKEN: str = os.getenv("ADMIN_TOKEN")
+    
 settings = Settings()
@@ -1,9 +1,13 @@
 import os
 from fastapi import FastAPI, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from .routers import chat, sessions, feedback, data
+from .routers import chat, sessions, feedback, data, metrics, admin
 from .config import settings
 from .database import init_db
+from .services.session_naming_service import SessionNamingService
+from .services.llm_registry import close_llm_clients
+from .services.qdrant_pool import AsyncQdrantConnectionPool
+from .services.bron_service import LocationsStore
 import asyncio
 import sentry_sdk
 from phoenix.otel import register
@@ -45,6 +49,8 @@ app.include_router(data.router)
 app.include_router(chat.router)
 app.include_router(sessions.router)
 app.include_router(feedback.router)
+app.include_router(metrics.router)
+app.include_router(admin.router)
 
 
 base_api_url = "/"
@@ -56,6 +62,15 @@ if settings.ENVIRONMENT == "development":
 async def startup_event():
     # await asyncio.sleep(10)
     init_db()
+    SessionNamingService.get_instance().start()
+    LocationsStore.get_instance().start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await SessionNamingService.get_instance().stop()
+    await close_llm_clients()
+    await AsyncQdrantConnectionPool.close_instance()
+    await LocationsStore.get_instance().stop()
 
 @app.get("/")
 async def root():
@@ -0,0 +1,70 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict
+
+# Process-local metrics registry. Every uvicorn worker keeps its own numbers,
+# which are exposed through the /metrics endpoint of that worker.
+_lock = threading.Lock()
+_counters: Dict[str, float] = {}
+_gauges: Dict[str, float] = {}
+_timings: Dict[str, Dict[str, float]] = {}
+_started_at = time.time()
+
+
+def increment(name: str, value: float = 1):
+    """Increase a counter"""
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def set_gauge(name: str, value: float):
+    """Set a gauge to its current value"""
+    with _lock:
+        _gauges[name] = value
+
+
+def observe(name: str, value: float):
+    """Record a single observation (usually a duration in seconds)"""
+    with _lock:
+        timing = _timings.get(name)
+        if timing is None:
+            timing = _timings[name] = {"count": 0, "sum": 0.0, "max": 0.0, "last": 0.0}
+        timing["count"] += 1
+        timing["sum"] += value
+        timing["last"] = value
+        if value > timing["max"]:
+            timing["max"] = value
+
+
+def average(name: str) -> float:
+    """Return the mean of a timing, or 0 when nothing was observed yet"""
+    with _lock:
+        timing = _timings.get(name)
+        if not timing or not timing["count"]:
+            return 0.0
+        return timing["sum"] / timing["count"]
+
+
+@contextmanager
+def timed(name: str):
+    """Observe the wall-clock duration of the wrapped block"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start)
+
+
+def snapshot() -> Dict:
+    """Return a copy of all metrics, with the mean of every timing"""
+    with _lock:
+        timings = {}
+        for name, timing in _timings.items():
+            timings[name] = dict(timing, avg=timing["sum"] / timing["count"] if timing["count"] else 0.0)
+        return {
+            "uptime_seconds": time.time() - _started_at,
+            "counters": dict(_counters),
+            "gauges": dict(_gauges),
+            "timings": timings,
+        }
@@ -0,0 +1,47 @@
+from fastapi import APIRouter, Header, HTTPException
+import hmac
+import logging
+from typing import Optional
+from ..config import settings
+from ..concurrency import run_blocking
+from ..services.retrieval_cache import RetrievalCache
+from ..services.semantic_cache import SemanticQueryCache
+from ..services.payload_cache import ChunkPayloadCache
+from ..services.query_planner import QueryPlanner
+
+router = APIRouter()
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+ENVIRONMENT = settings.ENVIRONMENT
+
+base_api_url = "/"
+if ENVIRONMENT == "development":
+    base_api_url = "/api/"
+
+
+def verify_admin_token(token: Optional[str]):
+    if not settings.ADMIN_TOKEN or not token or not hmac.compare_digest(token.encode("utf-8"), settings.ADMIN_TOKEN.encode("utf-8")):
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+
+@router.post(base_api_url + "admin/cache/purge")
+async def purge_caches(x_admin_token: Optional[str] = Header(None)):
+    """
+    Purge the caches that hold corpus content, to call after the index is
+    updated. With SHARED_CACHE_PATH set this reaches every worker, otherwise
+    only the worker that handles this request, which the scope in the
+    response tells the caller.
+    """
+    verify_admin_token(x_admin_token)
+    await run_blocking(RetrievalCache.get_instance().purge)
+    # Other workers drop their semantic cache when they see the new retrieval generation
+    SemanticQueryCache.get_instance().clear()
+    await run_blocking(ChunkPayloadCache.get_instance().purge)
+    # The index changed, so the filter cardinality estimates of the planner are recounted
+    await run_blocking(QueryPlanner.get_instance().counts.clear)
+    scope = "all_workers" if settings.SHARED_CACHE_PATH else "worker"
+    logger.info(f"Purged retrieval, semantic query, chunk payload and filter count caches of {scope}")
+    return {"purged": ["retrieval", "semantic_query", "chunk_payload", "filter_count"], "scope": scope}
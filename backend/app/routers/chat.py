@@ -1,21 +1,28 @@
-from fastapi import APIRouter, Depends, Query
+from fastapi import APIRouter, Depends, Query, Request
 from fastapi.responses import StreamingResponse
 import logging
 import json
+import asyncio
 from asyncio import sleep
 from ..database import get_db
 from sqlalchemy.orm import Session as SQLAlchemySession
 from ..services.session_service import SessionService
-from ..services.cohere_service import CohereService
 from ..services.base_llm_service import BaseLLMService
-from ..services.litellm_service import LiteLLMService
-from ..services.qdrant_service import QdrantService
+from ..services.llm_registry import get_llm_service
+from ..services.qdrant_service import QdrantService, SpeculativeSearch
 from ..services.bron_service import BronService
+from ..services.session_naming_service import SessionNamingService
+from ..services.session_write_buffer import SessionWriteBuffer
+from ..services.chat_turn_guard import ChatTurnGuard, ClientDisconnected, StreamIdleTimeout
+from ..services.admission_controller import AdmissionController, AdmissionRejected, AdmissionSlot
 from ..schemas import ChatMessage, ChatDocument, SessionCreate, SessionUpdate, Session, MessageRole, MessageType, SearchFilter
 from ..config import settings
 from typing import List, Dict, AsyncGenerator
 from ..text_utils import get_formatted_date_english, format_text
+from ..concurrency import run_blocking, submit_blocking
+from .. import metrics
 import time
+import weakref
 from datetime import date, datetime
 from fastapi.responses import JSONResponse
 
@@ -34,24 +41,33 @@ if ENVIRONMENT == "development":
     
 @router.get(base_api_url + "chat")
 async def chat_endpoint(
+    request: Request,
     query: str = Query(..., description="The chat message content"),
     session_id: str = Query(None, description="The session ID"),
     locations: List[str] = Query(None, description="List of location IDs to filter by"),
     start_date: date = Query(None, description="Start date to filter by"),
     end_date: date = Query(None, description="End date to filter by"),
     rewrite_query: bool = Query(True, description="Whether to enable query rewriting"),
+    speculative_retrieval: bool = Query(None, description="Whether to prefetch documents for the raw query while it is being rewritten"),
+    group_by_document: bool = Query(None, description="Whether to retrieve the best chunks of the top documents instead of the top chunks"),
     db: SQLAlchemySession = Depends(get_db)
 ):
+    # Start timer for request duration tracking
+    start_time = time.time()
+    
+    # Wait for a free pipeline slot, or shed the request while the worker is saturated
+    try:
+        admission_slot = await AdmissionController.get_instance().admit(get_client_id(request))
+    except AdmissionRejected as e:
+        return JSONResponse(
+            status_code=503, 
+            content={"detail": "Bron is op dit moment erg druk, probeer het over enkele seconden opnieuw"},
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    
     try:
-        # Start timer for request duration tracking
-        start_time = time.time()
         
-        llm_service = None
-        if settings.LLM_SERVICE.lower() == "litellm":
-            llm_service = LiteLLMService()
-        else:
-            llm_service = CohereService()
-            
+        llm_service = get_llm_service()
         qdrant_service = QdrantService(llm_service)    
         session_service = SessionService(db)
         bron_service = BronService()
@@ -62,6 +78,9 @@ async def chat_endpoint(
         logger.debug(f"end_date: {end_date}")
         logger.debug(f"rewrite_query: {rewrite_query}")  
         
+        if group_by_document is None:
+            group_by_document = settings.QDRANT_GROUP_BY_DOCUMENT
+        
         date_range = None
         if start_date is not None and end_date is not None:
             date_range = [
@@ -75,20 +94,31 @@ async def chat_endpoint(
         search_filters = SearchFilter(
             locations=locations_objects,
             date_range=date_range,
-            rewrite_query=rewrite_query
+            rewrite_query=rewrite_query,
+            group_by_document=group_by_document
         )
         logger.info(f"search_filters: {search_filters}")  
+        
+        if speculative_retrieval is None:
+            speculative_retrieval = settings.SPECULATIVE_RETRIEVAL
+        
+        stream = event_generator(
+            session_id, 
+            query, 
+            start_time, 
+            session_service, 
+            llm_service, 
+            qdrant_service,
+            search_filters,
+            ChatTurnGuard(request),
+            admission_slot,
+            speculative_retrieval
+        )
+        # The generator releases the slot when it ends, this covers a stream that never starts
+        weakref.finalize(stream, release_from_any_thread, asyncio.get_running_loop(), admission_slot)
        
         return StreamingResponse(
-            event_generator(
-                session_id, 
-                query, 
-                start_time, 
-                session_service, 
-                llm_service, 
-                qdrant_service,
-                search_filters
-            ),
+            stream,
             media_type="text/event-stream",
             headers={
                 "Cache-Control": "no-cache",
@@ -97,9 +127,28 @@ async def chat_endpoint(
             }
         )
     except Exception as e:
+        admission_slot.release()
         logger.error(f"Error in chat_endpoint: {e}", exc_info=True)
         return JSONResponse(status_code=500, content={"detail": "Internal Server Error"})
 
+def release_from_any_thread(loop: asyncio.AbstractEventLoop, admission_slot: AdmissionSlot):
+    """Release the slot on its event loop, from whichever thread finalizes the stream"""
+    # After the loop has shut down nothing waits for the slot anymore
+    if loop.is_closed():
+        return
+    try:
+        loop.call_soon_threadsafe(admission_slot.release)
+    except RuntimeError:
+        # Closed between the check and the call
+        pass
+
+def get_client_id(request: Request) -> str:
+    """The client IP, taken from the proxy header when the request was forwarded"""
+    forwarded_for = request.headers.get("x-forwarded-for")
+    if forwarded_for:
+        return forwarded_for.split(",")[0].strip()
+    return request.client.host if request.client else "unknown"
+
 async def event_generator(
     session_id: str,
     user_query: str,
@@ -107,8 +156,15 @@ async def event_generator(
     session_service: SessionService, 
     llm_service: BaseLLMService, 
     qdrant_service: QdrantService,
-    search_filters: SearchFilter
+    search_filters: SearchFilter,
+    guard: ChatTurnGuard,
+    admission_slot: AdmissionSlot,
+    speculative_retrieval: bool = False
 ):      
+    # Abort the upstream work of this turn as soon as the client disconnects
+    guard.start()
+    client_connected = True
+    
     # Initialize status message content
     status_content = []   
     
@@ -122,51 +178,57 @@ async def event_generator(
     }) + "\n\n"
     await sleep(0)
     
-    session = session_service.get_session_with_relations(session_id)
-    user_message = llm_service.get_user_message(user_query, search_filters)
-    rewritten_query_for_llm = llm_service.rewrite_query_for_llm(user_message)
-        
-    if len(session.messages) == 0:
-        # Create new session with initial messages
-        is_initial_message = True
-        rag_system_message = llm_service.get_rag_system_message()
-       
-        # if search_filters.rewrite_query:
-        user_message.user_query = user_query
-        user_message.rewritten_query_for_llm = rewritten_query_for_llm
+    session = await run_blocking(session_service.get_session_with_relations, session_id)
+    # Buffer the writes of this turn, they are persisted in one transaction when the turn ends
+    write_buffer = SessionWriteBuffer(session_service, session)
+    
+    speculative_task = None
+    response_stream = None
+    try:
+        guard.enter_stage("rewrite")
+        if speculative_retrieval and len(user_query.split()) <= settings.SPECULATIVE_RETRIEVAL_MAX_WORDS:
+            speculative_task = start_speculative_search(qdrant_service, user_query, search_filters)
         
-        rewritten_query_for_vector_base = llm_service.rewrite_query_for_vector_base(user_message)
-        user_message.formatted_content = rewritten_query_for_vector_base
-        user_message.rewritten_query_for_vector_base = rewritten_query_for_vector_base
-        # else:
-        #     user_message.formatted_content = user_query
+        user_message = llm_service.get_user_message(user_query, search_filters)
+        rewritten_query_for_llm = llm_service.rewrite_query_for_llm(user_message)
             
-        #     # new fields
-        #     user_message.user_query = user_query
-        #     user_message.rewritten_query_for_llm = rewritten_query_for_llm
-        logger.debug(f"user_message: {user_message}")        
-        session = session_service.add_messages(
-            session_id=session.id,
-            messages=[rag_system_message, user_message]
-        )
-        
-    else:
-        is_initial_message = False   
-        
-        user_message.user_query = user_query
-        user_message.rewritten_query_for_llm = rewritten_query_for_llm
-        
-        rewritten_query_for_vector_base = llm_service.rewrite_query_with_history_for_vector_base(user_message, session.messages)
-        user_message.formatted_content = rewritten_query_for_vector_base
-        user_message.rewritten_query_for_vector_base = rewritten_query_for_vector_base
-        
-        session = session_service.add_message(
-            session_id=session.id, 
-            message=user_message
-        )
-        logger.info(f"Using existing session: {session.id}")
+        if len(session.messages) == 0:
+            # Create new session with initial messages
+            is_initial_message = True
+            rag_system_message = llm_service.get_rag_system_message()
+           
+            # if search_filters.rewrite_query:
+            user_message.user_query = user_query
+            user_message.rewritten_query_for_llm = rewritten_query_for_llm
+            
+            rewritten_query_for_vector_base = await guard.run(llm_service.rewrite_query_for_vector_base_async(user_message))
+            user_message.formatted_content = rewritten_query_for_vector_base
+            user_message.rewritten_query_for_vector_base = rewritten_query_for_vector_base
+            # else:
+            #     user_message.formatted_content = user_query
+                
+            #     # new fields
+            #     user_message.user_query = user_query
+            #     user_message.rewritten_query_for_llm = rewritten_query_for_llm
+            logger.debug(f"user_message: {user_message}")        
+            session = write_buffer.add_messages([rag_system_message, user_message])
+            
+        else:
+            is_initial_message = False   
+            
+            user_message.user_query = user_query
+            user_message.rewritten_query_for_llm = rewritten_query_for_llm
+            
+            rewritten_query_for_vector_base = await guard.run(llm_service.rewrite_query_with_history_for_vector_base_async(
+                user_message, 
+                session.messages
+            ))
+            user_message.formatted_content = rewritten_query_for_vector_base
+            user_message.rewritten_query_for_vector_base = rewritten_query_for_vector_base
+            
+            session = write_buffer.add_message(user_message)
+            logger.info(f"Using existing session: {session.id}")
         
-    try:        
         # Second status message
         status_msg = f"Zoekopdracht herschreven van '{user_message.user_query}' naar '{user_message.rewritten_query_for_vector_base}'"
         status_content.append(status_msg)
@@ -194,14 +256,21 @@ async def event_generator(
         }) + "\n\n"
         await sleep(0)
         
+        guard.enter_stage("retrieval")
         try: 
+            speculative_search = await guard.run(get_speculative_search(speculative_task))
+            
             # Use the formatted_content (rewritten query) from the last message
-            relevant_docs = qdrant_service.retrieve_relevant_documents(
+            relevant_docs = await guard.run(qdrant_service.retrieve_relevant_documents_async(
                 user_message.rewritten_query_for_vector_base,
                 locations=search_filters.locations,
-                date_range=search_filters.date_range
-            )
+                date_range=search_filters.date_range,
+                speculative_search=speculative_search,
+                group_by_document=search_filters.group_by_document
+            ))
             logger.debug(f"Relevant documents: {relevant_docs}")
+        except ClientDisconnected:
+            raise
         except Exception as e:
             logger.error(f"Error retrieving documents: {e}")
             
@@ -226,7 +295,7 @@ async def event_generator(
             await sleep(0)
             return
         
-        session_documents = session_service.get_documents(session)
+        session_documents = await run_blocking(session_service.get_documents, session)
         if not session_documents:
             combined_relevant_docs = relevant_docs
         else:
@@ -266,18 +335,18 @@ async def event_generator(
         await sleep(0)
         
         # Save the status messages to the database
-        status_message = session_service.add_and_get_message(
-            session_id=session.id,
-            message=ChatMessage(
-                role=MessageRole.SYSTEM,
-                content="\n".join(status_content),
-                message_type=MessageType.STATUS
-            )
+        status_message = ChatMessage(
+            role=MessageRole.SYSTEM,
+            content="\n".join(status_content),
+            message_type=MessageType.STATUS
         )
+        write_buffer.add_message(status_message)
         
-        async for response in generate_full_response(
+        guard.enter_stage("generation")
+        response_stream = generate_full_response(
             llm_service, 
-            session_service, 
+            guard,
+            write_buffer, 
             session.messages, 
             relevant_docs, 
             is_initial_message, 
@@ -285,23 +354,89 @@ async def event_generator(
             user_message,
             status_message,
             start_time
-        ):
+        )
+        async for response in response_stream:
             yield 'data: ' + json.dumps(response) + "\n\n"
             await sleep(0)
+            if response["type"] == "full":
+                # The answer is complete, waiting for the session name doesn't need a pipeline slot
+                admission_slot.release()
+    
+    except ClientDisconnected as e:
+        logger.info(f"{e}, aborting the chat turn")
+        client_connected = False
+        guard.record_abandoned()
+        
+    except (asyncio.CancelledError, GeneratorExit):
+        client_connected = False
+        guard.record_abandoned()
+        raise
  
     except Exception as e:
         logger.error(f"Error in chat_endpoint: {e}", exc_info=True)
         yield 'data: ' + json.dumps({"type": "error", "content": str(e)}) + "\n\n"
         await sleep(0)
         
-    finally:            
+    finally:
+        guard.finish()
+        # Usually released after the full answer already, release() is idempotent
+        admission_slot.release()
+        if speculative_task is not None:
+            speculative_task.cancel()
+        if response_stream is not None:
+            # Lets an answer that was cut off record its partial text before the flush
+            await response_stream.aclose()
+        
+        # Persist whatever the turn buffered, also when it failed or was aborted
+        await persist_session_writes(write_buffer)
+        
         # Send a proper close event with data
-        yield 'event: close\n\ndata: {"type": "end"}\n\n'
-        await sleep(0)
+        if client_connected:
+            yield 'event: close\n\ndata: {"type": "end"}\n\n'
+            await sleep(0)
+        
+def start_speculative_search(qdrant_service: QdrantService, user_query: str, search_filters: SearchFilter) -> asyncio.Future:
+    """Prefetch candidates for the raw query while the LLM rewrite is in flight"""
+    task = asyncio.ensure_future(
+        qdrant_service.speculative_hybrid_search_async(
+            user_query,
+            locations=search_filters.locations,
+            date_range=search_filters.date_range,
+            group_by_document=search_filters.group_by_document
+        )
+    )
+    # Don't warn about unretrieved exceptions when the turn fails before the task is awaited
+    task.add_done_callback(lambda t: t.cancelled() or t.exception())
+    return task
+
+async def get_speculative_search(speculative_task: asyncio.Future) -> SpeculativeSearch:
+    if speculative_task is None:
+        return None
+    
+    try:
+        return await speculative_task
+    except Exception as e:
+        logger.warning(f"Speculative retrieval failed, falling back to regular retrieval: {e}")
+        return None
+        
+async def persist_session_writes(write_buffer: SessionWriteBuffer):
+    if not write_buffer.has_pending_writes:
+        return
+    
+    # Submitted before awaiting, so the flush completes even if this stream is cancelled
+    flush = submit_blocking(write_buffer.flush)
+    try:
+        await asyncio.shield(flush)
+    except asyncio.CancelledError:
+        logger.info("Stream cancelled while persisting the turn, flush continues in the background")
+        raise
+    except Exception as e:
+        logger.error(f"Error persisting session writes: {e}", exc_info=True)
         
 async def generate_full_response(
     llm_service : BaseLLMService, 
-    session_service: SessionService, 
+    guard: ChatTurnGuard,
+    write_buffer: SessionWriteBuffer, 
     session_messages: List[ChatMessage], 
     relevant_docs: List[Dict], 
     is_initial_message: bool, 
@@ -315,39 +450,54 @@ async def generate_full_response(
     text_formatted_with_citations = ""
     citations = []
     
-    async for event in generate_response(llm_service, session_messages, relevant_docs):
-        if event["type"] == "status":
-            yield {
-                "type": "status",
-                "role": "assistant",
-                "content": event["content"],
-                "content_original": event["content"],
-            }
-        elif event["type"] == "text":
-            full_text += event["content"]
-            yield {
-                "type": "partial",
-                "role": "assistant",
-                "content": event["content"],
-            }
-        elif event["type"] == "citation":
-            citations.append(event["content"])
-            text_formatted_with_citations = format_text(full_text, citations)
-            yield {
-                "type": "citation",
-                "role": "assistant",
-                "content": text_formatted_with_citations,
-                "content_original": full_text,
-                "citations": citations,
-            }
+    response_events = generate_response(llm_service, guard, session_messages, relevant_docs)
+    try:
+        async for event in response_events:
+            if event["type"] == "status":
+                yield {
+                    "type": "status",
+                    "role": "assistant",
+                    "content": event["content"],
+                    "content_original": event["content"],
+                }
+            elif event["type"] == "text":
+                full_text += event["content"]
+                yield {
+                    "type": "partial",
+                    "role": "assistant",
+                    "content": event["content"],
+                }
+            elif event["type"] == "citation":
+                citations.append(event["content"])
+                text_formatted_with_citations = format_text(full_text, citations)
+                yield {
+                    "type": "citation",
+                    "role": "assistant",
+                    "content": text_formatted_with_citations,
+                    "content_original": full_text,
+                    "citations": citations,
+                }
+    except StreamIdleTimeout as e:
+        logger.warning(f"{e}, ending the answer with the text received so far")
+        status_msg = "\nHet antwoord is afgebroken omdat er geen nieuwe tekst meer binnenkwam"
+        status_message.content += status_msg
+        yield {
+            "type": "status",
+            "role": "assistant",
+            "content": status_msg,
+            "content_original": status_msg
+        }
+    except (ClientDisconnected, asyncio.CancelledError, GeneratorExit):
+        buffer_partial_answer(write_buffer, full_text, citations, relevant_docs, status_message)
+        raise
+    finally:
+        await response_events.aclose()
     
     if not full_text:
         status_msg = "\nEr konden geen relevante documenten worden gevonden om de vraag te beantwoorden"
         status_message.content += status_msg
-        session_service.update_message(
-            session_id=session_id,
-            message=status_message
-        )
+        write_buffer.update_message(status_message)
+        await run_blocking(write_buffer.flush)
         yield {
             "type": "status",
             "role": "assistant",
@@ -355,10 +505,12 @@ async def generate_full_response(
             "content_original": status_msg
         }    
     else:
+        session_name_future = None
         if is_initial_message:
             try:
-                chat_name = llm_service.create_chat_session_name(user_message)     
-                session_service.update_session_name(session_id=session_id, name=chat_name)
+                # Name the session with the LLM in the background, use the query until then
+                fallback_name = SessionNamingService.get_fallback_name(user_message.user_query)
+                write_buffer.update_session_name(fallback_name)
             except Exception as e:
                 logger.error(f"Error creating session name: {e}", exc_info=True)
              
@@ -368,32 +520,19 @@ async def generate_full_response(
             else:
                 text_formatted = format_text(full_text, [])
                 
-            session_service.add_message(
-                session_id=session_id,
-                message=ChatMessage(                                
-                    role=MessageRole.ASSISTANT,
-                    message_type=MessageType.ASSISTANT_MESSAGE,
-                    content=full_text,
-                    formatted_content=text_formatted,                                    
-                    documents = [
-                        ChatDocument(
-                            chunk_id=doc.get('chunk_id'),
-                            score=doc.get('score'),
-                            rerank_score=doc.get('rerank_score'),
-                            content=doc.get('content', ''),
-                            title=doc.get('title', ''),
-                            url=doc.get('url', '')
-                        )
-                        for doc in relevant_docs
-                    ]   
-                )
-            )
+            write_buffer.add_message(get_assistant_message(full_text, text_formatted, relevant_docs))
         except Exception as e:
             logger.error(f"Error updating session: {e}", exc_info=True)
                   
         status_msg = f"\nAntwoord gegenereerd in {time.time() - start_time:.2f} seconden"
         status_message.content += status_msg
-        session_service.update_message(message=status_message)
+        write_buffer.update_message(status_message)
+        
+        # Persist the whole turn in one transaction before the final session is read back
+        await run_blocking(write_buffer.flush)
+        
+        if is_initial_message:
+            session_name_future = SessionNamingService.get_instance().enqueue(session_id, user_message, llm_service)
         
         yield {
             "type": "status",
@@ -402,7 +541,7 @@ async def generate_full_response(
         } 
         
         text_formatted_with_citations = format_text(full_text, citations)    
-        session = session_service.get_session_with_relations(session_id)    
+        session = await run_blocking(write_buffer.session_service.get_session_with_relations, session_id)
         # Remove system messages from the session
         session.messages = [msg for msg in session.messages if msg.message_type != MessageType.SYSTEM_MESSAGE]              
                          
@@ -411,7 +550,52 @@ async def generate_full_response(
             "session": session.model_dump()
         }
         
-async def generate_response(llm_service: BaseLLMService, messages: List[ChatMessage], relevant_docs: List[Dict]) -> AsyncGenerator[Dict, None]:        
+        if session_name_future is not None:
+            try:
+                chat_name = await asyncio.wait_for(
+                    asyncio.shield(session_name_future), 
+                    timeout=settings.SESSION_NAMING_STREAM_WAIT
+                )
+                if chat_name:
+                    yield {
+                        "type": "session_name",
+                        "session_id": session_id,
+                        "name": chat_name
+                    }
+            except asyncio.TimeoutError:
+                logger.info("Session name not ready yet, it will be sent on the next session fetch")
+        
+def get_assistant_message(full_text: str, text_formatted: str, relevant_docs: List[Dict]) -> ChatMessage:
+    return ChatMessage(                                
+        role=MessageRole.ASSISTANT,
+        message_type=MessageType.ASSISTANT_MESSAGE,
+        content=full_text,
+        formatted_content=text_formatted,                                    
+        documents = [
+            ChatDocument(
+                chunk_id=doc.get('chunk_id'),
+                score=doc.get('score'),
+                rerank_score=doc.get('rerank_score'),
+                content=doc.get('content', ''),
+                title=doc.get('title', ''),
+                url=doc.get('url', '')
+            )
+            for doc in relevant_docs
+        ]   
+    )
+
+def buffer_partial_answer(write_buffer: SessionWriteBuffer, full_text: str, citations: List[Dict], relevant_docs: List[Dict], status_message: ChatMessage):
+    """Keep the part of the answer the user already saw when the turn is cut off"""
+    try:
+        if full_text:
+            write_buffer.add_message(get_assistant_message(full_text, format_text(full_text, citations), relevant_docs))
+            metrics.increment("chat.partial_answers")
+        status_message.content += "\nHet antwoord is onderbroken doordat de verbinding werd verbroken"
+        write_buffer.update_message(status_message)
+    except Exception as e:
+        logger.error(f"Error recording partial answer: {e}", exc_info=True)
+        
+async def generate_response(llm_service: BaseLLMService, guard: ChatTurnGuard, messages: List[ChatMessage], relevant_docs: List[Dict]) -> AsyncGenerator[Dict, None]:        
     logger.debug(f"Generating response for messages and documents: {messages}")
         
     formatted_docs = [{     
@@ -433,8 +617,13 @@ async def generate_response(llm_service: BaseLLMService, messages: List[ChatMess
     current_citation = None
     first_citation = True
     
+    chat_stream = None
     try:
-        for event in llm_service.chat_stream(messages, formatted_docs):
+        chat_stream = guard.iterate(
+            await guard.run(llm_service.chat_stream_async(messages, formatted_docs)),
+            idle_timeout=settings.CHAT_STREAM_IDLE_TIMEOUT or None
+        )
+        async for event in chat_stream:
             if event:
                 if hasattr(event, 'type'):
                     if event.type == "content-delta":
@@ -480,4 +669,7 @@ async def generate_response(llm_service: BaseLLMService, messages: List[ChatMess
         logger.error(f"Error in generate_response: {e}")
         raise
     finally:
+        if chat_stream is not None:
+            # Closing the stream closes the upstream Cohere response
+            await chat_stream.aclose()
         logger.info("Exiting generate_response")
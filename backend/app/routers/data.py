@@ -1,9 +1,9 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Header, Response
 import logging
+from typing import Optional
 from ..config import settings
-from sqlalchemy.orm import Session as SQLAlchemySession
-from ..database import get_db
 from ..services.bron_service import BronService
+from ..http_cache import IMMUTABLE_CACHE_CONTROL, etag_matches, make_etag
 
 router = APIRouter()
 
@@ -19,12 +19,25 @@ if ENVIRONMENT == "development":
 
 
 @router.get(base_api_url + "locations")
-async def get_locations(db: SQLAlchemySession = Depends(get_db)):
-    """Return a list of available locations"""
+async def get_locations(version: Optional[str] = None, if_none_match: Optional[str] = Header(None)):
+    """
+    Return a list of available locations. The ETag is a hash of the content,
+    and a request for the current ?version= may be cached indefinitely.
+    """
    
     bron_service = BronService()
     try:
-        return await bron_service.get_locations()
+        snapshot = await bron_service.get_locations_snapshot()
     except Exception as e:
         logger.error(f"Error fetching locations: {e}")
         raise HTTPException(status_code=500, detail="Error fetching locations")
+    
+    etag = make_etag(snapshot.version)
+    headers = {
+        "ETag": etag,
+        "Cache-Control": IMMUTABLE_CACHE_CONTROL if version == snapshot.version else f"public, max-age={settings.LOCATIONS_HTTP_MAX_AGE}"
+    }
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    # Serialized once per refresh, instead of on every request
+    return Response(content=snapshot.body, media_type="application/json", headers=headers)
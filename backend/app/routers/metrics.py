@@ -0,0 +1,25 @@
+from fastapi import APIRouter, Header
+import logging
+from typing import Optional
+from ..config import settings
+from .. import metrics
+from .admin import verify_admin_token
+
+router = APIRouter()
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+ENVIRONMENT = settings.ENVIRONMENT
+
+base_api_url = "/"
+if ENVIRONMENT == "development":
+    base_api_url = "/api/"
+
+
+@router.get(base_api_url + "metrics")
+async def get_metrics(x_admin_token: Optional[str] = Header(None)):
+    """Return the metrics of the worker that handles this request"""
+    verify_admin_token(x_admin_token)
+    return metrics.snapshot()
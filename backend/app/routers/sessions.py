@@ -1,4 +1,6 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Header, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
 from sqlalchemy.orm import Session as SQLAlchemySession
 from ..schemas import SessionCreate, MessageType, MessageRole
 from ..services.session_service import SessionService
@@ -6,10 +8,14 @@ from ..database import get_db
 from ..services.qdrant_service import QdrantService
 import logging
 from datetime import datetime
+from typing import Dict, Optional
 from ..config import settings
-from ..services.cohere_service import CohereService
-from ..services.litellm_service import LiteLLMService
-from ..services.bron_service import BronService
+from ..services.llm_registry import get_llm_service
+from ..services.bron_service import BronService, LocationsSnapshot
+from ..services.payload_cache import ChunkPayloadCache
+from ..services.session_cache import SessionCache
+from ..http_cache import etag_matches, make_etag
+from ..concurrency import run_blocking
 
 router = APIRouter()
 
@@ -23,28 +29,45 @@ if ENVIRONMENT == "development":
     base_api_url = "/api/"
 
 @router.get(base_api_url + "sessions/{session_id}")
-async def get_session(session_id: str, db: SQLAlchemySession = Depends(get_db)):
+async def get_session(session_id: str, if_none_match: Optional[str] = Header(None), db: SQLAlchemySession = Depends(get_db)):
     logger.debug(f"Getting session with id: {session_id}")
-    session_service = SessionService(db)
-
-    llm_service = None
-    # Use the configured LLM service
-    if settings.LLM_SERVICE.lower() == "litellm":
-        llm_service = LiteLLMService()
-    else:
-        llm_service = CohereService()
-        
-    qdrant_service = QdrantService(llm_service)
+    session_cache = SessionCache.get_instance()
     bron_service = BronService()
+    locations_snapshot = await bron_service.get_locations_snapshot()
+    
+    # The response depends on the session, the locations and the chunk payloads
+    session_version = await run_blocking(session_cache.get_version, session_id)
+    payload_generation = await run_blocking(ChunkPayloadCache.get_instance().generation.get)
+    if session_version is None or payload_generation is None:
+        return await render_session(session_id, db, locations_snapshot)
+    
+    etag = make_etag(session_cache.get_etag(session_id, session_version, locations_snapshot.version, payload_generation))
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(if_none_match, etag):
+        session_cache.record_not_modified(etag)
+        return Response(status_code=304, headers=headers)
     
-    session = session_service.get_session_with_relations(session_id)    
+    body = await run_blocking(session_cache.get, etag)
+    if body is not None:
+        session_cache.record_reused(body)
+    else:
+        body = JSONResponse(content=jsonable_encoder(await render_session(session_id, db, locations_snapshot))).body
+        await run_blocking(session_cache.set, etag, body)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+async def render_session(session_id: str, db: SQLAlchemySession, locations_snapshot: LocationsSnapshot) -> Dict:
+    session_service = SessionService(db)
+    qdrant_service = QdrantService(get_llm_service())
+    
+    session = await run_blocking(session_service.get_session_with_relations, session_id)    
     documents = []
     for message in session.messages:
         documents.extend(message.documents)
         
     logger.debug(f"Found {len(documents)} documents in MySQL for session {session_id}")
     
-    qdrant_documents = qdrant_service.get_documents_by_ids(documents)    
+    qdrant_documents = await qdrant_service.get_documents_by_ids_async(documents)    
     logger.info(f"Found {len(qdrant_documents)} documents in Qdrant for session {session_id}")
         
     # Remove system messages from the session
@@ -59,14 +82,21 @@ async def get_session(session_id: str, db: SQLAlchemySession = Depends(get_db)):
             
         messages.append(message)
                    
-    locations = await bron_service.get_locations()
+    # Only the locations the session filtered on, the full list is served by /locations
+    location_ids = {
+        location.id
+        for message in session.messages if message.search_filters
+        for location in message.search_filters.locations or []
+    }
+    locations = [locations_snapshot.by_id[location_id] for location_id in sorted(location_ids) if location_id in locations_snapshot.by_id]
             
     response = {
         "id": session.id,
         "name": session.name,
         "messages": messages,
         "documents": qdrant_documents,
-        "locations": locations
+        "locations": locations,
+        "locations_version": locations_snapshot.version
     }
     
     return response
@@ -122,6 +122,7 @@ class SearchFilter(BaseModel):
     locations: Optional[List[Location]] = []
     date_range: Optional[List[datetime]] = []
     rewrite_query: bool = True
+    group_by_document: bool = False
     
     @field_serializer('date_range')
     def serialize_dt(self, date_range: List[datetime], _info):  
@@ -0,0 +1,153 @@
+import argparse
+import json
+from collections import defaultdict
+from typing import Dict, List
+import numpy as np
+from app.config import settings
+from app.database import SessionLocal
+from app.models import Message
+from app.schemas import MessageRole
+from app.cache import normalize_text
+from app.services.cohere_service import CohereService
+from app.services.semantic_cache import normalize_vector
+
+
+def load_logged_queries(limit: int) -> List[Dict]:
+    """
+    Load the most recent rewritten user queries with their search filters and the
+    chunk ids of the documents that were retrieved for them (stored on the
+    assistant message that follows the user message).
+    """
+    db = SessionLocal()
+    try:
+        user_messages = db.query(Message)\
+            .filter(Message.role == MessageRole.USER.value)\
+            .filter(Message.rewritten_query_for_vector_base.isnot(None))\
+            .order_by(Message.created_at.desc())\
+            .limit(limit)\
+            .all()
+        session_ids = {message.session_id for message in user_messages}
+        assistant_messages = db.query(Message)\
+            .filter(Message.session_id.in_(session_ids))\
+            .filter(Message.role == MessageRole.ASSISTANT.value)\
+            .order_by(Message.sequence)\
+            .all()
+
+        answers = defaultdict(list)
+        for message in assistant_messages:
+            answers[message.session_id].append(message)
+
+        logged_queries = []
+        for message in user_messages:
+            answer = next((a for a in answers[message.session_id] if a.sequence > message.sequence), None)
+            if answer is None or not answer.documents:
+                continue
+            logged_queries.append({
+                "query": message.rewritten_query_for_vector_base,
+                "filters": get_filter_key(message.search_filters),
+                "chunk_ids": {document.chunk_id for document in answer.documents}
+            })
+        return logged_queries
+    finally:
+        db.close()
+
+
+def get_filter_key(search_filters: Dict) -> str:
+    search_filters = search_filters or {}
+    locations = sorted(str(location.get("id")) for location in search_filters.get("locations") or [])
+    return json.dumps([locations, search_filters.get("date_range") or []])
+
+
+def score_pairs(logged_queries: List[Dict]) -> List[tuple]:
+    """Return (cosine similarity, chunk overlap) for every pair of distinct queries with the same filters"""
+    llm_service = CohereService()
+    groups = defaultdict(dict)
+    for logged_query in logged_queries:
+        # Keep one logged retrieval per distinct query and filter combination
+        groups[logged_query["filters"]].setdefault(normalize_text(logged_query["query"]), logged_query)
+
+    pairs = []
+    for group in groups.values():
+        if len(group) < 2:
+            continue
+        entries = list(group.values())
+        vectors = [normalize_vector(llm_service.generate_dense_embedding(entry["query"])) for entry in entries]
+        kept = [(entry, vector) for entry, vector in zip(entries, vectors) if vector is not None]
+        if len(kept) < 2:
+            continue
+        matrix = np.stack([vector for _, vector in kept])
+        similarities = matrix @ matrix.T
+        for i in range(len(kept)):
+            for j in range(i + 1, len(kept)):
+                chunks_i, chunks_j = kept[i][0]["chunk_ids"], kept[j][0]["chunk_ids"]
+                overlap = len(chunks_i & chunks_j) / len(chunks_i | chunks_j)
+                pairs.append((float(similarities[i, j]), overlap))
+    return pairs
+
+
+def report(pairs: List[tuple], thresholds: List[float], min_overlap: float, target_precision: float):
+    print(f"Scored {len(pairs)} query pairs with the same filters")
+    print(f"A reuse counts as correct when the pair shares at least {min_overlap:.0%} of its documents (Jaccard)\n")
+    print(f"{'threshold':>10} {'reused':>8} {'precision':>10} {'mean overlap':>13}")
+
+    recommended = None
+    for threshold in sorted(thresholds):
+        reused = [overlap for similarity, overlap in pairs if similarity >= threshold]
+        if not reused:
+            print(f"{threshold:>10.3f} {0:>8} {'-':>10} {'-':>13}")
+            continue
+        precision = sum(overlap >= min_overlap for overlap in reused) / len(reused)
+        print(f"{threshold:>10.3f} {len(reused):>8} {precision:>10.2%} {np.mean(reused):>13.2f}")
+        if recommended is None and precision >= target_precision:
+            recommended = threshold
+
+    print(f"\nCurrent SEMANTIC_CACHE_SIMILARITY_THRESHOLD: {settings.SEMANTIC_CACHE_SIMILARITY_THRESHOLD}")
+    if recommended is not None:
+        print(f"Lowest threshold with at least {target_precision:.0%} precision: {recommended}")
+    else:
+        print(f"No threshold reaches {target_precision:.0%} precision, keep the semantic cache disabled or raise the thresholds")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Tune the semantic query cache threshold against logged queries. '
+                    'Pairs of logged queries with the same filters are compared on the cosine similarity of their '
+                    'dense embeddings and on the overlap of the documents that were retrieved for them.'
+    )
+
+    parser.add_argument(
+        '--limit',
+        '-l',
+        type=int,
+        default=2000,
+        help='Number of most recent logged user queries to load'
+    )
+    parser.add_argument(
+        '--thresholds',
+        '-t',
+        type=float,
+        nargs='+',
+        default=[0.85, 0.88, 0.9, 0.92, 0.94, 0.95, 0.96, 0.97, 0.98, 0.99],
+        help='Cosine similarity thresholds to evaluate'
+    )
+    parser.add_argument(
+        '--min-overlap',
+        type=float,
+        default=0.5,
+        help='Minimum Jaccard overlap of the retrieved documents for a reuse to count as correct'
+    )
+    parser.add_argument(
+        '--target-precision',
+        type=float,
+        default=0.9,
+        help='Fraction of reuses that has to be correct for a threshold to be recommended'
+    )
+
+    args = parser.parse_args()
+
+    logged_queries = load_logged_queries(args.limit)
+    print(f"Loaded {len(logged_queries)} logged queries with retrieved documents")
+    report(score_pairs(logged_queries), args.thresholds, args.min_overlap, args.target_precision)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+import asyncio
+import logging
+import math
+import time
+from collections import OrderedDict, deque
+from typing import Deque, Dict, Optional
+from ..config import settings
+from .. import metrics
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class AdmissionRejected(Exception):
+    """The chat pipeline is saturated, the client should retry after retry_after seconds"""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(f"Chat request rejected: {reason}")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionSlot:
+    """A claim on one in-flight chat pipeline, held until the stream ends"""
+
+    def __init__(self, controller: "AdmissionController", client_id: str):
+        self.controller = controller
+        self.client_id = client_id
+        self.admitted_at = time.perf_counter()
+        self._released = False
+
+    def release(self):
+        if self._released:
+            return
+        self._released = True
+        self.controller._release(self)
+
+
+class AdmissionController:
+    """
+    Per-worker admission control for /chat.
+
+    At most CHAT_MAX_IN_FLIGHT pipelines run at once, up to
+    CHAT_ADMISSION_QUEUE_SIZE requests wait for a slot and everything beyond
+    that is rejected right away, so a burst degrades into fast 503s instead of
+    every pipeline timing out on Qdrant, Cohere and MySQL together. With
+    CHAT_ADMISSION_PER_CLIENT_FAIRNESS the queue is served round-robin per
+    client IP, so one client cannot take every freed slot.
+    """
+    _instance = None
+
+    def __init__(
+        self,
+        max_in_flight: int = settings.CHAT_MAX_IN_FLIGHT,
+        max_queue: int = settings.CHAT_ADMISSION_QUEUE_SIZE,
+        queue_timeout: float = settings.CHAT_ADMISSION_QUEUE_TIMEOUT,
+        per_client_fairness: bool = settings.CHAT_ADMISSION_PER_CLIENT_FAIRNESS,
+        max_per_client: int = settings.CHAT_ADMISSION_MAX_PER_CLIENT
+    ):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.per_client_fairness = per_client_fairness
+        self.max_per_client = max_per_client
+        self._in_flight = 0
+        self._queued = 0
+        self._waiters: "OrderedDict[str, Deque[asyncio.Future]]" = OrderedDict()
+        self._per_client: Dict[str, int] = {}
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    async def admit(self, client_id: str) -> AdmissionSlot:
+        """Wait for a free pipeline slot, or raise AdmissionRejected"""
+        if self.max_per_client and self._per_client.get(client_id, 0) >= self.max_per_client:
+            self._reject("client_limit", client_id)
+
+        if self._in_flight < self.max_in_flight and self._queued == 0:
+            self._in_flight += 1
+            self._increment_client(client_id)
+            return self._grant(client_id, waited=0.0)
+
+        if self._queued >= self.max_queue:
+            self._reject("queue_full", client_id)
+
+        waiter = asyncio.get_running_loop().create_future()
+        queue_key = self._queue_key(client_id)
+        self._waiters.setdefault(queue_key, deque()).append(waiter)
+        self._queued += 1
+        self._increment_client(client_id)
+        self._update_gauges()
+
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(waiter, timeout=self.queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            self._queued -= 1
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just as the wait ended, pass it on
+                AdmissionSlot(self, client_id).release()
+            else:
+                self._remove_waiter(queue_key, waiter)
+                self._decrement_client(client_id)
+            self._update_gauges()
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            self._reject("timeout", client_id)
+
+        self._queued -= 1
+        return self._grant(client_id, waited=time.perf_counter() - start)
+
+    def get_stats(self) -> Dict:
+        return {
+            "in_flight": self._in_flight,
+            "queue_depth": self._queued,
+            "max_in_flight": self.max_in_flight,
+            "max_queue": self.max_queue,
+        }
+
+    def _grant(self, client_id: str, waited: float) -> AdmissionSlot:
+        metrics.increment("chat.admission.admitted")
+        metrics.observe("chat.admission.wait_seconds", waited)
+        self._update_gauges()
+        return AdmissionSlot(self, client_id)
+
+    def _release(self, slot: AdmissionSlot):
+        self._decrement_client(slot.client_id)
+        metrics.observe("chat.admission.slot_seconds", time.perf_counter() - slot.admitted_at)
+
+        # Hand the slot straight to the next waiter, so in_flight never dips below the queue
+        waiter = self._next_waiter()
+        if waiter is not None:
+            waiter.set_result(None)
+        else:
+            self._in_flight -= 1
+        self._update_gauges()
+
+    def _next_waiter(self) -> Optional[asyncio.Future]:
+        while self._waiters:
+            queue_key, waiters = next(iter(self._waiters.items()))
+            waiter = waiters.popleft()
+            if waiters:
+                # Round-robin: this client goes to the back of the line
+                self._waiters.move_to_end(queue_key)
+            else:
+                del self._waiters[queue_key]
+            if not waiter.done():
+                return waiter
+        return None
+
+    def _queue_key(self, client_id: str) -> str:
+        return client_id if self.per_client_fairness else ""
+
+    def _remove_waiter(self, queue_key: str, waiter: asyncio.Future):
+        waiters = self._waiters.get(queue_key)
+        if waiters is None or waiter not in waiters:
+            return
+        waiters.remove(waiter)
+        if not waiters:
+            del self._waiters[queue_key]
+
+    def _increment_client(self, client_id: str):
+        self._per_client[client_id] = self._per_client.get(client_id, 0) + 1
+
+    def _decrement_client(self, client_id: str):
+        count = self._per_client.get(client_id, 0) - 1
+        if count > 0:
+            self._per_client[client_id] = count
+        else:
+            self._per_client.pop(client_id, None)
+
+    def _reject(self, reason: str, client_id: str):
+        retry_after = self._retry_after()
+        logger.warning(f"Rejecting chat request from {client_id} ({reason}), retry after {retry_after}s")
+        metrics.increment("chat.admission.rejected")
+        metrics.increment(f"chat.admission.rejected.{reason}")
+        raise AdmissionRejected(reason, retry_after)
+
+    def _retry_after(self) -> int:
+        """Roughly how long it takes until the current queue has drained"""
+        drain_seconds = metrics.average("chat.admission.slot_seconds") * (self._queued + 1) / max(self.max_in_flight, 1)
+        return max(settings.CHAT_ADMISSION_RETRY_AFTER, math.ceil(drain_seconds))
+
+    def _update_gauges(self):
+        metrics.set_gauge("chat.admission.in_flight", self._in_flight)
+        metrics.set_gauge("chat.admission.queue_depth", self._queued)
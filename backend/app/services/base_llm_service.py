@@ -1,6 +1,7 @@
 from abc import ABC, abstractmethod
-from typing import List, Dict, Generator
+from typing import List, Dict, Generator, AsyncIterator
 from ..text_utils import get_formatted_current_date_english
+from ..concurrency import run_blocking, iterate_blocking
 from ..schemas import ChatMessage, MessageRole, MessageType, SearchFilter
 
 HUMAN_READABLE_SOURCES = {
@@ -173,6 +174,28 @@ Rewritten query: "klimaatbeleid Almere"
     def rewrite_query_with_history_for_vector_base(self, message: ChatMessage, messages: list[ChatMessage]) -> str:
         pass
 
+    # Async variants. By default they run the sync implementation on the bounded
+    # executor, services with a native async client override them.
+    
+    async def chat_stream_async(self, messages: list[ChatMessage], documents: list) -> AsyncIterator:
+        chat_stream = await run_blocking(self.chat_stream, messages, documents)
+        return iterate_blocking(chat_stream)
+    
+    async def rerank_documents_async(self, query: str, documents: list, top_n: int = 20, return_documents: bool = True) -> Dict:
+        return await run_blocking(self.rerank_documents, query, documents, top_n=top_n, return_documents=return_documents)
+    
+    async def generate_dense_embedding_async(self, query: str) -> List[float]:
+        return await run_blocking(self.generate_dense_embedding, query)
+    
+    async def create_chat_session_name_async(self, user_message: ChatMessage) -> str:
+        return await run_blocking(self.create_chat_session_name, user_message)
+    
+    async def rewrite_query_for_vector_base_async(self, message: ChatMessage) -> str:
+        return await run_blocking(self.rewrite_query_for_vector_base, message)
+    
+    async def rewrite_query_with_history_for_vector_base_async(self, message: ChatMessage, messages: list[ChatMessage]) -> str:
+        return await run_blocking(self.rewrite_query_with_history_for_vector_base, message, messages)
+
     @staticmethod
     def get_human_readable_source(source: str) -> str: 
         return HUMAN_READABLE_SOURCES.get(source, source)
@@ -1,33 +1,170 @@
+import asyncio
+import hashlib
+import json
+import os
+import random
 import time
-from typing import List
+from typing import Dict, List, NamedTuple, Optional
 import logging
 from ..config import settings
 import httpx
 from fastapi import HTTPException
 from ..schemas import Location
+from .. import metrics
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Cache variables
-locations_cache = None
-locations_cache_time = 0
-CACHE_EXPIRATION = 86400  # 24 hours in seconds
+LOCATIONS_URL = 'https://api.bron.live/locations/search?includes=id,name,kind&limit=999'
+
+
+class LocationsSnapshot(NamedTuple):
+    """
+    The locations of one refresh, with the id lookup, the serialized JSON
+    response and its content hash (the version) built once
+    """
+    locations: List[Location]
+    by_id: Dict[str, Location]
+    body: bytes
+    version: str
+    fetched_at: float
+
+    @classmethod
+    def create(cls, locations: List[Location], fetched_at: float) -> "LocationsSnapshot":
+        body = json.dumps([location.model_dump() for location in locations], ensure_ascii=False).encode("utf-8")
+        version = hashlib.sha256(body).hexdigest()[:16]
+        return cls(locations, {location.id: location for location in locations}, body, version, fetched_at)
+
+    @property
+    def age(self) -> float:
+        return time.time() - self.fetched_at
+
+
+class LocationsStore:
+    """
+    Stale-while-revalidate store for the Bron locations, one per worker.
+
+    Once loaded, the locations are always served from memory. When they are
+    older than LOCATIONS_CACHE_TTL a single background refresh is started,
+    and requests keep getting the stale list until it lands. Only a worker
+    without any locations waits for the external API, and concurrent
+    requests then share one fetch. Every refresh is written to
+    LOCATIONS_SNAPSHOT_PATH, so workers start warm from disk and pick up a
+    refresh made by another worker instead of fetching it again.
+    """
+    _instance = None
 
-class BronService:    
     def __init__(self):
-        pass
-    
+        self._snapshot: Optional[LocationsSnapshot] = None
+        self._refresh_task: Optional[asyncio.Task] = None
+        self._refresh_loop: Optional[asyncio.Task] = None
+        self._last_attempt = 0.0
+        self._http_client: Optional[httpx.AsyncClient] = None
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    def start(self):
+        """Load the disk snapshot and start the periodic refresh on the running event loop"""
+        if self._refresh_loop is not None:
+            return
+        if self._snapshot is None:
+            self._snapshot = self._load_snapshot()
+        self._refresh_loop = asyncio.ensure_future(self._run_refresh_loop())
+
+    async def stop(self):
+        if self._refresh_loop is not None:
+            self._refresh_loop.cancel()
+            await asyncio.gather(self._refresh_loop, return_exceptions=True)
+            self._refresh_loop = None
+        if self._http_client is not None:
+            await self._http_client.aclose()
+            self._http_client = None
+
+    async def get_snapshot(self) -> LocationsSnapshot:
+        snapshot = self._snapshot
+        if snapshot is None:
+            snapshot = self._snapshot = self._load_snapshot()
+        if snapshot is None:
+            # Nothing to serve yet, so this request has to wait for the (shared) fetch
+            metrics.increment("locations.cold_waits")
+            return await asyncio.shield(self._start_refresh())
+        if snapshot.age >= settings.LOCATIONS_CACHE_TTL:
+            self._refresh_in_background()
+        return snapshot
+
+    def _refresh_in_background(self):
+        # Don't hammer the external API while it is failing
+        if self._refresh_task is None and time.time() - self._last_attempt >= settings.LOCATIONS_REFRESH_RETRY_INTERVAL:
+            metrics.increment("locations.background_refreshes")
+            self._start_refresh()
+
+    def _start_refresh(self) -> asyncio.Task:
+        if self._refresh_task is None:
+            self._last_attempt = time.time()
+            self._refresh_task = asyncio.ensure_future(self._refresh())
+            self._refresh_task.add_done_callback(self._refresh_done)
+        return self._refresh_task
+
+    def _refresh_done(self, task: asyncio.Task):
+        self._refresh_task = None
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Error refreshing locations: {task.exception()}")
+            metrics.increment("locations.refresh_errors")
+
+    async def _run_refresh_loop(self):
+        while True:
+            snapshot = self._snapshot
+            if snapshot is None or snapshot.age >= settings.LOCATIONS_CACHE_TTL:
+                try:
+                    await asyncio.shield(self._start_refresh())
+                except asyncio.CancelledError:
+                    raise
+                except Exception:
+                    pass  # Logged by _refresh_done, retried after the interval
+                await asyncio.sleep(settings.LOCATIONS_REFRESH_RETRY_INTERVAL)
+            else:
+                # Jitter, so the first worker to wake up refreshes and the others find its snapshot on disk
+                jitter = random.uniform(0, settings.LOCATIONS_REFRESH_RETRY_INTERVAL)
+                await asyncio.sleep(settings.LOCATIONS_CACHE_TTL - snapshot.age + jitter)
+
+    async def _refresh(self) -> LocationsSnapshot:
+        # Another worker may have refreshed already
+        snapshot = self._load_snapshot()
+        if snapshot is not None and snapshot.age < settings.LOCATIONS_CACHE_TTL and (
+            self._snapshot is None or snapshot.fetched_at > self._snapshot.fetched_at
+        ):
+            logger.info("Using locations refreshed by another worker")
+            self._snapshot = snapshot
+            return snapshot
+
+        start = time.perf_counter()
+        response = await self._fetch_locations_data()
+        hits = response.json().get('hits', {}).get('hits', [])
+        snapshot = LocationsSnapshot.create(parse_locations(hits), time.time())
+        metrics.observe("locations.refresh_seconds", time.perf_counter() - start)
+        logger.info(f"Refreshed {len(snapshot.locations)} locations")
+
+        self._snapshot = snapshot
+        self._save_snapshot(snapshot)
+        return snapshot
+
+    def _get_http_client(self) -> httpx.AsyncClient:
+        if self._http_client is None:
+            self._http_client = httpx.AsyncClient(timeout=httpx.Timeout(settings.LOCATIONS_FETCH_TIMEOUT))
+        return self._http_client
+
     async def _fetch_locations_data(self):
         """Fetch locations data from the external API"""
-        locations_url = 'https://api.bron.live/locations/search?includes=id,name,kind&limit=999'
         response = None
-        
+
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(locations_url)
-                response.raise_for_status()  # Raise an error for bad responses
-        
+            response = await self._get_http_client().get(LOCATIONS_URL)
+            response.raise_for_status()  # Raise an error for bad responses
+
         except httpx.HTTPStatusError as http_error:
             logger.error('HTTP error occurred: %s', http_error)
             raise HTTPException(
@@ -40,76 +177,107 @@ class BronService:
                 status_code=500,
                 detail="Error occurred while making the request to the external API."
             )
-            
+
         return response
 
+    @staticmethod
+    def _load_snapshot() -> Optional[LocationsSnapshot]:
+        path = settings.LOCATIONS_SNAPSHOT_PATH
+        if not path or not os.path.exists(path):
+            return None
+        try:
+            with open(path, encoding="utf-8") as snapshot_file:
+                data = json.load(snapshot_file)
+            return LocationsSnapshot.create(
+                [Location(**location) for location in data["locations"]],
+                data["fetched_at"]
+            )
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable locations snapshot {path}: {e}")
+            return None
+
+    @staticmethod
+    def _save_snapshot(snapshot: LocationsSnapshot):
+        path = settings.LOCATIONS_SNAPSHOT_PATH
+        if not path:
+            return
+        data = {
+            "fetched_at": snapshot.fetched_at,
+            "locations": [location.model_dump() for location in snapshot.locations]
+        }
+        try:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            # Write to a temporary file first, so other workers never read a partial snapshot
+            temporary_path = f"{path}.{os.getpid()}.tmp"
+            with open(temporary_path, "w", encoding="utf-8") as snapshot_file:
+                json.dump(data, snapshot_file)
+            os.replace(temporary_path, path)
+        except OSError as e:
+            logger.warning(f"Error writing locations snapshot {path}: {e}")
+
+
+def parse_locations(hits: List[Dict]) -> List[Location]:
+    """Transform the search hits of the locations API into locations"""
+    locations = []
+    for hit in hits:
+        source = hit.get('_source', {})
+
+        # Check if 'id' key exists in the source
+        if 'id' not in source:
+            logger.warning('Missing expected key "id" in source: %s', source)
+            continue  # Skip this item if 'id' is missing
+
+        # Skip items where id contains 'type:' or '*'
+        if 'type:' in source['id'] or '*' in source['id']:
+            continue
+
+        # Use get to safely access 'kind'
+        kind = source.get('kind', 'ministry')  # Default to 'ministry' if 'kind' is not present
+
+        # Map the kind to the desired format
+        if kind == 'municipality':
+            kind_label = 'Gemeente'
+        elif kind == 'province':
+            kind_label = 'Provincie'
+        elif kind == 'ministry':
+            kind_label = 'Ministerie'
+        else:
+            kind_label = 'Ministerie'
+
+        if source.get('name', '') == '':
+            continue
+
+        locations.append(
+            Location(
+                id=source['id'],
+                name=source.get('name', ''),  # Default to 'Unnamed' if 'name' is not present
+                type=kind_label
+            )
+        )
+    return locations
+
+
+class BronService:
+    def __init__(self):
+        self.store = LocationsStore.get_instance()
+
     async def get_locations(self) -> List[Location]:
         """Return a list of available locations"""
-        global locations_cache, locations_cache_time
-
-        # Check if cache is still valid
-        if locations_cache is not None and (time.time() - locations_cache_time) < CACHE_EXPIRATION:
-            return locations_cache
-                
-        locations_response = await self._fetch_locations_data()  # Call the new function
-                    
-        hits = locations_response.json().get('hits', {}).get('hits', [])
-
-        # Transform the data into the desired format
-        locations = []
-        for hit in hits:
-            source = hit.get('_source', {})
-            
-            # Check if 'id' key exists in the source
-            if 'id' not in source:
-                logger.warning('Missing expected key "id" in source: %s', source)
-                continue  # Skip this item if 'id' is missing
-
-            # Skip items where id contains 'type:' or '*'
-            if 'type:' in source['id'] or '*' in source['id']:
-                continue
-
-            # Use get to safely access 'kind'
-            kind = source.get('kind', 'ministry')  # Default to 'ministry' if 'kind' is not present
-
-            # Map the kind to the desired format
-            if kind == 'municipality':
-                kind_label = 'Gemeente'
-            elif kind == 'province':
-                kind_label = 'Provincie'
-            elif kind == 'ministry':
-                kind_label = 'Ministerie'
-            else:
-                kind_label = 'Ministerie'
-            
-            if source.get('name', '') == '':
-                continue
-            
-            locations.append(
-                Location(
-                    id=source['id'],
-                    name=source.get('name', ''),  # Default to 'Unnamed' if 'name' is not present
-                    type=kind_label
-                )
-            )
+        return (await self.store.get_snapshot()).locations
+
+    async def get_locations_snapshot(self) -> LocationsSnapshot:
+        """Return the available locations with their serialized form and version"""
+        return await self.store.get_snapshot()
 
-        # Update cache with the original response
-        locations_cache = locations  # Cache the original response
-        locations_cache_time = time.time()
-        
-        return locations_cache
-    
     async def get_locations_by_ids(self, location_ids: List[str]) -> List[Location]:
-        # Use cache if available, otherwise fetch data
         if location_ids is None or len(location_ids) == 0:
             return []
-        
-        locations = await self.get_locations()
-        
-        # Create a lookup dictionary for faster access
-        location_map = {location.id: location for location in locations}
-        
+
+        location_map = (await self.store.get_snapshot()).by_id
+
         # Get Location objects using dictionary lookup
         filtered_locations = [location_map[loc_id] for loc_id in location_ids if loc_id in location_map]
-        
+
         return filtered_locations
@@ -0,0 +1,133 @@
+import asyncio
+import logging
+import time
+from typing import AsyncIterable, AsyncIterator, Awaitable, Optional
+from starlette.requests import Request
+from .. import metrics
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class ClientDisconnected(Exception):
+    """The client closed the connection while the chat turn was in progress"""
+
+
+class StreamIdleTimeout(Exception):
+    """The LLM stream stopped producing deltas"""
+
+
+class ChatTurnGuard:
+    """
+    Ties the upstream work of a chat turn to the client connection.
+
+    Stages awaited through run() are cancelled as soon as the client
+    disconnects, which aborts the in-flight Cohere or Qdrant call instead of
+    letting it finish for nobody. iterate() additionally ends an LLM stream
+    that stops producing deltas.
+    """
+
+    STAGES = ("rewrite", "retrieval", "generation")
+
+    def __init__(self, request: Optional[Request] = None):
+        self.request = request
+        self.stage: Optional[str] = None
+        self._stage_started_at: Optional[float] = None
+        self._watcher: Optional[asyncio.Future] = None
+        self._abandoned = False
+
+    def start(self):
+        """Start listening for a client disconnect on the running event loop"""
+        if self.request is not None and self._watcher is None:
+            self._watcher = asyncio.ensure_future(self._watch())
+
+    async def _watch(self):
+        # The request body has been read, so the next ASGI message is the disconnect
+        while True:
+            message = await self.request.receive()
+            if message["type"] == "http.disconnect":
+                return
+
+    def enter_stage(self, stage: Optional[str]):
+        """Mark the start of a pipeline stage, recording how long the previous one took"""
+        now = time.perf_counter()
+        if self.stage is not None and not self._abandoned:
+            metrics.observe(f"chat.stage.{self.stage}_seconds", now - self._stage_started_at)
+        self.stage = stage
+        self._stage_started_at = now
+
+    def finish(self):
+        self.enter_stage(None)
+        if self._watcher is not None:
+            self._watcher.cancel()
+            self._watcher = None
+
+    async def run(self, awaitable: Awaitable):
+        """Await a stage, cancelling it and raising ClientDisconnected when the client goes away"""
+        task = asyncio.ensure_future(awaitable)
+        if self._watcher is None:
+            return await task
+
+        try:
+            if not self._watcher.done():
+                await asyncio.wait({task, self._watcher}, return_when=asyncio.FIRST_COMPLETED)
+        except asyncio.CancelledError:
+            task.cancel()
+            raise
+
+        if task.done():
+            return task.result()
+
+        task.cancel()
+        await asyncio.wait({task})
+        raise ClientDisconnected(f"Client disconnected during {self.stage or 'the chat turn'}")
+
+    async def iterate(self, iterable: AsyncIterable, idle_timeout: Optional[float] = None) -> AsyncIterator:
+        """Iterate a stream through run(), ending it when no item arrives within idle_timeout seconds"""
+        iterator = iterable.__aiter__()
+        try:
+            while True:
+                try:
+                    item = await self.run(asyncio.wait_for(iterator.__anext__(), timeout=idle_timeout))
+                except StopAsyncIteration:
+                    return
+                except asyncio.TimeoutError:
+                    metrics.increment("chat.stream.idle_timeouts")
+                    raise StreamIdleTimeout(f"No stream delta received for {idle_timeout}s")
+                yield item
+        finally:
+            aclose = getattr(iterator, "aclose", None)
+            if aclose is not None:
+                try:
+                    await aclose()
+                except Exception as e:
+                    logger.debug(f"Error closing stream: {e}")
+
+    def record_abandoned(self):
+        """Count a turn the client walked away from, with an estimate of the upstream time it saved"""
+        if self._abandoned:
+            return
+        self._abandoned = True
+
+        stage = self.stage or "unknown"
+        saved_seconds = self._estimate_saved_seconds()
+        metrics.increment("chat.abandoned_streams")
+        metrics.increment(f"chat.abandoned_streams.{stage}")
+        metrics.increment("chat.abandoned_streams.saved_seconds", saved_seconds)
+        logger.info(f"Client abandoned the chat turn during {stage}, saving an estimated {saved_seconds:.2f}s of upstream work")
+
+    def _estimate_saved_seconds(self) -> float:
+        """
+        The remainder of the current stage plus every later stage, based on the
+        average stage durations of completed turns in this worker
+        """
+        if self.stage not in self.STAGES:
+            return 0.0
+
+        index = self.STAGES.index(self.stage)
+        elapsed = time.perf_counter() - self._stage_started_at
+        saved = max(metrics.average(f"chat.stage.{self.stage}_seconds") - elapsed, 0.0)
+        for stage in self.STAGES[index + 1:]:
+            saved += metrics.average(f"chat.stage.{stage}_seconds")
+        return saved
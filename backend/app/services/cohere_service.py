@@ -1,18 +1,126 @@
 from ..config import settings
-from cohere import ClientV2 as CohereClient
+from cohere import ClientV2 as CohereClient, AsyncClientV2 as AsyncCohereClient
+import httpx
 import logging
+import threading
+import unicodedata
 from ..schemas import ChatMessage, MessageRole, MessageType
 from .base_llm_service import BaseLLMService
-from typing import Generator
+from .embedding_cache import DenseEmbeddingCache
+from .query_rewrite_cache import QueryRewriteCache
+from typing import AsyncIterator, Awaitable, Callable, Dict, Generator, List, Tuple
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
 class CohereService(BaseLLMService):    
+    CHAT_MODEL = "command-r-08-2024"
+    QUERY_REWRITE_MODEL = "command-r"
+    MAX_RETRIES = 3
+    
+    # Cohere clients are shared by every CohereService in the process, so their
+    # keep-alive connection pools survive across requests
+    _client = None
+    _async_client = None
+    _http_client = None
+    _async_http_client = None
+    _client_lock = threading.Lock()
+    
     def __init__(self):
-        self.client = CohereClient(api_key=settings.COHERE_API_KEY)
+        self.client = self.get_client()
+        self.async_client = self.get_async_client()
+        self.embedding_cache = DenseEmbeddingCache.get_instance()
+        self.rewrite_cache = QueryRewriteCache.get_instance()
+        
+    @staticmethod
+    def _http_client_options() -> Dict:
+        return {
+            "http2": HTTP2_AVAILABLE,
+            "timeout": httpx.Timeout(settings.COHERE_TIMEOUT),
+            "limits": httpx.Limits(
+                max_connections=settings.COHERE_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.COHERE_MAX_CONNECTIONS,
+                keepalive_expiry=settings.COHERE_KEEPALIVE_EXPIRY
+            ),
+        }
+        
+    @classmethod
+    def get_client(cls) -> CohereClient:
+        if cls._client is None:
+            with cls._client_lock:
+                if cls._client is None:
+                    logger.info(f"Creating shared Cohere client (HTTP/2: {HTTP2_AVAILABLE})")
+                    cls._http_client = httpx.Client(**cls._http_client_options())
+                    cls._client = CohereClient(
+                        api_key=settings.COHERE_API_KEY,
+                        timeout=settings.COHERE_TIMEOUT,
+                        httpx_client=cls._http_client
+                    )
+        return cls._client
+    
+    @classmethod
+    def get_async_client(cls) -> AsyncCohereClient:
+        if cls._async_client is None:
+            with cls._client_lock:
+                if cls._async_client is None:
+                    logger.info(f"Creating shared async Cohere client (HTTP/2: {HTTP2_AVAILABLE})")
+                    cls._async_http_client = httpx.AsyncClient(**cls._http_client_options())
+                    cls._async_client = AsyncCohereClient(
+                        api_key=settings.COHERE_API_KEY,
+                        timeout=settings.COHERE_TIMEOUT,
+                        httpx_client=cls._async_http_client
+                    )
+        return cls._async_client
+    
+    @classmethod
+    async def close_clients(cls):
+        with cls._client_lock:
+            http_client, cls._http_client, cls._client = cls._http_client, None, None
+            async_http_client, cls._async_http_client, cls._async_client = cls._async_http_client, None, None
+        if http_client is not None:
+            http_client.close()
+        if async_http_client is not None:
+            await async_http_client.aclose()
+    
+    def _with_retries(self, description: str, call: Callable):
+        for attempt in range(self.MAX_RETRIES):
+            try:
+                return call()
+            except Exception as e:
+                logger.error(f"Error {description} (attempt {attempt + 1}): {e}")
+                if attempt < self.MAX_RETRIES - 1:
+                    logger.info("Retrying...")
+                else:
+                    logger.error("Max retries reached. Raising exception.")
+                    raise
+                
+    async def _with_retries_async(self, description: str, call: Callable[[], Awaitable]):
+        for attempt in range(self.MAX_RETRIES):
+            try:
+                return await call()
+            except Exception as e:
+                logger.error(f"Error {description} (attempt {attempt + 1}): {e}")
+                if attempt < self.MAX_RETRIES - 1:
+                    logger.info("Retrying...")
+                else:
+                    logger.error("Max retries reached. Raising exception.")
+                    raise
         
     def chat_stream(self, messages: list[ChatMessage], documents: list) -> Generator:
+        request = self._chat_stream_request(messages, documents)
+        return self._with_retries("in chat stream", lambda: self.client.chat_stream(**request))
+    
+    async def chat_stream_async(self, messages: list[ChatMessage], documents: list) -> AsyncIterator:
+        request = self._chat_stream_request(messages, documents)
+        return self._with_retries("in chat stream", lambda: self.async_client.chat_stream(**request))
+        
+    def _chat_stream_request(self, messages: list[ChatMessage], documents: list) -> Dict:
         logger.info(f"Starting chat stream with {len(messages)} messages and {len(documents)} documents...")
         
         # Filter out status messages and validate message content
@@ -31,127 +139,110 @@ class CohereService(BaseLLMService):
         
         logger.info(f"Filtered to {len(system_and_user_messages)} valid non-status messages")
         
-        max_retries = 3
-        for attempt in range(max_retries):
-            try:
-                return self.client.chat_stream(
-                    model="command-r-08-2024",
-                    messages=system_and_user_messages,
-                    documents=documents
-                )                
-            except Exception as e:
-                logger.error(f"Error in chat stream (attempt {attempt + 1}): {e}")
-                if attempt < max_retries - 1:
-                    logger.info("Retrying...")
-                else:
-                    logger.error("Max retries reached. Raising exception.")
-                    raise
-
+        return {
+            "model": self.CHAT_MODEL,
+            "messages": system_and_user_messages,
+            "documents": documents
+        }
         
     def rerank_documents(self, query: str, documents: list, top_n: int = 20, return_documents: bool = True):
+        request = self._rerank_request(query, documents, top_n, return_documents)
+        return self._with_retries("reranking documents", lambda: self.client.rerank(**request))
+    
+    async def rerank_documents_async(self, query: str, documents: list, top_n: int = 20, return_documents: bool = True):
+        request = self._rerank_request(query, documents, top_n, return_documents)
+        return await self._with_retries_async("reranking documents", lambda: self.async_client.rerank(**request))
+    
+    def _rerank_request(self, query: str, documents: list, top_n: int, return_documents: bool) -> Dict:
         logger.info(f"Reranking {len(documents)} documents, and returning {top_n} documents...")
         
-        max_retries = 3
-        for attempt in range(max_retries):
-            try:
-                return self.client.rerank(
-                    query=query,
-                    documents=documents,
-                    top_n=top_n,
-                    model=settings.COHERE_RERANK_MODEL,
-                    return_documents=return_documents
-                )
-            except Exception as e:
-                logger.error(f"Error reranking documents (attempt {attempt + 1}): {e}")
-                if attempt < max_retries - 1:
-                    logger.info("Retrying...")
-                else:
-                    logger.error("Max retries reached. Raising exception.")
-                    raise
+        return {
+            "query": query,
+            "documents": documents,
+            "top_n": top_n,
+            "model": settings.COHERE_RERANK_MODEL,
+            "return_documents": return_documents
+        }
                 
     def generate_dense_embedding(self, query: str):
+        return self.embedding_cache.get_or_compute(
+            query, 
+            settings.COHERE_EMBED_MODEL, 
+            settings.EMBEDDING_QUANTIZATION,
+            lambda: self._generate_dense_embedding(query)
+        )
+    
+    async def generate_dense_embedding_async(self, query: str):
+        return await self.embedding_cache.get_or_compute_async(
+            query, 
+            settings.COHERE_EMBED_MODEL, 
+            settings.EMBEDDING_QUANTIZATION,
+            lambda: self._generate_dense_embedding_async(query)
+        )
+    
+    def _generate_dense_embedding(self, query: str):
+        request, embedding_type = self._embed_request(query)
+        response = self._with_retries("generating dense embedding", lambda: self.client.embed(**request))
+        return self._parse_embedding(response, embedding_type)
+    
+    async def _generate_dense_embedding_async(self, query: str):
+        request, embedding_type = self._embed_request(query)
+        response = await self._with_retries_async("generating dense embedding", lambda: self.async_client.embed(**request))
+        return self._parse_embedding(response, embedding_type)
+    
+    def _embed_request(self, query: str) -> Tuple[Dict, str]:
         logger.info(f"Generating dense embedding for query: {query}")        
         
         # HACK TO FIX COHERE'S DIACRITIC ISSUES
         # Replace diacritics with base characters using unicode normalization
-        import unicodedata
         query = ''.join(c for c in unicodedata.normalize('NFKD', query)
                          if not unicodedata.combining(c))
         # END HACK
         
-        max_retries = 3
-        for attempt in range(max_retries):
-            try:
-                if settings.EMBEDDING_QUANTIZATION == "float":
-                    embeddings = self.client.embed(
-                        texts=[query], 
-                        input_type="search_query", 
-                        model=settings.COHERE_EMBED_MODEL,
-                        embedding_types=["float"]
-                    ).embeddings.float[0]
-                    
-                    logger.info("Generated dense embeddings")
-                    return embeddings
-                elif settings.EMBEDDING_QUANTIZATION == "uint8":
-                    embeddings = self.client.embed(
-                        texts=[query], 
-                        input_type="search_query", 
-                        model=settings.COHERE_EMBED_MODEL,
-                        embedding_types=["uint8"]
-                    ).embeddings.uint8[0]
-                    
-                    logger.info("Generated dense embeddings")
-                    return embeddings
-                else:
-                    embeddings = self.client.embed(
-                        texts=[query], 
-                        input_type="search_query", 
-                        model=settings.COHERE_EMBED_MODEL,
-                        embedding_types=["float"]
-                    ).embeddings.float[0]
-                    
-                    logger.info("Generated dense embeddings")
-                    return embeddings
-            except Exception as e:
-                logger.error(f"Error generating dense embedding (attempt {attempt + 1}): {e}")
-                if attempt < max_retries - 1:
-                    logger.info("Retrying...")
-                else:
-                    logger.error("Max retries reached. Raising exception.")
-                    raise
+        embedding_type = "uint8" if settings.EMBEDDING_QUANTIZATION == "uint8" else "float"
+        return {
+            "texts": [query], 
+            "input_type": "search_query", 
+            "model": settings.COHERE_EMBED_MODEL,
+            "embedding_types": [embedding_type]
+        }, embedding_type
+    
+    def _parse_embedding(self, response, embedding_type: str) -> List:
+        embeddings = getattr(response.embeddings, embedding_type)[0]
+        logger.info("Generated dense embeddings")
+        return embeddings
         
     def create_chat_session_name(self, user_message: ChatMessage):      
+        request = self._chat_name_request(user_message)
+        response = self._with_retries("creating chat session name", lambda: self.client.chat(**request))
+        return self._parse_chat_name(response)
+    
+    async def create_chat_session_name_async(self, user_message: ChatMessage):      
+        request = self._chat_name_request(user_message)
+        response = await self._with_retries_async("creating chat session name", lambda: self.async_client.chat(**request))
+        return self._parse_chat_name(response)
+    
+    def _chat_name_request(self, user_message: ChatMessage) -> Dict:
         logger.info(f"Creating chat session name for query: {user_message.content}, using rewritten query: {user_message.formatted_content}")
         
         system_message = self._get_chat_name_system_message()  
         
-        response = None
-        
-        max_retries = 3
-        for attempt in range(max_retries):
-            try:
-                response = self.client.chat(
-                    model="command-r-08-2024",
-                    messages=[
-                        {
-                            'role': system_message.role,
-                            'content': system_message.content
-                        },
-                        {
-                            'role': user_message.role,
-                            'content': user_message.rewritten_query_for_llm
-                        }
-                    ],
-                    temperature=0.1
-                )
-            except Exception as e:
-                logger.error(f"Error creating chat session name (attempt {attempt + 1}): {e}")
-                if attempt < max_retries - 1:
-                    logger.info("Retrying...")
-                else:
-                    logger.error("Max retries reached. Raising exception.")
-                    raise
+        return {
+            "model": self.CHAT_MODEL,
+            "messages": [
+                {
+                    'role': system_message.role,
+                    'content': system_message.content
+                },
+                {
+                    'role': user_message.role,
+                    'content': user_message.rewritten_query_for_llm
+                }
+            ],
+            "temperature": 0.1
+        }
         
+    def _parse_chat_name(self, response):
         if response:
             name = response.message.content[0].text
             return self._truncate_chat_name(name)
@@ -159,11 +250,45 @@ class CohereService(BaseLLMService):
             return None
 
     def rewrite_query_with_history_for_vector_base(self, message: ChatMessage, messages: list[ChatMessage]) -> str:
-        logger.info("Rewriting query based on chat history...")
-
+        def rewrite():
+            request = self._rewrite_query_with_history_request(message, messages)
+            response = self._with_retries("rewriting query with history", lambda: self.client.chat(**request))
+            return self._parse_rewritten_query(message, response)
+        
+        return self.rewrite_cache.get_or_compute(
+            message.user_query, 
+            self._rewrite_history_queries(messages), 
+            self.QUERY_REWRITE_SYSTEM_MESSAGE_WITH_HISTORY_FOR_DB, 
+            self.CHAT_MODEL, 
+            rewrite
+        )
+    
+    async def rewrite_query_with_history_for_vector_base_async(self, message: ChatMessage, messages: list[ChatMessage]) -> str:
+        async def rewrite():
+            request = self._rewrite_query_with_history_request(message, messages)
+            response = await self._with_retries_async("rewriting query with history", lambda: self.async_client.chat(**request))
+            return self._parse_rewritten_query(message, response)
+        
+        return await self.rewrite_cache.get_or_compute_async(
+            message.user_query, 
+            self._rewrite_history_queries(messages), 
+            self.QUERY_REWRITE_SYSTEM_MESSAGE_WITH_HISTORY_FOR_DB, 
+            self.CHAT_MODEL, 
+            rewrite
+        )
+    
+    def _rewrite_history(self, messages: list[ChatMessage]) -> list[ChatMessage]:
         # Filter out system messages and get last few messages for context
         # Get up to last 6 messages, but works with fewer messages too
-        chat_history = [msg for msg in messages if msg.role == MessageRole.USER][-6:]
+        return [msg for msg in messages if msg.role == MessageRole.USER][-6:]
+    
+    def _rewrite_history_queries(self, messages: list[ChatMessage]) -> list[str]:
+        return [msg.user_query or "" for msg in self._rewrite_history(messages)]
+
+    def _rewrite_query_with_history_request(self, message: ChatMessage, messages: list[ChatMessage]) -> Dict:
+        logger.info("Rewriting query based on chat history...")
+
+        chat_history = self._rewrite_history(messages)
         
         system_message = ChatMessage(
             role="system",
@@ -180,37 +305,26 @@ class CohereService(BaseLLMService):
 New query: {message.user_query}"""
         )
         
-        max_retries = 3
-        for attempt in range(max_retries):
-            try:
-                response = self.client.chat(
-                    model="command-r-08-2024",
-                    messages=[
-                    {
-                        'role': system_message.role,
-                        'content': system_message.content
-                    },
-                    {
-                            'role': user_message.role,
-                            'content': user_message.content
-                        }
-                    ],
-                    temperature=0.1
-                )
-                
-                rewritten_query = response.message.content[0].text
-                logger.info(f"Original query: {message.user_query}")
-                logger.info(f"Rewritten query: {rewritten_query}")
-                return rewritten_query
-            except Exception as e:
-                logger.error(f"Error rewriting query with history (attempt {attempt + 1}): {e}")
-                if attempt < max_retries - 1:
-                    logger.info("Retrying...")
-                else:
-                    logger.error("Max retries reached. Raising exception.")
-                    raise
-                
-        return message.user_query  # Fall back to original query if rewriting fails
+        return {
+            "model": self.CHAT_MODEL,
+            "messages": [
+                {
+                    'role': system_message.role,
+                    'content': system_message.content
+                },
+                {
+                    'role': user_message.role,
+                    'content': user_message.content
+                }
+            ],
+            "temperature": 0.1
+        }
+        
+    def _parse_rewritten_query(self, message: ChatMessage, response) -> str:
+        rewritten_query = response.message.content[0].text
+        logger.info(f"Original query: {message.user_query}")
+        logger.info(f"Rewritten query: {rewritten_query}")
+        return rewritten_query
 
     def rewrite_query_for_llm(self, message: ChatMessage) -> str:       
         rewritten_query = message.content
@@ -227,6 +341,26 @@ New query: {message.user_query}"""
         return rewritten_query
 
     def rewrite_query_for_vector_base(self, message: ChatMessage) -> str:       
+        def rewrite():
+            request = self._rewrite_query_request(message)
+            response = self._with_retries("rewriting query for vector base", lambda: self.client.chat(**request))
+            return self._parse_rewritten_query(message, response)
+        
+        return self.rewrite_cache.get_or_compute(
+            message.user_query, [], self.QUERY_REWRITE_SYSTEM_MESSAGE, self.QUERY_REWRITE_MODEL, rewrite
+        )
+    
+    async def rewrite_query_for_vector_base_async(self, message: ChatMessage) -> str:       
+        async def rewrite():
+            request = self._rewrite_query_request(message)
+            response = await self._with_retries_async("rewriting query for vector base", lambda: self.async_client.chat(**request))
+            return self._parse_rewritten_query(message, response)
+        
+        return await self.rewrite_cache.get_or_compute_async(
+            message.user_query, [], self.QUERY_REWRITE_SYSTEM_MESSAGE, self.QUERY_REWRITE_MODEL, rewrite
+        )
+        
+    def _rewrite_query_request(self, message: ChatMessage) -> Dict:
         system_message = ChatMessage(
             role="system",
             content=self.QUERY_REWRITE_SYSTEM_MESSAGE
@@ -236,33 +370,17 @@ New query: {message.user_query}"""
             content=f"""Query: {message.user_query}"""
         )
 
-        max_retries = 3
-        for attempt in range(max_retries):
-            try:
-                response = self.client.chat(
-                    model="command-r",
-                    messages=[
-                        {
-                            'role': system_message.role,
-                            'content': system_message.content
-                        },
-                        {
-                            'role': user_message.role,
-                            'content': user_message.content
-                        }
-                    ],
-                    temperature=0.1
-                )
-                
-                rewritten_query = response.message.content[0].text
-                logger.info(f"Original query: {message.user_query}")
-                logger.info(f"Rewritten query: {rewritten_query}")
-                return rewritten_query
-            except Exception as e:
-                logger.error(f"Error rewriting query for vector base (attempt {attempt + 1}): {e}")
-                if attempt < max_retries - 1:
-                    logger.info("Retrying...")
-                else:
-                    logger.error("Max retries reached. Raising exception.")
-                    raise
-        return message.content  # Fall back to original query if rewriting fails
\ No newline at end of file
+        return {
+            "model": self.QUERY_REWRITE_MODEL,
+            "messages": [
+                {
+                    'role': system_message.role,
+                    'content': system_message.content
+                },
+                {
+                    'role': user_message.role,
+                    'content': user_message.content
+                }
+            ],
+            "temperature": 0.1
+        }
@@ -0,0 +1,47 @@
+import hashlib
+import numpy as np
+from typing import List, NamedTuple
+from ..cache import normalize_text
+from .mmr import normalize_rows
+
+
+class Deduplication(NamedTuple):
+    kept: List[int]
+    exact_duplicates: int
+    near_duplicates: int
+
+
+def content_hash(content: str) -> str:
+    """Hash of the content, ignoring case and whitespace"""
+    return hashlib.sha256(normalize_text(content or "").encode("utf-8")).hexdigest()
+
+
+def deduplicate(contents: List[str], embeddings=None, similarity_threshold: float = 0.98) -> Deduplication:
+    """
+    Keep the first of every group of duplicate candidates, in the given (rank)
+    order. A candidate is an exact duplicate when its content hash was kept
+    before, and a near-duplicate when the cosine similarity of its embedding to
+    a kept candidate is at least similarity_threshold. Without embeddings only
+    exact duplicates are dropped.
+    """
+    vectors = normalize_rows(embeddings) if embeddings is not None and len(contents) else None
+    # Highest similarity of every candidate to the kept candidates
+    max_similarity = np.full(len(contents), -np.inf)
+    seen = set()
+    kept = []
+    exact_duplicates = near_duplicates = 0
+
+    for idx, content in enumerate(contents):
+        digest = content_hash(content)
+        if digest in seen:
+            exact_duplicates += 1
+            continue
+        if max_similarity[idx] >= similarity_threshold:
+            near_duplicates += 1
+            continue
+        seen.add(digest)
+        kept.append(idx)
+        if vectors is not None:
+            np.maximum(max_similarity, vectors @ vectors[idx], out=max_similarity)
+
+    return Deduplication(kept, exact_duplicates, near_duplicates)
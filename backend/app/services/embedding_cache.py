@@ -0,0 +1,127 @@
+import array
+import logging
+import numpy as np
+from typing import Awaitable, Callable, List, NamedTuple, Optional
+from ..cache import TieredCache, make_key, normalize_text
+from ..config import settings
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def _dumps_vector(vector: List) -> bytes:
+    # uint8 embeddings fit in one byte per dimension, float embeddings are kept as doubles so they round-trip exactly
+    typecode = "B" if all(isinstance(value, int) and 0 <= value <= 255 for value in vector) else "d"
+    return typecode.encode("ascii") + array.array(typecode, vector).tobytes()
+
+
+def _loads_vector(data: bytes) -> List:
+    values = array.array(data[:1].decode("ascii"))
+    values.frombytes(data[1:])
+    return values.tolist()
+
+
+class DenseEmbeddingCache:
+    """
+    Cache for dense query embeddings, keyed by the normalized query text, the
+    embedding model and the quantization type. Repeated questions (the same
+    municipality question from several journalists) skip the Cohere call, and
+    with SHARED_CACHE_PATH set every worker on the host shares the entries.
+    """
+    _instance = None
+
+    def __init__(self):
+        self.cache = TieredCache(
+            "dense_embedding",
+            max_entries=settings.EMBEDDING_CACHE_MAX_ENTRIES,
+            ttl=settings.EMBEDDING_CACHE_TTL,
+            shared_max_entries=settings.EMBEDDING_CACHE_SHARED_MAX_ENTRIES,
+            dumps=_dumps_vector,
+            loads=_loads_vector
+        )
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    @staticmethod
+    def get_key(query: str, model: str, quantization: str) -> str:
+        return make_key("dense_embedding", normalize_text(query), model, quantization)
+
+    def get_or_compute(self, query: str, model: str, quantization: str, compute: Callable[[], List]) -> List:
+        if not settings.EMBEDDING_CACHE_ENABLED:
+            return compute()
+        return self.cache.get_or_compute(self.get_key(query, model, quantization), compute)
+
+    async def get_or_compute_async(self, query: str, model: str, quantization: str, compute: Callable[[], Awaitable[List]]) -> List:
+        if not settings.EMBEDDING_CACHE_ENABLED:
+            return await compute()
+        return await self.cache.get_or_compute_async(self.get_key(query, model, quantization), compute)
+
+
+class SparseVector(NamedTuple):
+    """A sparse query vector as two flat numpy arrays, instead of a fastembed SparseEmbedding object"""
+    indices: np.ndarray
+    values: np.ndarray
+
+
+def _dumps_sparse_vector(vector: SparseVector) -> bytes:
+    header = f"{vector.indices.dtype.str}|{vector.values.dtype.str}|{len(vector.indices)}\n"
+    return header.encode("ascii") + vector.indices.tobytes() + vector.values.tobytes()
+
+
+def _loads_sparse_vector(data: bytes) -> SparseVector:
+    header, _, body = data.partition(b"\n")
+    indices_dtype, values_dtype, length = header.decode("ascii").split("|")
+    indices = np.frombuffer(body, dtype=indices_dtype, count=int(length))
+    values = np.frombuffer(body, dtype=values_dtype, count=int(length), offset=indices.nbytes)
+    return SparseVector(indices, values)
+
+
+def _sizeof_sparse_vector(vector: SparseVector) -> int:
+    # The arrays plus a rough allowance for the tuple, the arrays' headers and the key
+    return vector.indices.nbytes + vector.values.nbytes + 300
+
+
+class SparseEmbeddingCache:
+    """
+    Cache for sparse query vectors, keyed by the normalized query and the
+    sparse model. Memory is bounded by SPARSE_EMBEDDING_CACHE_MAX_BYTES and,
+    with SPARSE_EMBEDDING_CACHE_PERSIST and SHARED_CACHE_PATH set, entries
+    survive restarts in the shared SQLite file.
+
+    Every hit saves one fastembed run, which is credited with the average
+    duration of the runs this worker did compute.
+    """
+    _instance = None
+
+    def __init__(self):
+        self.cache = TieredCache(
+            "sparse_embedding",
+            max_entries=settings.SPARSE_EMBEDDING_CACHE_MAX_ENTRIES,
+            ttl=settings.SPARSE_EMBEDDING_CACHE_TTL,
+            dumps=_dumps_sparse_vector,
+            loads=_loads_sparse_vector,
+            max_bytes=settings.SPARSE_EMBEDDING_CACHE_MAX_BYTES,
+            sizeof=_sizeof_sparse_vector,
+            shared=settings.SPARSE_EMBEDDING_CACHE_PERSIST,
+            track_savings=True
+        )
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    @staticmethod
+    def get_key(query: str, model: str) -> str:
+        return make_key("sparse_embedding", normalize_text(query), model)
+
+    def get_or_compute(self, query: str, model: str, compute: Callable[[], Optional[SparseVector]]) -> Optional[SparseVector]:
+        if not settings.SPARSE_EMBEDDING_CACHE_ENABLED:
+            return compute()
+        return self.cache.get_or_compute(self.get_key(query, model), compute)
@@ -1,9 +1,10 @@
 from uuid import UUID
 from typing import Optional
 from sqlalchemy import select, update, insert
-from app.models import MessageFeedback, SessionFeedback, Document, DocumentFeedback
+from app.models import MessageFeedback, SessionFeedback, Document, DocumentFeedback, Message, MessageDocument
 from app.schemas import MessageFeedbackCreate, MessageFeedbackUpdate, SessionFeedbackCreate, DocumentFeedbackCreate, DocumentFeedbackUpdate, FeedbackCreate
 from .database_service import DatabaseService
+from .session_cache import SessionCache
 from fastapi import HTTPException
 
 
@@ -19,6 +20,7 @@ class FeedbackService(DatabaseService):
         
         self.db.add(new_message_feedback)        
         self.db.commit()        
+        self._invalidate_message_session(feedback.message_id)
         self.db.refresh(new_message_feedback)
         
         return new_message_feedback
@@ -39,6 +41,7 @@ class FeedbackService(DatabaseService):
             db_message_feedback.notes = feedback.notes
 
         self.db.commit()
+        self._invalidate_message_session(feedback.message_id)
         self.db.refresh(db_message_feedback)
         
         return db_message_feedback
@@ -59,6 +62,7 @@ class FeedbackService(DatabaseService):
         
         self.db.add(new_session_feedback)        
         self.db.commit()        
+        SessionCache.get_instance().invalidate(feedback.session_id)
         self.db.refresh(new_session_feedback)
         
         return new_session_feedback
@@ -85,6 +89,7 @@ class FeedbackService(DatabaseService):
         
         self.db.add(new_document_feedback)        
         self.db.commit()        
+        self._invalidate_document_sessions(document_feedback.document_id)
         self.db.refresh(new_document_feedback)
         
         return new_document_feedback
@@ -106,6 +111,7 @@ class FeedbackService(DatabaseService):
             document_feedback.notes = feedback.notes
 
         self.db.commit()
+        self._invalidate_document_sessions(feedback.document_id)
         self.db.refresh(document_feedback)
         
         return document_feedback
@@ -113,3 +119,18 @@ class FeedbackService(DatabaseService):
     def get_document_feedback(self, document_id: int) -> dict:
         """Get document feedback by document ID"""
         return self.db.query(DocumentFeedback).filter(DocumentFeedback.document_id == document_id).first()
+
+    def _invalidate_message_session(self, message_id: int):
+        """Make the cached renderings of the session the message belongs to stale"""
+        session_id = self.db.query(Message.session_id).filter(Message.id == message_id).scalar()
+        SessionCache.get_instance().invalidate(session_id)
+
+    def _invalidate_document_sessions(self, document_id: int):
+        """Make the cached renderings of the sessions that show the document stale"""
+        session_ids = self.db.query(Message.session_id)\
+            .join(MessageDocument, MessageDocument.message_id == Message.id)\
+            .filter(MessageDocument.document_id == document_id)\
+            .distinct()\
+            .all()
+        for (session_id,) in session_ids:
+            SessionCache.get_instance().invalidate(session_id)
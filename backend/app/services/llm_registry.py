@@ -0,0 +1,35 @@
+import logging
+import threading
+from ..config import settings
+from .base_llm_service import BaseLLMService
+from .cohere_service import CohereService
+from .litellm_service import LiteLLMService
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# One LLM service per process, so its HTTP clients and their keep-alive
+# connections are reused by every request the worker handles
+_llm_service = None
+_lock = threading.Lock()
+
+
+def get_llm_service() -> BaseLLMService:
+    """Return the process-wide instance of the configured LLM service"""
+    global _llm_service
+    
+    if _llm_service is None:
+        with _lock:
+            if _llm_service is None:
+                if settings.LLM_SERVICE.lower() == "litellm":
+                    _llm_service = LiteLLMService()
+                else:
+                    _llm_service = CohereService()
+                logger.info(f"Using {type(_llm_service).__name__} as LLM service")
+    return _llm_service
+
+
+async def close_llm_clients():
+    """Close the shared HTTP clients on shutdown"""
+    await CohereService.close_clients()
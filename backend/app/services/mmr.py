@@ -0,0 +1,61 @@
+import numpy as np
+from typing import List, Sequence
+
+
+def normalize_rows(embeddings) -> np.ndarray:
+    """
+    Scale the rows of an embedding matrix (float32, uint8 or nested lists) to unit
+    length as float64, like sklearn's cosine_similarity does, so rows with zero
+    length stay zero
+    """
+    matrix = np.asarray(embeddings, dtype=np.float64)
+    norms = np.sqrt(np.einsum("ij,ij->i", matrix, matrix))
+    norms[norms == 0.0] = 1.0
+    return matrix / norms[:, np.newaxis]
+
+
+def normalize_relevance_scores(relevance_scores: Sequence[float]) -> np.ndarray:
+    """Min-max scale the scores to [0, 1], or all ones when they are equal"""
+    scores = np.array(relevance_scores)
+    if scores.max() > scores.min():
+        return (scores - scores.min()) / (scores.max() - scores.min())
+    return np.ones_like(scores)
+
+
+def mmr_select(embeddings, relevance_scores: Sequence[float], lambda_param: float = 0.7, top_n: int = 10) -> List[int]:
+    """
+    Select top_n indices by maximal marginal relevance: the relevance of a candidate
+    minus its highest similarity to the candidates selected so far.
+
+    The full n×n similarity matrix is computed up front, as one BLAS product
+    of the normalized embeddings (O(n²·d)). The pick loop then keeps the
+    highest similarity of every candidate to the selection in one vector and
+    updates it with the column of the newly selected candidate, so it is
+    O(n·k) vector operations on top of that product. Ties go to the candidate
+    with the highest index, and nothing is subtracted for the first pick.
+    """
+    count = len(relevance_scores)
+    if count == 0 or top_n <= 0:
+        return []
+
+    vectors = normalize_rows(embeddings)
+    # The same product sklearn's cosine_similarity computes, so near-ties between
+    # (near-)duplicate chunks are broken exactly as before
+    similarity_matrix = vectors @ vectors.T
+    relevance = lambda_param * normalize_relevance_scores(relevance_scores)
+    max_similarity = np.zeros(count)
+    available = np.ones(count, dtype=bool)
+    selected = []
+
+    while len(selected) < top_n and len(selected) < count:
+        scores = relevance - (1 - lambda_param) * max_similarity
+        scores[~available] = -np.inf
+        # argmax returns the first maximum, so search the reversed scores to prefer the highest index
+        selected_idx = count - 1 - int(np.argmax(scores[::-1]))
+        selected.append(selected_idx)
+        available[selected_idx] = False
+
+        similarity = similarity_matrix[:, selected_idx]
+        max_similarity = similarity if len(selected) == 1 else np.maximum(max_similarity, similarity)
+
+    return selected
@@ -0,0 +1,81 @@
+import json
+import logging
+from typing import Dict, List, Tuple
+from ..cache import CacheGeneration, TieredCache, make_key
+from ..config import settings
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def _sizeof_payload(payload: Dict) -> int:
+    # The serialized payload plus a rough allowance for the dicts and the key
+    return len(json.dumps(payload, default=str)) + 500
+
+
+class ChunkPayloadCache:
+    """
+    Cache for the Qdrant payloads of chunks, as shown in the session view.
+
+    A chunk payload doesn't change within one corpus version, so entries are
+    keyed on the chunk id, the collection and a corpus generation that
+    purge() bumps after the index is updated. Memory per worker is bounded by
+    CHUNK_PAYLOAD_CACHE_MAX_BYTES. Without SHARED_CACHE_PATH a purge can't
+    reach the other workers, which would serve old content until the TTL, so
+    the cache is disabled.
+    """
+    _instance = None
+
+    def __init__(self):
+        self.cache = TieredCache(
+            "chunk_payload",
+            max_entries=settings.CHUNK_PAYLOAD_CACHE_MAX_ENTRIES,
+            ttl=settings.CHUNK_PAYLOAD_CACHE_TTL,
+            shared_max_entries=settings.CHUNK_PAYLOAD_CACHE_SHARED_MAX_ENTRIES,
+            max_bytes=settings.CHUNK_PAYLOAD_CACHE_MAX_BYTES,
+            sizeof=_sizeof_payload
+        )
+        self.generation = CacheGeneration("chunk_payload")
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    @property
+    def enabled(self) -> bool:
+        return settings.CHUNK_PAYLOAD_CACHE_ENABLED and self.generation.shared is not None
+
+    @staticmethod
+    def get_key(generation: str, chunk_id: str) -> str:
+        return make_key("chunk_payload", generation, settings.QDRANT_COLLECTION, chunk_id)
+
+    def get_many(self, chunk_ids: List[str]) -> Tuple[Dict[str, Dict], List[str]]:
+        """Return the cached payloads by chunk id and the chunk ids that have to be fetched"""
+        generation = self.generation.get() if self.enabled else None
+        if generation is None:
+            return {}, list(dict.fromkeys(chunk_ids))
+
+        payloads = {}
+        missing = []
+        for chunk_id in dict.fromkeys(chunk_ids):
+            payload = self.cache.get(self.get_key(generation, chunk_id))
+            if payload is None:
+                missing.append(chunk_id)
+            else:
+                payloads[chunk_id] = payload
+        return payloads, missing
+
+    def set_many(self, payloads: Dict[str, Dict]):
+        generation = self.generation.get() if self.enabled else None
+        if generation is None:
+            return
+        for chunk_id, payload in payloads.items():
+            self.cache.set(self.get_key(generation, chunk_id), payload)
+
+    def purge(self):
+        """Drop every cached payload, in all workers"""
+        self.generation.bump()
+        self.cache.clear()
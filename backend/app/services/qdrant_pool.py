@@ -1,9 +1,10 @@
 from ..config import settings
-from qdrant_client import QdrantClient
+from qdrant_client import QdrantClient, AsyncQdrantClient
+import asyncio
 import logging
 import threading
 import queue
-from contextlib import contextmanager
+from contextlib import contextmanager, asynccontextmanager
 from datetime import datetime
 import time
 from typing import Optional
@@ -109,4 +110,165 @@ class QdrantConnectionPool:
             "available_connections": self._pool.qsize(),
             "failed_connections": self._failed_connections,
             "last_health_check": self._last_health_check
-        } 
\ No newline at end of file
+        } 
+
+class AsyncQdrantConnectionPool:
+    """
+    asyncio-native counterpart of QdrantConnectionPool, built on AsyncQdrantClient
+    over gRPC. Waiting for a client never blocks a thread, and waiters are served
+    in arrival order because asyncio.Queue wakes its getters first-in first-out.
+    """
+    _instance = None
+    _instance_lock = None
+    _health_check_interval = 60  # seconds
+    _timeout = settings.QDRANT_TIMEOUT
+
+    def __init__(self):
+        self._pool = asyncio.Queue(maxsize=settings.QDRANT_POOL_SIZE)
+        self._health_check_lock = asyncio.Lock()
+        self._last_health_check = None
+        self._active_connections = 0
+        self._waiting_requests = 0
+        self._total_connections = 0
+        self._failed_connections = 0
+        self._shared_client = None
+
+    async def initialize_pool(self):
+        """Initialize the connection pool"""
+        for _ in range(settings.QDRANT_POOL_SIZE):
+            await self._add_connection()
+
+    def _create_client(self) -> AsyncQdrantClient:
+        if settings.QDRANT_LOCATION:
+            # Local mode (e.g. ":memory:") keeps its data per client instance,
+            # so every slot in the pool shares a single client
+            if self._shared_client is None:
+                self._shared_client = AsyncQdrantClient(location=settings.QDRANT_LOCATION)
+            return self._shared_client
+
+        return AsyncQdrantClient(
+            host=settings.QDRANT_HOST,
+            port=settings.QDRANT_PORT,
+            timeout=self._timeout,
+            prefer_grpc=True
+        )
+
+    async def _add_connection(self) -> Optional[AsyncQdrantClient]:
+        """Create and add a new connection to the pool"""
+        try:
+            client = self._create_client()
+            # Test connection
+            await client.get_collections()
+            self._pool.put_nowait(client)
+            self._total_connections += 1
+            return client
+        except Exception as e:
+            logger.error(f"Failed to create async Qdrant connection: {e}")
+            self._failed_connections += 1
+            return None
+
+    async def _check_connection_health(self, client: AsyncQdrantClient) -> bool:
+        """Check if connection is healthy"""
+        try:
+            await client.get_collections()
+            return True
+        except Exception:
+            return False
+
+    async def _health_check(self):
+        """Perform health check on the idle connections"""
+        if (self._last_health_check and
+            time.time() - self._last_health_check <= self._health_check_interval):
+            return
+        if self._health_check_lock.locked():
+            return
+
+        async with self._health_check_lock:
+            self._last_health_check = time.time()
+            for _ in range(self._pool.qsize()):
+                try:
+                    client = self._pool.get_nowait()
+                except asyncio.QueueEmpty:
+                    break
+                if await self._check_connection_health(client):
+                    self._pool.put_nowait(client)
+                    continue
+
+                logger.warning("Unhealthy async connection detected, creating new one")
+                if client is not self._shared_client:
+                    await client.close()
+                self._total_connections -= 1
+                await self._add_connection()
+
+            # Replace the connections that failed to reconnect before, so a Qdrant
+            # outage doesn't leave the pool short for the life of the worker
+            missing = settings.QDRANT_POOL_SIZE - self._total_connections
+            if missing > 0:
+                logger.info(f"Async connection pool is {missing} connections short, reconnecting")
+                for _ in range(missing):
+                    if await self._add_connection() is None:
+                        break
+
+    @classmethod
+    async def get_instance(cls):
+        """Get the singleton instance, creating its connections on first use"""
+        if cls._instance is None:
+            if cls._instance_lock is None:
+                cls._instance_lock = asyncio.Lock()
+            async with cls._instance_lock:
+                if cls._instance is None:
+                    instance = cls()
+                    await instance.initialize_pool()
+                    if instance._total_connections == 0:
+                        # Not cached, so the next request tries to connect again
+                        await instance.close()
+                        raise RuntimeError("Could not connect to Qdrant")
+                    cls._instance = instance
+        return cls._instance
+
+    @asynccontextmanager
+    async def get_client(self):
+        """Get client from pool with async context manager"""
+        await self._health_check()
+
+        self._waiting_requests += 1
+        try:
+            client = await asyncio.wait_for(self._pool.get(), timeout=settings.QDRANT_POOL_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.error("Async connection pool timeout - no available connections")
+            raise RuntimeError("No available database connections")
+        finally:
+            self._waiting_requests -= 1
+
+        self._active_connections += 1
+        try:
+            yield client
+        finally:
+            self._active_connections -= 1
+            self._pool.put_nowait(client)
+
+    def get_pool_stats(self):
+        """Get pool statistics"""
+        return {
+            "total_connections": self._total_connections,
+            "active_connections": self._active_connections,
+            "available_connections": self._pool.qsize(),
+            "waiting_requests": self._waiting_requests,
+            "failed_connections": self._failed_connections,
+            "last_health_check": self._last_health_check
+        }
+
+    @classmethod
+    async def close_instance(cls):
+        if cls._instance is not None:
+            instance, cls._instance = cls._instance, None
+            await instance.close()
+
+    async def close(self):
+        while not self._pool.empty():
+            client = self._pool.get_nowait()
+            if client is not self._shared_client:
+                await client.close()
+        if self._shared_client is not None:
+            await self._shared_client.close()
+            self._shared_client = None
@@ -3,11 +3,11 @@ from ..schemas import ChatMessage
 from ..models import Session
 from qdrant_client import QdrantClient, models
 import logging
-from typing import List, Dict, AsyncGenerator, Tuple
+from typing import List, Dict, AsyncGenerator, Tuple, NamedTuple
 from markdown import markdown 
 import os
 from ..services.base_llm_service import BaseLLMService
-from ..text_utils import format_content
+from ..text_utils import format_content, truncate_to_token_budget
 from fastembed.sparse import SparseTextEmbedding
 from qdrant_client.http import models
 from ..schemas import ChatDocument, Location
@@ -16,19 +16,55 @@ import queue
 from contextlib import contextmanager
 from datetime import datetime, date
 import time
+import asyncio
 from typing import Optional
-from .qdrant_pool import QdrantConnectionPool
-from sklearn.metrics.pairwise import cosine_similarity
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from .qdrant_pool import QdrantConnectionPool, AsyncQdrantConnectionPool
+from .embedding_cache import SparseEmbeddingCache, SparseVector
+from .rerank_cache import RerankDocumentCache, RerankScoreCache
+from .retrieval_cache import RetrievalCache
+from .semantic_cache import SemanticQueryCache
+from .payload_cache import ChunkPayloadCache
+from .mmr import mmr_select
+from .dedup import deduplicate
+from .query_planner import QueryPlanner, SearchPlan
 import numpy as np
 import yaml
 from ..text_utils import get_formatted_date_english
+from .. import metrics
+from ..concurrency import run_blocking, submit_blocking, submit_blocking_sync
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+class SpeculativeSearch(NamedTuple):
+    """Hybrid search candidates prefetched for the raw user query"""
+    query: str
+    dense_vector: List[float]
+    candidates: Optional[List[Dict]]
+
+
 class QdrantService:
     DENSE_VECTORS_NAME = "text-dense"
     SPARSE_VECTORS_NAME = "text-sparse"
+    # The payload fields that _prepare_document_dict and the rerank documents read
+    DOCUMENT_PAYLOAD_FIELDS = [
+        "content",
+        "meta.source_id",
+        "meta.doc_url",
+        "meta.url",
+        "meta.title",
+        "meta.location",
+        "meta.location_name",
+        "meta.published",
+        "meta.type",
+        "meta.source",
+    ]
+    DOCUMENT_PAYLOAD_SELECTOR = models.PayloadSelectorInclude(include=DOCUMENT_PAYLOAD_FIELDS)
+    # Chunks of one source document share this field, grouped retrieval returns the best chunks per value
+    DOCUMENT_GROUP_FIELD = "meta.source_id"
+    # MMR only needs the dense vectors of the search results, never the sparse ones
+    SEARCH_VECTORS = [DENSE_VECTORS_NAME]
     
     _sparse_document_embedder = None
     _embedder_lock = threading.Lock()
@@ -44,7 +80,13 @@ class QdrantService:
         self.llm_service = llm_service
         self.dense_model_name = settings.COHERE_EMBED_MODEL
         self.sparse_model_name = settings.SPARSE_EMBED_MODEL
-        self.pool = QdrantConnectionPool.get_instance()
+    
+    @property
+    def pool(self) -> QdrantConnectionPool:
+        return QdrantConnectionPool.get_instance()
+    
+    async def get_async_pool(self) -> AsyncQdrantConnectionPool:
+        return await AsyncQdrantConnectionPool.get_instance()
         
     @classmethod
     def get_sparse_embedder(cls):
@@ -65,16 +107,101 @@ class QdrantService:
         return cls._sparse_document_embedder
         
         
-    def generate_sparse_embedding(self, query: str):
+    def generate_sparse_embedding(self, query: str) -> Optional[SparseVector]:
         try:
-            with self._query_semaphore:
-                sparse_vectors = self.get_sparse_embedder().query_embed(query)
-                return next(iter(sparse_vectors), None)
+            return SparseEmbeddingCache.get_instance().get_or_compute(
+                query, 
+                self.sparse_model_name, 
+                lambda: self._generate_sparse_embedding(query)
+            )
         except Exception as e:
             logger.error(f"Error generating sparse embedding: {e}")
             return None
+        
+    def _generate_sparse_embedding(self, query: str) -> Optional[SparseVector]:
+        with self._query_semaphore:
+            sparse_vectors = self.get_sparse_embedder().query_embed(query)
+            sparse_vector = next(iter(sparse_vectors), None)
+        if sparse_vector is None:
+            return None
+        return SparseVector(indices=sparse_vector.indices, values=sparse_vector.values)
 
     def get_documents_by_ids(self, documents: List[ChatDocument]):
+        qdrant_document_chunk_ids = self._get_chunk_ids(documents)
+        if not qdrant_document_chunk_ids:
+            return []
+        
+        try:
+            payload_cache = ChunkPayloadCache.get_instance()
+            payloads, missing_chunk_ids = payload_cache.get_many(qdrant_document_chunk_ids)
+            if missing_chunk_ids:
+                with self.pool.get_client() as client:
+                    qdrant_documents = client.retrieve(
+                        collection_name=settings.QDRANT_COLLECTION,
+                        ids=missing_chunk_ids,
+                        with_payload=self.DOCUMENT_PAYLOAD_SELECTOR,
+                        with_vectors=False,
+                    )
+                payloads.update(self._cache_retrieved_payloads(qdrant_documents, payload_cache))
+                
+            return self._prepare_documents_with_scores_and_feedback(
+                self._payloads_to_dicts(qdrant_document_chunk_ids, payloads, missing_chunk_ids), 
+                documents
+            )
+        except Exception as e:
+            logger.error(f"Error retrieving documents from Qdrant using document IDs: {e}")
+            return []
+
+    async def get_documents_by_ids_async(self, documents: List[ChatDocument]):
+        qdrant_document_chunk_ids = self._get_chunk_ids(documents)
+        if not qdrant_document_chunk_ids:
+            return []
+        
+        try:
+            payload_cache = ChunkPayloadCache.get_instance()
+            # The cache reads its generation and shared tier from SQLite, so it runs on the executor
+            payloads, missing_chunk_ids = await run_blocking(payload_cache.get_many, qdrant_document_chunk_ids)
+            if missing_chunk_ids:
+                pool = await self.get_async_pool()
+                async with pool.get_client() as client:
+                    qdrant_documents = await client.retrieve(
+                        collection_name=settings.QDRANT_COLLECTION,
+                        ids=missing_chunk_ids,
+                        with_payload=self.DOCUMENT_PAYLOAD_SELECTOR,
+                        with_vectors=False,
+                    )
+                payloads.update(await run_blocking(self._cache_retrieved_payloads, qdrant_documents, payload_cache))
+                
+            return self._prepare_documents_with_scores_and_feedback(
+                self._payloads_to_dicts(qdrant_document_chunk_ids, payloads, missing_chunk_ids), 
+                documents
+            )
+        except Exception as e:
+            logger.error(f"Error retrieving documents from Qdrant using document IDs: {e}")
+            return []
+
+    @staticmethod
+    def _cache_retrieved_payloads(qdrant_documents, payload_cache: ChunkPayloadCache) -> Dict[str, Dict]:
+        payloads = {str(document.id): document.payload for document in qdrant_documents}
+        payload_cache.set_many(payloads)
+        return payloads
+
+    @staticmethod
+    def _payloads_to_dicts(chunk_ids: List[str], payloads: Dict[str, Dict], missing_chunk_ids: List[str]) -> List[Dict]:
+        # In session order, once per chunk, skipping chunks that are no longer in the collection
+        unique_chunk_ids = dict.fromkeys(str(chunk_id) for chunk_id in chunk_ids)
+        metrics.increment("qdrant.documents_by_ids.cached", len(unique_chunk_ids) - len(missing_chunk_ids))
+        metrics.increment("qdrant.documents_by_ids.fetched", len(missing_chunk_ids))
+        return [
+            {
+                'id': chunk_id,
+                'payload': payloads[chunk_id],
+                'rerank_score': 0.0
+            }
+            for chunk_id in unique_chunk_ids if chunk_id in payloads
+        ]
+
+    def _get_chunk_ids(self, documents: List[ChatDocument]) -> List[str]:
         if not documents or len(documents) == 0:
             logger.debug("No documents provided to retrieve")
             return []
@@ -86,39 +213,122 @@ class QdrantService:
                     
         if not qdrant_document_chunk_ids:
             logger.warning("No valid document IDs found.")
-            return []
+        return qdrant_document_chunk_ids
+
+    @staticmethod
+    def _timed_embedding(branch: str, embed, query: str) -> Tuple:
+        start = time.perf_counter()
+        vector = embed(query)
+        elapsed = time.perf_counter() - start
+        metrics.observe(f"qdrant.embedding.{branch}_seconds", elapsed)
+        return vector, elapsed
+
+    def generate_query_embeddings(self, query: str) -> Tuple:
+        """
+        Generate the sparse (local fastembed) and dense (Cohere) query embeddings concurrently,
+        so the embedding step takes max(sparse, dense) instead of the sum of both.
+        """
+        start = time.perf_counter()
+        
+        # Both branches run on the bounded blocking executor, like the rest of the pipeline
+        sparse_future = submit_blocking_sync(
+            self._timed_embedding, "sparse", self.generate_sparse_embedding, query
+        )
+        dense_future = submit_blocking_sync(
+            self._timed_embedding, "dense", self.llm_service.generate_dense_embedding, query
+        )
         
         try:
-            with self.pool.get_client() as client:
-                qdrant_documents = client.retrieve(
-                    collection_name=settings.QDRANT_COLLECTION,
-                    ids=qdrant_document_chunk_ids,
-                    with_payload=True,
-                )
-                
-                # Convert records to the expected dictionary format
-                qdrant_documents_dicts = [{
-                    'id': record.id,
-                    'payload': record.payload,
-                    'rerank_score': 0.0
-                } for record in qdrant_documents]
-                
-                return self._prepare_documents_with_scores_and_feedback(qdrant_documents_dicts, documents)
+            dense_vector, dense_time = dense_future.result(
+                timeout=self._remaining(start, settings.DENSE_EMBEDDING_TIMEOUT)
+            )
+        except FutureTimeoutError:
+            # Frees the executor slots of branches that haven't started yet
+            dense_future.cancel()
+            sparse_future.cancel()
+            logger.error(f"Timed out after {settings.DENSE_EMBEDDING_TIMEOUT}s creating dense vector from query using Cohere")
+            metrics.increment("qdrant.embedding.dense_timeouts")
+            raise
         except Exception as e:
-            logger.error(f"Error retrieving documents from Qdrant using document IDs: {e}")
-            return []
+            sparse_future.cancel()
+            logger.error(f"Error creating dense vector from query using Cohere: {e}")
+            raise
+        
+        try:
+            sparse_vector, sparse_time = sparse_future.result(
+                timeout=self._remaining(start, settings.SPARSE_EMBEDDING_TIMEOUT)
+            )
+        except FutureTimeoutError:
+            sparse_future.cancel()
+            logger.error(f"Timed out after {settings.SPARSE_EMBEDDING_TIMEOUT}s creating sparse vector, continuing with dense vector only")
+            metrics.increment("qdrant.embedding.sparse_timeouts")
+            sparse_vector, sparse_time = None, None
+        
+        self._record_embedding_timings(start, sparse_time, dense_time)
+        return sparse_vector, dense_vector
+
+    @staticmethod
+    async def _timed_embedding_async(branch: str, embedding) -> Tuple:
+        start = time.perf_counter()
+        vector = await embedding
+        elapsed = time.perf_counter() - start
+        metrics.observe(f"qdrant.embedding.{branch}_seconds", elapsed)
+        return vector, elapsed
 
-    def hybrid_search(self, query, locations: List[Location] = None, date_range: List[datetime] = None) -> List[Dict]:
+    async def generate_query_embeddings_async(self, query: str) -> Tuple:
+        """Async variant of generate_query_embeddings, using the async dense embedding API"""
+        start = time.perf_counter()
         
-        sparse_vector = self.generate_sparse_embedding(query)
+        sparse_task = asyncio.ensure_future(self._timed_embedding_async(
+            "sparse", submit_blocking(self.generate_sparse_embedding, query)
+        ))
+        dense_task = asyncio.ensure_future(self._timed_embedding_async(
+            "dense", self.llm_service.generate_dense_embedding_async(query)
+        ))
         
         try:
-            # Generate dense embeddings
-            dense_vector = self.llm_service.generate_dense_embedding(query)
-        except Exception as e:
-            logger.error(f"Error creating dense vector from query using Cohere: {e}")
-            raise   
+            dense_vector, dense_time = await asyncio.wait_for(
+                dense_task, 
+                timeout=self._remaining(start, settings.DENSE_EMBEDDING_TIMEOUT)
+            )
+        except asyncio.TimeoutError:
+            dense_task.cancel()
+            sparse_task.cancel()
+            logger.error(f"Timed out after {settings.DENSE_EMBEDDING_TIMEOUT}s creating dense vector from query using Cohere")
+            metrics.increment("qdrant.embedding.dense_timeouts")
+            raise
+        except BaseException as e:
+            sparse_task.cancel()
+            if isinstance(e, Exception):
+                logger.error(f"Error creating dense vector from query using Cohere: {e}")
+            raise
+        
+        try:
+            sparse_vector, sparse_time = await asyncio.wait_for(
+                sparse_task, 
+                timeout=self._remaining(start, settings.SPARSE_EMBEDDING_TIMEOUT)
+            )
+        except asyncio.TimeoutError:
+            sparse_task.cancel()
+            logger.error(f"Timed out after {settings.SPARSE_EMBEDDING_TIMEOUT}s creating sparse vector, continuing with dense vector only")
+            metrics.increment("qdrant.embedding.sparse_timeouts")
+            sparse_vector, sparse_time = None, None
         
+        self._record_embedding_timings(start, sparse_time, dense_time)
+        return sparse_vector, dense_vector
+
+    def _record_embedding_timings(self, start: float, sparse_time: Optional[float], dense_time: float):
+        elapsed = time.perf_counter() - start
+        metrics.observe("qdrant.embedding.total_seconds", elapsed)
+        if sparse_time is not None:
+            metrics.increment(f"qdrant.embedding.dominant.{'sparse' if sparse_time > dense_time else 'dense'}")
+            logger.info(f"Generated query embeddings in {elapsed:.3f}s (sparse: {sparse_time:.3f}s, dense: {dense_time:.3f}s)")
+
+    @staticmethod
+    def _remaining(start: float, timeout: float) -> float:
+        return max(0.0, timeout - (time.perf_counter() - start))
+
+    def _build_search_filter(self, locations: List[Location] = None, date_range: List[datetime] = None) -> Optional[models.Filter]:
         # Build filter conditions
         filter_conditions = []
         
@@ -149,50 +359,139 @@ class QdrantService:
             search_filter = models.Filter(
                 must=filter_conditions,
             )
+        return search_filter
+
+    def hybrid_search(self, query, locations: List[Location] = None, date_range: List[datetime] = None, query_embeddings: Tuple = None, group_by_document: bool = False) -> List[Dict]:
+        
+        if query_embeddings is None:
+            query_embeddings = self.generate_query_embeddings(query)
+        sparse_vector, dense_vector = query_embeddings
+        
+        search_filter = self._build_search_filter(locations, date_range)
         
         logger.info(f"Retrieving documents from Qdrant for query using hybrid search: {query}, and filters: {search_filter}")        
         
         try:            
             logger.info(f"Querying vector database with query: '{query}'")
+            plan = QueryPlanner.get_instance().plan(self.pool, search_filter)
             with self.pool.get_client() as client:
-                qdrant_documents = client.query_points(
-                    collection_name=settings.QDRANT_COLLECTION,
-                    prefetch=[
-                        models.Prefetch(
-                            query=models.SparseVector(
-                                indices=sparse_vector.indices,
-                                values=sparse_vector.values,
-                            ),
-                            using=self.SPARSE_VECTORS_NAME,
-                            filter=search_filter,  # Apply filter to sparse search
-                            limit=settings.QDRANT_SPARSE_RETRIEVE_LIMIT
-                        ),
-                        models.Prefetch(
-                            query=dense_vector,
-                            using=self.DENSE_VECTORS_NAME,
-                            filter=search_filter,  # Apply filter to dense search
-                            limit=settings.QDRANT_DENSE_RETRIEVE_LIMIT
-                        ),
-                    ],
-                    query=models.FusionQuery(fusion=models.Fusion.RRF),
-                    limit=settings.QDRANT_HYBRID_RETRIEVE_LIMIT,
-                    score_threshold=None,
-                    with_payload=True,
-                    with_vectors=True,
-                    timeout=settings.QDRANT_HYBRID_SEARCH_TIMEOUT,  # Increase timeout to 120 seconds
-                ).points
+                request = self._hybrid_query_request(sparse_vector, dense_vector, search_filter, plan, group_by_document)
+                if group_by_document:
+                    qdrant_documents = self._grouped_hits(client.query_points_groups(**request))
+                else:
+                    qdrant_documents = client.query_points(**request).points
                 
         except Exception as e:
             logger.error(f"Error retrieving documents from Qdrant using hybrid search: {e}")   
             return None
         
+        return self._hybrid_search_results(qdrant_documents)
+
+    async def hybrid_search_async(self, query, locations: List[Location] = None, date_range: List[datetime] = None, query_embeddings: Tuple = None, group_by_document: bool = False, plan_task: asyncio.Future = None) -> List[Dict]:
+        
+        search_filter = self._build_search_filter(locations, date_range)
+        if plan_task is None:
+            plan_task = self.start_search_plan(search_filter)
+        
+        if query_embeddings is None:
+            try:
+                query_embeddings = await self.generate_query_embeddings_async(query)
+            except BaseException:
+                plan_task.cancel()
+                raise
+        sparse_vector, dense_vector = query_embeddings
+        
+        logger.info(f"Retrieving documents from Qdrant for query using hybrid search: {query}, and filters: {search_filter}")        
+        
+        try:            
+            logger.info(f"Querying vector database with query: '{query}'")
+            plan = await plan_task
+            pool = await self.get_async_pool()
+            async with pool.get_client() as client:
+                request = self._hybrid_query_request(sparse_vector, dense_vector, search_filter, plan, group_by_document)
+                if group_by_document:
+                    qdrant_documents = self._grouped_hits(await client.query_points_groups(**request))
+                else:
+                    qdrant_documents = (await client.query_points(**request)).points
+                
+        except Exception as e:
+            logger.error(f"Error retrieving documents from Qdrant using hybrid search: {e}")   
+            return None
+        
+        return self._hybrid_search_results(qdrant_documents)
+
+    def start_search_plan(self, search_filter: Optional[models.Filter]) -> asyncio.Future:
+        """Start planning the search right away, so the filter counts run while the query is embedded"""
+        async def plan():
+            pool = await self.get_async_pool()
+            return await QueryPlanner.get_instance().plan_async(pool, search_filter)
+        task = asyncio.ensure_future(plan())
+        # Don't warn about unretrieved exceptions when the search fails before the plan is awaited
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        return task
+
+    def _hybrid_query_request(self, sparse_vector, dense_vector, search_filter, plan: SearchPlan, group_by_document: bool = False) -> Dict:
+        request = {
+            "collection_name": settings.QDRANT_COLLECTION,
+            "prefetch": self._hybrid_prefetch(sparse_vector, dense_vector, search_filter, plan),
+            "query": models.FusionQuery(fusion=models.Fusion.RRF),
+            "limit": settings.QDRANT_HYBRID_RETRIEVE_LIMIT,
+            "score_threshold": None,
+            "with_payload": self.DOCUMENT_PAYLOAD_SELECTOR,
+            "with_vectors": self.SEARCH_VECTORS,
+            "timeout": settings.QDRANT_HYBRID_SEARCH_TIMEOUT,  # Increase timeout to 120 seconds
+        }
+        if group_by_document:
+            # The best chunks of the top source documents, so one long document can't fill the candidates
+            request.update(
+                group_by=self.DOCUMENT_GROUP_FIELD,
+                limit=settings.QDRANT_GROUP_RETRIEVE_LIMIT,
+                group_size=settings.QDRANT_GROUP_CHUNK_LIMIT
+            )
+        return request
+    
+    @staticmethod
+    def _grouped_hits(groups_result) -> List:
+        hits = [hit for group in groups_result.groups for hit in group.hits]
+        metrics.increment("qdrant.grouped_search.groups", len(groups_result.groups))
+        metrics.increment("qdrant.grouped_search.chunks", len(hits))
+        # Back in fused score order, as the candidates of an ungrouped search
+        return sorted(hits, key=lambda hit: hit.score, reverse=True)
+        
+    def _hybrid_search_results(self, qdrant_documents) -> List[Dict]:
         if not qdrant_documents:
             logger.warning("No documents found in Qdrant")
                     
         # Convert qdrant_document_candidates to a list of dictionaries
-        qdrant_documents_dicts = self._qdrant_documents_searched_to_dicts(qdrant_documents)
+        return self._qdrant_documents_searched_to_dicts(qdrant_documents)
+
+    def _hybrid_prefetch(self, sparse_vector, dense_vector, search_filter, plan: SearchPlan) -> List[models.Prefetch]:
+        prefetch = []
         
-        return qdrant_documents_dicts
+        # The sparse branch is skipped when its embedding failed or timed out
+        if sparse_vector is not None:
+            prefetch.append(
+                models.Prefetch(
+                    query=models.SparseVector(
+                        indices=sparse_vector.indices,
+                        values=sparse_vector.values,
+                    ),
+                    using=self.SPARSE_VECTORS_NAME,
+                    filter=search_filter,  # Apply filter to sparse search
+                    limit=plan.sparse_limit
+                )
+            )
+        
+        prefetch.append(
+            models.Prefetch(
+                query=dense_vector,
+                using=self.DENSE_VECTORS_NAME,
+                filter=search_filter,  # Apply filter to dense search
+                params=plan.search_params,  # Exact search or a wider HNSW beam for selective filters
+                limit=plan.dense_limit
+            )
+        )
+        return prefetch
 
     def dense_vector_search(self, query):   
         logger.debug(f"Retrieving documents from Qdrant for query: {query}")
@@ -219,15 +518,6 @@ class QdrantService:
             logger.error(f"Error retrieving documents from Qdrant using dense vector search: {e}")   
             return None
 
-    def _qdrant_documents_retrieved_to_dicts(self, qdrant_documents):
-        return [
-            {
-                'id': candidate.id,
-                'payload': candidate.payload
-            }
-            for candidate in qdrant_documents
-        ]  
-        
     def _qdrant_documents_searched_to_dicts(self, qdrant_documents):
         return [
             {
@@ -240,51 +530,298 @@ class QdrantService:
             for candidate in qdrant_documents
         ]   
 
-    def retrieve_relevant_documents(self, query: str, locations: List[Location] = None, date_range: List[date] = None) -> List[Dict]:          
+    def speculative_hybrid_search(self, query: str, locations: List[Location] = None, date_range: List[date] = None, group_by_document: bool = False) -> SpeculativeSearch:
+        """
+        Embed the raw user query and prefetch hybrid search candidates, while the
+        LLM query rewrite is still in flight.
+        """
+        logger.info(f"Speculatively retrieving candidates for raw query: '{query}'")
+        query_embeddings = self.generate_query_embeddings(query)
+        candidates = self.hybrid_search(query, locations, date_range, query_embeddings=query_embeddings, group_by_document=group_by_document)
+        return SpeculativeSearch(query=query, dense_vector=query_embeddings[1], candidates=candidates)
+
+    async def speculative_hybrid_search_async(self, query: str, locations: List[Location] = None, date_range: List[date] = None, group_by_document: bool = False) -> SpeculativeSearch:
+        logger.info(f"Speculatively retrieving candidates for raw query: '{query}'")
+        plan_task = self.start_search_plan(self._build_search_filter(locations, date_range))
+        try:
+            query_embeddings = await self.generate_query_embeddings_async(query)
+        except BaseException:
+            plan_task.cancel()
+            raise
+        candidates = await self.hybrid_search_async(query, locations, date_range, query_embeddings=query_embeddings, group_by_document=group_by_document, plan_task=plan_task)
+        return SpeculativeSearch(query=query, dense_vector=query_embeddings[1], candidates=candidates)
+
+    def _resolve_speculative_search(self, query: str, speculative_search: SpeculativeSearch, locations: List[Location] = None, date_range: List[date] = None, query_embeddings: Tuple = None, group_by_document: bool = False) -> List[Dict]:
+        """
+        Reuse the speculative candidates when the rewritten query is identical to the raw
+        query or close to it in embedding space, otherwise search with the rewritten query.
+        """
+        if speculative_search.candidates is None:
+            metrics.increment("qdrant.speculative.failed")
+            return self.hybrid_search(query, locations, date_range, query_embeddings=query_embeddings, group_by_document=group_by_document)
+        
+        if self._speculation_is_identical(query, speculative_search):
+            return speculative_search.candidates
+        
+        # The rewritten query has to be embedded anyway, so comparing costs no extra round trip
+        if query_embeddings is None:
+            query_embeddings = self.generate_query_embeddings(query)
+        if self._speculation_is_similar(query_embeddings, speculative_search):
+            return speculative_search.candidates
+        
+        return self.hybrid_search(query, locations, date_range, query_embeddings=query_embeddings, group_by_document=group_by_document)
+
+    async def _resolve_speculative_search_async(self, query: str, speculative_search: SpeculativeSearch, locations: List[Location] = None, date_range: List[date] = None, query_embeddings: Tuple = None, group_by_document: bool = False) -> List[Dict]:
+        if speculative_search.candidates is None:
+            metrics.increment("qdrant.speculative.failed")
+            return await self.hybrid_search_async(query, locations, date_range, query_embeddings=query_embeddings, group_by_document=group_by_document)
+        
+        if self._speculation_is_identical(query, speculative_search):
+            return speculative_search.candidates
+        
+        if query_embeddings is None:
+            query_embeddings = await self.generate_query_embeddings_async(query)
+        if self._speculation_is_similar(query_embeddings, speculative_search):
+            return speculative_search.candidates
+        
+        return await self.hybrid_search_async(query, locations, date_range, query_embeddings=query_embeddings, group_by_document=group_by_document)
+
+    def _speculation_is_identical(self, query: str, speculative_search: SpeculativeSearch) -> bool:
+        if self._normalize_query(query) != self._normalize_query(speculative_search.query):
+            return False
+        
+        logger.info("Rewritten query is identical to raw query, reusing speculative candidates")
+        metrics.increment("qdrant.speculative.reused_identical")
+        return True
+
+    def _speculation_is_similar(self, query_embeddings: Tuple, speculative_search: SpeculativeSearch) -> bool:
+        similarity = self._cosine_similarity(query_embeddings[1], speculative_search.dense_vector)
+        
+        if similarity >= settings.SPECULATIVE_RETRIEVAL_SIMILARITY_THRESHOLD:
+            logger.info(f"Rewritten query is similar to raw query ({similarity:.3f}), reusing speculative candidates")
+            metrics.increment("qdrant.speculative.reused_similar")
+            return True
+        
+        logger.info(f"Rewritten query differs from raw query ({similarity:.3f}), discarding speculative candidates")
+        metrics.increment("qdrant.speculative.discarded")
+        return False
+
+    @staticmethod
+    def _normalize_query(query: str) -> str:
+        return " ".join(query.lower().strip().strip('"').split())
+
+    @staticmethod
+    def _cosine_similarity(vector_a, vector_b) -> float:
+        a = np.asarray(vector_a, dtype=np.float64)
+        b = np.asarray(vector_b, dtype=np.float64)
+        norm = np.linalg.norm(a) * np.linalg.norm(b)
+        if norm == 0:
+            return 0.0
+        return float(np.dot(a, b) / norm)
+
+    def retrieve_relevant_documents(self, query: str, locations: List[Location] = None, date_range: List[date] = None, speculative_search: SpeculativeSearch = None, group_by_document: bool = False) -> List[Dict]:
+        return RetrievalCache.get_instance().get_or_compute(
+            query, locations, date_range, group_by_document,
+            lambda: self._retrieve_relevant_documents(query, locations, date_range, speculative_search, group_by_document)
+        )
+
+    async def retrieve_relevant_documents_async(self, query: str, locations: List[Location] = None, date_range: List[date] = None, speculative_search: SpeculativeSearch = None, group_by_document: bool = False) -> List[Dict]:
+        return await RetrievalCache.get_instance().get_or_compute_async(
+            query, locations, date_range, group_by_document,
+            lambda: self._retrieve_relevant_documents_async(query, locations, date_range, speculative_search, group_by_document)
+        )
+
+    def _retrieve_relevant_documents(self, query: str, locations: List[Location] = None, date_range: List[date] = None, speculative_search: SpeculativeSearch = None, group_by_document: bool = False) -> List[Dict]:          
         logger.debug(f"Retrieving relevant documents for query: {query}")
         
+        # Step 0: Reuse the documents of a near-duplicate query with the same filters
+        semantic_cache = SemanticQueryCache.get_instance()
+        query_embeddings = None
+        dense_vector = None
+        if semantic_cache.enabled:
+            dense_vector = self._speculative_dense_vector(query, speculative_search)
+            if dense_vector is None:
+                query_embeddings = self.generate_query_embeddings(query)
+                dense_vector = query_embeddings[1]
+            documents = semantic_cache.lookup(query, dense_vector, locations, date_range, group_by_document)
+            if documents is not None:
+                return documents
+        
         # Step 1: Retrieve initial candidates with filters
-        qdrant_document_candidates = self.hybrid_search(query, locations, date_range)
+        if speculative_search is not None:
+            qdrant_document_candidates = self._resolve_speculative_search(query, speculative_search, locations, date_range, query_embeddings, group_by_document)
+        else:
+            qdrant_document_candidates = self.hybrid_search(query, locations, date_range, query_embeddings=query_embeddings, group_by_document=group_by_document)
         
         # Check if qdrant_documents is None or empty
         if not qdrant_document_candidates:
             logger.warning("No documents retrieved from Qdrant")
             return []
+        qdrant_document_candidates = self._deduplicate_candidates(qdrant_document_candidates)
                
         # Step 2: Get relevance scores
-        # document_texts = [document['payload']['content'] for document in qdrant_document_candidates]
-        # Extract document metadata
-        qdrant_document_candidates_with_payload = [{
-            'Title': doc['payload']['meta']['title'],
-            'Location': doc['payload']['meta']['location_name'],
-            'Published': get_formatted_date_english(doc['payload']['meta']['published']),
-            'Documents type': doc['payload']['meta']['type'],
-            'Data source': doc['payload']['meta']['source'],
-            'Document source': BaseLLMService.get_human_readable_source(doc['payload']['meta']['source']),
-            'Content': doc['payload']['content']
-        } for doc in qdrant_document_candidates]
+        rerank_documents, rerank_keys, rerank_scores = self._prepare_rerank(query, qdrant_document_candidates)
+        uncached = [i for i, score in enumerate(rerank_scores) if score is None]
+        if uncached:
+            reranked_documents = self.llm_service.rerank_documents(**self._rerank_request(query, rerank_documents, uncached))
+            self._merge_rerank_results(reranked_documents, uncached, rerank_keys, rerank_scores)
         
-        document_candidates_yaml = [yaml.dump(doc, sort_keys=False) for doc in qdrant_document_candidates_with_payload] 
-                
-        logger.debug(f"Reranking:\n\n {document_candidates_yaml[0]}...")
-        reranked_documents = self.llm_service.rerank_documents(
-            query=query,
-            documents=document_candidates_yaml,
-            top_n=settings.RERANK_DOC_RETRIEVE_LIMIT,
-            return_documents=False
+        documents = self._select_relevant_documents(qdrant_document_candidates, self._apply_rerank_top_n(rerank_scores))
+        if dense_vector is not None:
+            semantic_cache.add(query, dense_vector, locations, date_range, documents, group_by_document)
+        return documents
+    
+    async def _retrieve_relevant_documents_async(self, query: str, locations: List[Location] = None, date_range: List[date] = None, speculative_search: SpeculativeSearch = None, group_by_document: bool = False) -> List[Dict]:          
+        logger.debug(f"Retrieving relevant documents for query: {query}")
+        
+        # Step 0: Reuse the documents of a near-duplicate query with the same filters
+        semantic_cache = SemanticQueryCache.get_instance()
+        query_embeddings = None
+        dense_vector = None
+        if semantic_cache.enabled:
+            dense_vector = self._speculative_dense_vector(query, speculative_search)
+            if dense_vector is None:
+                query_embeddings = await self.generate_query_embeddings_async(query)
+                dense_vector = query_embeddings[1]
+            # Reads the retrieval generation, which lives in the shared SQLite file
+            documents = await run_blocking(semantic_cache.lookup, query, dense_vector, locations, date_range, group_by_document)
+            if documents is not None:
+                return documents
+        
+        # Step 1: Retrieve initial candidates with filters
+        if speculative_search is not None:
+            qdrant_document_candidates = await self._resolve_speculative_search_async(query, speculative_search, locations, date_range, query_embeddings, group_by_document)
+        else:
+            qdrant_document_candidates = await self.hybrid_search_async(query, locations, date_range, query_embeddings=query_embeddings, group_by_document=group_by_document)
+        
+        # Check if qdrant_documents is None or empty
+        if not qdrant_document_candidates:
+            logger.warning("No documents retrieved from Qdrant")
+            return []
+        qdrant_document_candidates = self._deduplicate_candidates(qdrant_document_candidates)
+               
+        # Step 2: Get relevance scores, the score and generation lookups may hit the shared SQLite tier
+        rerank_documents, rerank_keys, rerank_scores = await run_blocking(self._prepare_rerank, query, qdrant_document_candidates)
+        uncached = [i for i, score in enumerate(rerank_scores) if score is None]
+        if uncached:
+            reranked_documents = await self.llm_service.rerank_documents_async(**self._rerank_request(query, rerank_documents, uncached))
+            await run_blocking(self._merge_rerank_results, reranked_documents, uncached, rerank_keys, rerank_scores)
+        
+        documents = self._select_relevant_documents(qdrant_document_candidates, self._apply_rerank_top_n(rerank_scores))
+        if dense_vector is not None:
+            await run_blocking(semantic_cache.add, query, dense_vector, locations, date_range, documents, group_by_document)
+        return documents
+    
+    def _speculative_dense_vector(self, query: str, speculative_search: Optional[SpeculativeSearch]):
+        """The dense vector of the raw query when the rewritten query is the same, so it needn't be embedded again"""
+        if speculative_search is None or speculative_search.candidates is None:
+            return None
+        if self._normalize_query(query) != self._normalize_query(speculative_search.query):
+            return None
+        return speculative_search.dense_vector
+    
+    def _deduplicate_candidates(self, qdrant_document_candidates: List[Dict]) -> List[Dict]:
+        """Drop exact and near-duplicate candidates before reranking, keeping the best ranked one of each group"""
+        if not settings.RERANK_DEDUP_ENABLED:
+            return qdrant_document_candidates
+        
+        dense_embeddings = [(candidate.get('vector') or {}).get(self.DENSE_VECTORS_NAME) for candidate in qdrant_document_candidates]
+        deduplication = deduplicate(
+            [candidate['payload']['content'] for candidate in qdrant_document_candidates],
+            dense_embeddings if all(embedding is not None for embedding in dense_embeddings) else None,
+            settings.RERANK_DEDUP_SIMILARITY_THRESHOLD
         )
         
-        # Initialize all documents with a default rerank score
-        for candidate in qdrant_document_candidates:
-            candidate['rerank_score'] = 0.0
+        metrics.increment("qdrant.dedup.exact_duplicates", deduplication.exact_duplicates)
+        metrics.increment("qdrant.dedup.near_duplicates", deduplication.near_duplicates)
+        if len(deduplication.kept) < len(qdrant_document_candidates):
+            logger.info(
+                f"Dropped {deduplication.exact_duplicates} exact and {deduplication.near_duplicates} near-duplicate "
+                f"candidates of {len(qdrant_document_candidates)} before reranking"
+            )
+        return [qdrant_document_candidates[idx] for idx in deduplication.kept]
+    
+    def _prepare_rerank(self, query: str, qdrant_document_candidates: List[Dict]) -> Tuple[List[str], List[str], List[Optional[float]]]:
+        """Serialize the candidates for the reranker and look up the scores that are already known"""
+        rerank_documents = self._rerank_documents(qdrant_document_candidates)
+        rerank_cache = RerankScoreCache.get_instance()
+        rerank_keys = [
+            rerank_cache.get_key(query, candidate['id'], document, settings.COHERE_RERANK_MODEL)
+            for candidate, document in zip(qdrant_document_candidates, rerank_documents)
+        ]
+        rerank_scores = rerank_cache.get_scores(rerank_keys)
         
-        # Update scores for documents that were reranked
-        for candidate, reranked_doc in zip(qdrant_document_candidates, reranked_documents.results):
+        cached_count = sum(score is not None for score in rerank_scores)
+        metrics.increment("qdrant.rerank.cached_documents", cached_count)
+        metrics.increment("qdrant.rerank.sent_documents", len(rerank_scores) - cached_count)
+        logger.info(f"Rerank scores cached for {cached_count} of {len(rerank_scores)} candidates")
+        return rerank_documents, rerank_keys, rerank_scores
+    
+    def _rerank_request(self, query: str, rerank_documents: List[str], indices: List[int]) -> Dict:
+        logger.debug(f"Reranking:\n\n {rerank_documents[indices[0]]}...")
+        metrics.increment("qdrant.rerank.sent_bytes", sum(len(rerank_documents[i].encode("utf-8")) for i in indices))
+        # Score every uncached document, the top_n cut is applied after merging with the cached scores
+        return {
+            "query": query,
+            "documents": [rerank_documents[i] for i in indices],
+            "top_n": len(indices),
+            "return_documents": False
+        }
+    
+    def _merge_rerank_results(self, reranked_documents, indices: List[int], rerank_keys: List[str], rerank_scores: List[Optional[float]]):
+        rerank_cache = RerankScoreCache.get_instance()
+        for result in reranked_documents.results:
             try:
-                candidate['rerank_score'] = reranked_doc.relevance_score
-            except AttributeError as e:
+                # result.index points into the documents of this request, not into the candidates
+                candidate_index = indices[result.index]
+                rerank_scores[candidate_index] = result.relevance_score
+                rerank_cache.set_score(rerank_keys[candidate_index], result.relevance_score)
+            except (AttributeError, IndexError) as e:
                 logger.warning(f"Could not get relevance score for document: {e}")
-                # Keep default score of 0.0
+    
+    def _apply_rerank_top_n(self, rerank_scores: List[Optional[float]]) -> List[float]:
+        """
+        Keep the scores of the RERANK_DOC_RETRIEVE_LIMIT best candidates and
+        score the rest 0.0, as a rerank with top_n would have returned them
+        """
+        ranked = sorted(
+            (i for i, score in enumerate(rerank_scores) if score is not None),
+            key=lambda i: rerank_scores[i],
+            reverse=True
+        )
+        top_n = set(ranked[:settings.RERANK_DOC_RETRIEVE_LIMIT])
+        return [rerank_scores[i] if i in top_n else 0.0 for i in range(len(rerank_scores))]
+    
+    def _rerank_documents(self, qdrant_document_candidates: List[Dict]) -> List[str]:
+        """The serialized rerank form of the candidates, built once per chunk payload"""
+        document_cache = RerankDocumentCache.get_instance()
+        
+        rerank_documents = []
+        for doc in qdrant_document_candidates:
+            key = document_cache.get_key(doc['payload'])
+            document = document_cache.get(key)
+            if document is None:
+                document = self._rerank_document(doc)
+                document_cache.set(key, document)
+            rerank_documents.append(document)
+        return rerank_documents
+    
+    @staticmethod
+    def _rerank_document(doc: Dict) -> str:
+        # Extract document metadata, with the content cut to the token budget of the reranker
+        return yaml.dump({
+            'Title': doc['payload']['meta']['title'],
+            'Location': doc['payload']['meta']['location_name'],
+            'Published': get_formatted_date_english(doc['payload']['meta']['published']),
+            'Documents type': doc['payload']['meta']['type'],
+            'Data source': doc['payload']['meta']['source'],
+            'Document source': BaseLLMService.get_human_readable_source(doc['payload']['meta']['source']),
+            'Content': truncate_to_token_budget(doc['payload']['content'], settings.RERANK_MAX_TOKENS)
+        }, sort_keys=False)
+    
+    def _select_relevant_documents(self, qdrant_document_candidates: List[Dict], rerank_scores: List[float]) -> List[Dict]:
+        for candidate, rerank_score in zip(qdrant_document_candidates, rerank_scores):
+            candidate['rerank_score'] = rerank_score
         
         logger.info(f"Reranked documents: {len(qdrant_document_candidates)}")
                 
@@ -300,21 +837,18 @@ class QdrantService:
             logger.warning(f"No documents met the minimum score threshold of {settings.RERANK_RELEVANCE_THRESHOLD}")
             return []
         
-        # Step 3: Compute similarity matrix
-        dense_embeddings = [candidate['vector']['text-dense'] for candidate in qdrant_document_candidates]
-        similarity_matrix = cosine_similarity(dense_embeddings)    
-            
-        # Step 4: Apply MMR
+        # Step 3: Apply MMR, the dense vectors come from Qdrant as float32 (or uint8 when quantized)
         logger.info(f"Applying MMR to {len(qdrant_document_candidates)} documents, to remove most similar documents, and keep {settings.MMR_DOC_RETRIEVE_LIMIT} documents")
+        dense_embeddings = np.asarray([candidate['vector']['text-dense'] for candidate in qdrant_document_candidates])
         relevance_scores = [candidate.get('rerank_score', 0.0) for candidate in qdrant_document_candidates]
-        diversified_candidates = self._mmr(
-            documents=qdrant_document_candidates,
-            query_embedding=dense_embeddings,
-            relevance_scores=relevance_scores,
-            similarity_matrix=similarity_matrix,
-            lambda_param=settings.MMR_DOC_LAMBDA_PARAM,
-            top_n=settings.MMR_DOC_RETRIEVE_LIMIT
-        )
+        with metrics.timed("mmr.select_seconds"):
+            selected_indices = mmr_select(
+                dense_embeddings,
+                relevance_scores,
+                lambda_param=settings.MMR_DOC_LAMBDA_PARAM,
+                top_n=settings.MMR_DOC_RETRIEVE_LIMIT
+            )
+        diversified_candidates = [qdrant_document_candidates[idx] for idx in selected_indices]
             
         return self.prepare_documents(diversified_candidates)
     
@@ -381,39 +915,3 @@ class QdrantService:
                 'content': doc['payload']['content']
             }
         }
-        
-    def _mmr(self, documents, query_embedding, relevance_scores, similarity_matrix, lambda_param=0.7, top_n=10):
-        selected = []
-        candidate_indices = list(range(len(documents)))
-        
-        # Normalize relevance scores
-        relevance_scores = np.array(relevance_scores)
-        if relevance_scores.max() > relevance_scores.min():
-            relevance_scores = (relevance_scores - relevance_scores.min()) / (relevance_scores.max() - relevance_scores.min())
-        else:
-            relevance_scores = np.ones_like(relevance_scores)
-
-        while len(selected) < top_n and candidate_indices:
-            mmr_scores = []
-            for idx in candidate_indices:
-                # Relevance to the query
-                relevance = relevance_scores[idx]
-                
-                # Max similarity to already selected documents
-                if selected:
-                    sim_to_selected = max([similarity_matrix[idx][sel_idx] for sel_idx in selected])
-                else:
-                    sim_to_selected = 0
-                
-                # Calculate MMR score
-                mmr_score = lambda_param * relevance - (1 - lambda_param) * sim_to_selected
-                mmr_scores.append((mmr_score, idx))
-            
-            # Select the document with the highest MMR score
-            mmr_scores.sort(reverse=True)
-            selected_idx = mmr_scores[0][1]
-            selected.append(selected_idx)
-            candidate_indices.remove(selected_idx)
-        
-        # Return the selected documents
-        return [documents[idx] for idx in selected]
\ No newline at end of file
@@ -0,0 +1,131 @@
+import logging
+from typing import NamedTuple, Optional
+from qdrant_client.http import models
+from ..cache import TieredCache, make_key
+from ..config import settings
+from .. import metrics
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class SearchPlan(NamedTuple):
+    """How the prefetches of one hybrid search are run"""
+    strategy: str
+    sparse_limit: int
+    dense_limit: int
+    search_params: Optional[models.SearchParams]
+    estimated_count: Optional[int]
+
+    @classmethod
+    def default(cls) -> "SearchPlan":
+        return cls("default", settings.QDRANT_SPARSE_RETRIEVE_LIMIT, settings.QDRANT_DENSE_RETRIEVE_LIMIT, None, None)
+
+
+class QueryPlanner:
+    """
+    Chooses how to search per location and date filter, from the estimated
+    number of points that match it.
+
+    Filters that match few points are searched exactly: scanning them is
+    faster than an HNSW traversal that has to skip most of the graph, and it
+    can't miss results. Selective filters that match more points keep HNSW
+    with a wider beam (hnsw_ef). Broad searches, including unfiltered ones,
+    get the prefetch limits scaled by QDRANT_PLANNER_BROAD_LIMIT_FACTOR, so
+    RRF fuses more candidates of both branches. Between the two the limits
+    grow with the share of the collection the filter matches, from the
+    configured limits up to the broad limits at QDRANT_PLANNER_SELECTIVE_RATIO.
+    Limits are never cut to the estimated count, as an estimate can be too low.
+
+    The estimates come from Qdrant's payload indexes (an approximate count),
+    and are cached per filter for QDRANT_PLANNER_COUNT_TTL, after which the
+    next search with that filter counts again. Counting takes a client from
+    the connection pool only on a cache miss, so a search can plan while its
+    query is still being embedded.
+    """
+    _instance = None
+
+    def __init__(self):
+        self.counts = TieredCache(
+            "filter_count",
+            max_entries=settings.QDRANT_PLANNER_COUNT_CACHE_MAX_ENTRIES,
+            ttl=settings.QDRANT_PLANNER_COUNT_TTL
+        )
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    @staticmethod
+    def get_key(search_filter: Optional[models.Filter]) -> str:
+        filter_parts = search_filter.model_dump(mode="json", exclude_none=True) if search_filter is not None else None
+        return make_key("filter_count", settings.QDRANT_COLLECTION, filter_parts)
+
+    def plan(self, pool, search_filter: Optional[models.Filter]) -> SearchPlan:
+        if not settings.QDRANT_PLANNER_ENABLED:
+            return SearchPlan.default()
+        try:
+            total_count = self.counts.get_or_compute(self.get_key(None), lambda: self._count(pool, None))
+            filtered_count = total_count
+            if search_filter is not None:
+                filtered_count = self.counts.get_or_compute(self.get_key(search_filter), lambda: self._count(pool, search_filter))
+        except Exception as e:
+            logger.warning(f"Error estimating filter cardinality, searching with the default plan: {e}")
+            metrics.increment("qdrant.planner.count_errors")
+            return SearchPlan.default()
+        return self.choose(filtered_count, total_count)
+
+    async def plan_async(self, pool, search_filter: Optional[models.Filter]) -> SearchPlan:
+        if not settings.QDRANT_PLANNER_ENABLED:
+            return SearchPlan.default()
+        try:
+            total_count = await self.counts.get_or_compute_async(self.get_key(None), lambda: self._count_async(pool, None))
+            filtered_count = total_count
+            if search_filter is not None:
+                filtered_count = await self.counts.get_or_compute_async(self.get_key(search_filter), lambda: self._count_async(pool, search_filter))
+        except Exception as e:
+            logger.warning(f"Error estimating filter cardinality, searching with the default plan: {e}")
+            metrics.increment("qdrant.planner.count_errors")
+            return SearchPlan.default()
+        return self.choose(filtered_count, total_count)
+
+    @staticmethod
+    def _count(pool, search_filter: Optional[models.Filter]) -> int:
+        metrics.increment("qdrant.planner.counts")
+        with pool.get_client() as client:
+            return client.count(collection_name=settings.QDRANT_COLLECTION, count_filter=search_filter, exact=False).count
+
+    @staticmethod
+    async def _count_async(pool, search_filter: Optional[models.Filter]) -> int:
+        metrics.increment("qdrant.planner.counts")
+        async with pool.get_client() as client:
+            return (await client.count(collection_name=settings.QDRANT_COLLECTION, count_filter=search_filter, exact=False)).count
+
+    @staticmethod
+    def choose(filtered_count: int, total_count: int) -> SearchPlan:
+        sparse_limit = settings.QDRANT_SPARSE_RETRIEVE_LIMIT
+        dense_limit = settings.QDRANT_DENSE_RETRIEVE_LIMIT
+
+        if filtered_count <= settings.QDRANT_PLANNER_EXACT_THRESHOLD:
+            plan = SearchPlan("exact", sparse_limit, dense_limit, models.SearchParams(exact=True), filtered_count)
+        elif filtered_count < total_count * settings.QDRANT_PLANNER_SELECTIVE_RATIO:
+            # The share of the broad limit increase in proportion to the share of the collection matched
+            selectivity = filtered_count / (total_count * settings.QDRANT_PLANNER_SELECTIVE_RATIO)
+            factor = 1 + (settings.QDRANT_PLANNER_BROAD_LIMIT_FACTOR - 1) * selectivity
+            sparse_limit, dense_limit = int(sparse_limit * factor), int(dense_limit * factor)
+            hnsw_ef = max(settings.QDRANT_PLANNER_FILTERED_HNSW_EF, dense_limit)
+            plan = SearchPlan("hnsw_filtered", sparse_limit, dense_limit, models.SearchParams(hnsw_ef=hnsw_ef), filtered_count)
+        else:
+            factor = settings.QDRANT_PLANNER_BROAD_LIMIT_FACTOR
+            plan = SearchPlan("hnsw", int(sparse_limit * factor), int(dense_limit * factor), None, filtered_count)
+
+        metrics.increment(f"qdrant.planner.{plan.strategy}")
+        metrics.observe("qdrant.planner.estimated_count", filtered_count)
+        logger.info(
+            f"Search plan {plan.strategy} for about {filtered_count} of {total_count} points "
+            f"(sparse limit {plan.sparse_limit}, dense limit {plan.dense_limit}, params {plan.search_params})"
+        )
+        return plan
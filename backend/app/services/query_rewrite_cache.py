@@ -0,0 +1,60 @@
+import hashlib
+import logging
+from typing import Awaitable, Callable, List
+from ..cache import TieredCache, make_key, normalize_text
+from ..config import settings
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class QueryRewriteCache:
+    """
+    Cache for the LLM rewrites of user queries for the vector base.
+
+    The key holds the normalized user query, the normalized user queries used
+    as history, the model and a hash of the system prompt, so editing the
+    prompt invalidates every rewrite made with the old text. With
+    SHARED_CACHE_PATH set, rewrites are shared between workers and survive
+    restarts.
+    """
+    _instance = None
+
+    def __init__(self):
+        self.cache = TieredCache(
+            "query_rewrite",
+            max_entries=settings.QUERY_REWRITE_CACHE_MAX_ENTRIES,
+            ttl=settings.QUERY_REWRITE_CACHE_TTL,
+            shared_max_entries=settings.QUERY_REWRITE_CACHE_SHARED_MAX_ENTRIES,
+            track_savings=True
+        )
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    @staticmethod
+    def get_prompt_version(system_message: str) -> str:
+        return hashlib.sha256(system_message.encode("utf-8")).hexdigest()[:16]
+
+    def get_key(self, user_query: str, history: List[str], system_message: str, model: str) -> str:
+        return make_key(
+            "query_rewrite",
+            self.get_prompt_version(system_message),
+            model,
+            normalize_text(user_query),
+            [normalize_text(query) for query in history]
+        )
+
+    def get_or_compute(self, user_query: str, history: List[str], system_message: str, model: str, compute: Callable[[], str]) -> str:
+        if not settings.QUERY_REWRITE_CACHE_ENABLED:
+            return compute()
+        return self.cache.get_or_compute(self.get_key(user_query, history, system_message, model), compute)
+
+    async def get_or_compute_async(self, user_query: str, history: List[str], system_message: str, model: str, compute: Callable[[], Awaitable[str]]) -> str:
+        if not settings.QUERY_REWRITE_CACHE_ENABLED:
+            return await compute()
+        return await self.cache.get_or_compute_async(self.get_key(user_query, history, system_message, model), compute)
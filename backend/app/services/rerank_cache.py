@@ -0,0 +1,89 @@
+import hashlib
+import logging
+from typing import Dict, List, Optional
+from ..cache import LRUCache, TieredCache, make_key
+from ..config import settings
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class RerankScoreCache:
+    """
+    Cache for rerank relevance scores per (query, chunk, rerank model).
+
+    Cohere scores every document against the query on its own, so a score
+    computed in an earlier rerank call is the same score a full rerank would
+    return now. The key also holds a hash of the document text sent to the
+    reranker, so a re-indexed chunk is scored again.
+    """
+    _instance = None
+
+    def __init__(self):
+        self.cache = TieredCache(
+            "rerank_score",
+            max_entries=settings.RERANK_CACHE_MAX_ENTRIES,
+            ttl=settings.RERANK_CACHE_TTL,
+            shared_max_entries=settings.RERANK_CACHE_SHARED_MAX_ENTRIES
+        )
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    @staticmethod
+    def get_key(query: str, chunk_id, document: str, model: str) -> str:
+        document_hash = hashlib.sha256(document.encode("utf-8")).hexdigest()
+        return make_key("rerank_score", model, query, str(chunk_id), document_hash)
+
+    def get_scores(self, keys: List[str]) -> List[Optional[float]]:
+        if not settings.RERANK_CACHE_ENABLED:
+            return [None] * len(keys)
+        return [self.cache.get(key) for key in keys]
+
+    def set_score(self, key: str, score: float):
+        if settings.RERANK_CACHE_ENABLED:
+            self.cache.set(key, score)
+
+
+class RerankDocumentCache:
+    """
+    Cache for the serialized form of chunks that is sent to the reranker.
+
+    The form only depends on the chunk payload and the token budget, so it is
+    built once per payload and RERANK_MAX_TOKENS instead of for every request.
+    Entries are keyed on a hash of the payload itself, so a re-indexed chunk
+    gets a new entry in every worker without a purge. Entries are cheap to
+    rebuild, so they are kept per worker only.
+    """
+    _instance = None
+
+    def __init__(self):
+        self.cache = LRUCache(
+            "rerank_document",
+            max_entries=settings.RERANK_DOCUMENT_CACHE_MAX_ENTRIES,
+            max_bytes=settings.RERANK_DOCUMENT_CACHE_MAX_BYTES,
+            sizeof=len
+        )
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    @staticmethod
+    def get_key(payload: Dict) -> str:
+        return make_key("rerank_document", settings.RERANK_MAX_TOKENS, payload)
+
+    def get(self, key: str) -> Optional[str]:
+        if not settings.RERANK_DOCUMENT_CACHE_ENABLED:
+            return None
+        return self.cache.get(key)
+
+    def set(self, key: str, document: str):
+        if settings.RERANK_DOCUMENT_CACHE_ENABLED:
+            self.cache.set(key, document)
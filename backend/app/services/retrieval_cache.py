@@ -0,0 +1,106 @@
+import copy
+import logging
+import re
+from datetime import date
+from typing import Awaitable, Callable, Dict, List, Optional
+from ..cache import CacheGeneration, TieredCache, make_key
+from ..config import settings
+from ..schemas import Location
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Every setting that changes which documents retrieval returns is part of the key
+RETRIEVAL_SETTINGS_PATTERN = re.compile(r"^(QDRANT_\w+_LIMIT|QDRANT_PLANNER_(?!COUNT_)\w+|RERANK_(?!CACHE_|DOCUMENT_CACHE_)\w+|MMR_\w+)$")
+RETRIEVAL_MODEL_SETTINGS = (
+    "QDRANT_COLLECTION",
+    "COHERE_EMBED_MODEL",
+    "COHERE_RERANK_MODEL",
+    "SPARSE_EMBED_MODEL",
+    "EMBEDDING_QUANTIZATION"
+)
+
+
+class RetrievalCache:
+    """
+    Cache for the final documents of retrieve_relevant_documents, keyed on the
+    rewritten query, the location filter, the date range and the retrieval
+    settings. Hybrid search, rerank and MMR are deterministic for those inputs
+    until the corpus changes, so after an index update purge() bumps the
+    retrieval generation, which is also part of the key.
+    """
+    _instance = None
+
+    def __init__(self):
+        self.cache = TieredCache(
+            "retrieval",
+            max_entries=settings.RETRIEVAL_CACHE_MAX_ENTRIES,
+            ttl=settings.RETRIEVAL_CACHE_TTL,
+            shared_max_entries=settings.RETRIEVAL_CACHE_SHARED_MAX_ENTRIES,
+            track_savings=True
+        )
+        self.generation = CacheGeneration("retrieval")
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    @staticmethod
+    def get_retrieval_settings() -> Dict:
+        values = settings.model_dump()
+        return {
+            name: value for name, value in values.items()
+            if RETRIEVAL_SETTINGS_PATTERN.match(name) or name in RETRIEVAL_MODEL_SETTINGS
+        }
+
+    def get_key(self, generation: str, query: str, locations: Optional[List[Location]], date_range: Optional[List[date]], group_by_document: bool = False) -> str:
+        return make_key("retrieval", generation, query, *self._filter_parts(locations, date_range, group_by_document))
+
+    def get_filter_key(self, locations: Optional[List[Location]], date_range: Optional[List[date]], group_by_document: bool = False) -> str:
+        """A key for everything except the query that determines the retrieved documents"""
+        return make_key("retrieval_filter", *self._filter_parts(locations, date_range, group_by_document))
+
+    def _filter_parts(self, locations: Optional[List[Location]], date_range: Optional[List[date]], group_by_document: bool) -> List:
+        return [
+            sorted(str(location.id) for location in locations or []),
+            [value.isoformat() for value in date_range or []],
+            group_by_document,
+            self.get_retrieval_settings()
+        ]
+
+    def get_or_compute(self, query: str, locations: Optional[List[Location]], date_range: Optional[List[date]], group_by_document: bool, compute: Callable[[], List[Dict]]) -> List[Dict]:
+        generation = self.get_generation()
+        if generation is None:
+            return compute()
+        # Empty results aren't cached (None is never stored), the corpus may just not cover the query yet
+        documents = self.cache.get_or_compute(self.get_key(generation, query, locations, date_range, group_by_document), lambda: compute() or None)
+        # Callers own the returned documents, so they can't change the cached ones
+        return copy.deepcopy(documents) if documents else []
+
+    async def get_or_compute_async(self, query: str, locations: Optional[List[Location]], date_range: Optional[List[date]], group_by_document: bool, compute: Callable[[], Awaitable[List[Dict]]]) -> List[Dict]:
+        generation = await self.get_generation_async()
+        if generation is None:
+            return await compute()
+        async def compute_or_none():
+            return await compute() or None
+
+        documents = await self.cache.get_or_compute_async(self.get_key(generation, query, locations, date_range, group_by_document), compute_or_none)
+        return copy.deepcopy(documents) if documents else []
+
+    def get_generation(self) -> Optional[str]:
+        if not settings.RETRIEVAL_CACHE_ENABLED:
+            return None
+        return self.generation.get()
+
+    async def get_generation_async(self) -> Optional[str]:
+        if not settings.RETRIEVAL_CACHE_ENABLED:
+            return None
+        return await self.generation.get_async()
+
+    def purge(self):
+        """Drop every cached retrieval result, in all workers"""
+        self.generation.bump()
+        self.cache.clear()
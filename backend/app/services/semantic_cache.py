@@ -0,0 +1,192 @@
+import copy
+import logging
+import threading
+import time
+import numpy as np
+from collections import OrderedDict
+from datetime import date
+from typing import Dict, List, Optional, Tuple
+from ..config import settings
+from ..schemas import Location
+from .retrieval_cache import RetrievalCache
+from .. import metrics
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def normalize_vector(vector) -> Optional[np.ndarray]:
+    """The vector as unit-length float32, so a dot product is the cosine similarity"""
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    if norm == 0:
+        return None
+    return vector / norm
+
+
+class _SemanticBucket:
+    """The cached queries for one filter combination, kept as one matrix so a lookup is a single matrix-vector product"""
+
+    def __init__(self, dimensions: int):
+        self.vectors = np.empty((0, dimensions), dtype=np.float32)
+        self.queries: List[str] = []
+        self.documents: List[List[Dict]] = []
+        self.expires_at: List[float] = []
+
+    def __len__(self) -> int:
+        return len(self.queries)
+
+    def best_match(self, vector: np.ndarray) -> Tuple[int, float]:
+        if not self.queries:
+            return -1, 0.0
+        similarities = self.vectors @ vector
+        index = int(np.argmax(similarities))
+        return index, float(similarities[index])
+
+    def add(self, query: str, vector: np.ndarray, documents: List[Dict], expires_at: float):
+        self.vectors = np.vstack([self.vectors, vector[np.newaxis, :]])
+        self.queries.append(query)
+        self.documents.append(documents)
+        self.expires_at.append(expires_at)
+
+    def drop_oldest(self, count: int = 1):
+        # Entries are added in time order with the same TTL, so the oldest expire first
+        self.vectors = self.vectors[count:]
+        del self.queries[:count]
+        del self.documents[:count]
+        del self.expires_at[:count]
+
+    def expired_count(self, now: float) -> int:
+        count = 0
+        while count < len(self.expires_at) and self.expires_at[count] <= now:
+            count += 1
+        return count
+
+
+class SemanticQueryCache:
+    """
+    Cache that reuses the retrieval result of an earlier query when a new query
+    with the same filters is close to it in embedding space, e.g. "regels
+    zonnepanelen Almere" and "zonnepanelen regels gemeente Almere".
+
+    Entries are grouped per filter combination (locations, date range and the
+    retrieval settings), each group an in-memory matrix of normalized dense
+    query embeddings. A lookup is one matrix-vector product over the queries
+    with the same filters. Entries are per worker, expire after
+    SEMANTIC_CACHE_TTL and are dropped when the retrieval cache is purged.
+    Use `python -m app.semantic_cache_cli` to tune the similarity threshold
+    against logged queries.
+    """
+    _instance = None
+
+    def __init__(self):
+        self._buckets: "OrderedDict[str, _SemanticBucket]" = OrderedDict()
+        self._entries = 0
+        self._generation = None
+        self._lock = threading.Lock()
+        self._lookups = 0
+        self._hits = 0
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    @property
+    def enabled(self) -> bool:
+        return settings.SEMANTIC_CACHE_ENABLED
+
+    def lookup(self, query: str, dense_vector, locations: Optional[List[Location]], date_range: Optional[List[date]], group_by_document: bool = False) -> Optional[List[Dict]]:
+        vector = normalize_vector(dense_vector)
+        if vector is None or not self._sync_generation():
+            return None
+
+        filter_key = RetrievalCache.get_instance().get_filter_key(locations, date_range, group_by_document)
+        with self._lock:
+            bucket = self._buckets.get(filter_key)
+            index, similarity = -1, 0.0
+            if bucket is not None and self._drop_expired(filter_key, bucket, time.time()):
+                self._buckets.move_to_end(filter_key)
+                if bucket.vectors.shape[1] == vector.shape[0]:
+                    index, similarity = bucket.best_match(vector)
+            hit = index >= 0 and similarity >= settings.SEMANTIC_CACHE_SIMILARITY_THRESHOLD
+            documents = bucket.documents[index] if hit else None
+            cached_query = bucket.queries[index] if hit else None
+            self._record_lookup(hit)
+
+        if not hit:
+            return None
+
+        metrics.observe("semantic_cache.hit_similarity", similarity)
+        logger.info(f"Reusing documents of '{cached_query}' for '{query}' (similarity {similarity:.3f})")
+        # Callers own the returned documents, so they can't change the cached ones
+        return copy.deepcopy(documents)
+
+    def add(self, query: str, dense_vector, locations: Optional[List[Location]], date_range: Optional[List[date]], documents: List[Dict], group_by_document: bool = False):
+        vector = normalize_vector(dense_vector)
+        if vector is None or not documents or not self._sync_generation():
+            return
+
+        filter_key = RetrievalCache.get_instance().get_filter_key(locations, date_range, group_by_document)
+        documents = copy.deepcopy(documents)
+        with self._lock:
+            bucket = self._buckets.get(filter_key)
+            if bucket is None or bucket.vectors.shape[1] != vector.shape[0]:
+                if bucket is not None:
+                    self._entries -= len(bucket)
+                bucket = self._buckets[filter_key] = _SemanticBucket(vector.shape[0])
+            self._buckets.move_to_end(filter_key)
+            bucket.add(query, vector, documents, time.time() + settings.SEMANTIC_CACHE_TTL)
+            self._entries += 1
+            self._evict()
+            metrics.set_gauge("semantic_cache.entries", self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+            self._entries = 0
+            metrics.set_gauge("semantic_cache.entries", 0)
+
+    def _sync_generation(self) -> bool:
+        """Drop every entry when the retrieval cache was purged, returns False when the cache should be bypassed"""
+        generation = RetrievalCache.get_instance().generation.get()
+        if generation is None:
+            return False
+        if generation != self._generation:
+            if self._generation is not None:
+                logger.info("Retrieval cache was purged, clearing semantic query cache")
+            self.clear()
+            self._generation = generation
+        return True
+
+    def _drop_expired(self, filter_key: str, bucket: _SemanticBucket, now: float) -> bool:
+        """Drop the expired entries of a bucket, returns False when none are left and the bucket was removed"""
+        expired = bucket.expired_count(now)
+        if expired:
+            bucket.drop_oldest(expired)
+            self._entries -= expired
+        if not len(bucket):
+            del self._buckets[filter_key]
+            return False
+        return True
+
+    def _evict(self):
+        # Drop the oldest entry of the least recently used filter combination
+        while self._entries > settings.SEMANTIC_CACHE_MAX_ENTRIES and self._buckets:
+            filter_key, bucket = next(iter(self._buckets.items()))
+            if len(bucket):
+                bucket.drop_oldest()
+                self._entries -= 1
+            if not len(bucket):
+                del self._buckets[filter_key]
+
+    def _record_lookup(self, hit: bool):
+        self._lookups += 1
+        if hit:
+            self._hits += 1
+            metrics.increment("semantic_cache.hits")
+        else:
+            metrics.increment("semantic_cache.misses")
+        metrics.set_gauge("semantic_cache.reuse_rate", self._hits / self._lookups)
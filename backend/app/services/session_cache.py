@@ -0,0 +1,91 @@
+import logging
+import time
+import sqlite3
+from typing import Optional
+from ..cache import SharedCache, TieredCache, make_key
+from ..config import settings
+from .. import metrics
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class SessionCache:
+    """
+    Cache for rendered GET /sessions/{id} responses.
+
+    Every session has a version token in the shared SQLite tier, which every
+    write to the session or its feedback replaces (invalidate). The rendered
+    response is cached under an ETag built from that version and the versions
+    of the other content it holds, so a write in any worker makes the cached
+    response and the ETags held by browsers stale at once. Without
+    SHARED_CACHE_PATH workers can't see each other's writes, so the cache is
+    disabled.
+    """
+    _instance = None
+
+    def __init__(self):
+        self.cache = TieredCache(
+            "session",
+            max_entries=settings.SESSION_CACHE_MAX_ENTRIES,
+            ttl=settings.SESSION_CACHE_TTL,
+            shared_max_entries=settings.SESSION_CACHE_SHARED_MAX_ENTRIES,
+            dumps=lambda body: body,
+            loads=lambda body: body,
+            max_bytes=settings.SESSION_CACHE_MAX_BYTES,
+            sizeof=len
+        )
+        self.versions = None
+        if settings.SHARED_CACHE_PATH:
+            self.versions = SharedCache("session_version", settings.SHARED_CACHE_PATH, settings.SESSION_VERSIONS_MAX_ENTRIES)
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    @property
+    def enabled(self) -> bool:
+        return settings.SESSION_CACHE_ENABLED and self.versions is not None
+
+    def get_version(self, session_id: str) -> Optional[str]:
+        """The current version of a session, or None when the cache should be bypassed"""
+        if not self.enabled:
+            return None
+        try:
+            version = self.versions.lookup(session_id)
+        except sqlite3.Error as e:
+            logger.warning(f"Error reading version of session {session_id}: {e}")
+            return None
+        if version is None:
+            # Never reuse an old token for a session whose version was evicted
+            return self.invalidate(session_id)
+        return version.decode("ascii")
+
+    def invalidate(self, session_id: str) -> Optional[str]:
+        if self.versions is None or not session_id:
+            return None
+        version = f"{time.time_ns()}"
+        self.versions.set(str(session_id), version.encode("ascii"))
+        return version
+
+    @staticmethod
+    def get_etag(*versions: str) -> str:
+        return make_key("session", *versions)[:32]
+
+    def get(self, etag: str) -> Optional[bytes]:
+        return self.cache.get(etag)
+
+    def set(self, etag: str, body: bytes):
+        self.cache.set(etag, body)
+
+    def record_not_modified(self, etag: str):
+        metrics.increment("session_cache.not_modified")
+        body = self.cache.local.get(etag)
+        if body is not None:
+            metrics.increment("session_cache.bytes_saved", len(body))
+
+    def record_reused(self, body: bytes):
+        metrics.increment("session_cache.bytes_reused", len(body))
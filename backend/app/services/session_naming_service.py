@@ -0,0 +1,150 @@
+import asyncio
+import logging
+from typing import Optional
+from ..config import settings
+from ..database import SessionLocal
+from ..schemas import ChatMessage
+from ..concurrency import run_blocking
+from .. import metrics
+from .base_llm_service import BaseLLMService
+from .session_service import SessionService
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class SessionNamingJob:
+    def __init__(self, session_id: str, user_message: ChatMessage, llm_service: BaseLLMService):
+        self.session_id = session_id
+        self.user_message = user_message
+        self.llm_service = llm_service
+        self.attempt = 0
+        self.result = asyncio.get_running_loop().create_future()
+
+
+class SessionNamingService:
+    """
+    Names chat sessions with the LLM in the background, so the extra Cohere call
+    is not part of the user-visible latency of a first turn. Until the LLM name
+    arrives, the session carries a cheap local name based on the user query.
+    """
+    _instance = None
+
+    FALLBACK_NAME_WORDS = 6
+
+    def __init__(self):
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers = []
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    @classmethod
+    def get_fallback_name(cls, user_query: str, max_length: int = 250) -> str:
+        """Use the first words of the user query as a session name"""
+        words = user_query.split()
+        name = " ".join(words[:cls.FALLBACK_NAME_WORDS])
+        if len(words) > cls.FALLBACK_NAME_WORDS:
+            name += "..."
+        return name[:max_length]
+
+    def start(self):
+        """Start the worker tasks on the running event loop"""
+        if self._queue is not None:
+            return
+
+        self._queue = asyncio.Queue(maxsize=settings.SESSION_NAMING_QUEUE_SIZE)
+        self._workers = [
+            asyncio.ensure_future(self._worker())
+            for _ in range(settings.SESSION_NAMING_WORKERS)
+        ]
+        logger.info(f"Started {len(self._workers)} session naming workers")
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._queue = None
+
+    def enqueue(self, session_id: str, user_message: ChatMessage, llm_service: BaseLLMService) -> Optional[asyncio.Future]:
+        """
+        Queue a session for naming. Returns a future that resolves to the new name,
+        or None when the queue is full and the session keeps its fallback name.
+        """
+        self.start()
+
+        job = SessionNamingJob(session_id, user_message, llm_service)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            logger.warning(f"Session naming queue is full, keeping fallback name for session {session_id}")
+            metrics.increment("session_naming.dropped")
+            return None
+
+        metrics.set_gauge("session_naming.queue_depth", self._queue.qsize())
+        return job.result
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            metrics.set_gauge("session_naming.queue_depth", self._queue.qsize())
+            try:
+                await self._process(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Unexpected error naming session {job.session_id}: {e}", exc_info=True)
+            finally:
+                self._queue.task_done()
+
+    async def _process(self, job: SessionNamingJob):
+        job.attempt += 1
+        try:
+            with metrics.timed("session_naming.llm_seconds"):
+                name = await job.llm_service.create_chat_session_name_async(job.user_message)
+            if not name:
+                raise ValueError("LLM returned an empty session name")
+
+            await run_blocking(self._update_session_name, job.session_id, name)
+        except Exception as e:
+            if job.attempt < settings.SESSION_NAMING_MAX_ATTEMPTS:
+                delay = settings.SESSION_NAMING_RETRY_DELAY * 2 ** (job.attempt - 1)
+                logger.warning(f"Naming session {job.session_id} failed (attempt {job.attempt}), retrying in {delay}s: {e}")
+                metrics.increment("session_naming.retries")
+                asyncio.get_running_loop().call_later(delay, self._requeue, job)
+            else:
+                logger.error(f"Naming session {job.session_id} failed after {job.attempt} attempts: {e}")
+                metrics.increment("session_naming.failed")
+                self._finish(job, None)
+            return
+
+        logger.info(f"Named session {job.session_id}: {name}")
+        metrics.increment("session_naming.completed")
+        self._finish(job, name)
+
+    def _requeue(self, job: SessionNamingJob):
+        if self._queue is None:
+            return
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            logger.warning(f"Session naming queue is full, giving up on session {job.session_id}")
+            metrics.increment("session_naming.dropped")
+            self._finish(job, None)
+
+    def _finish(self, job: SessionNamingJob, name: Optional[str]):
+        if not job.result.done():
+            job.result.set_result(name)
+
+    @staticmethod
+    def _update_session_name(session_id: str, name: str):
+        db = SessionLocal()
+        try:
+            SessionService(db).update_session_name(session_id=session_id, name=name)
+        finally:
+            db.close()
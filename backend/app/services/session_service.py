@@ -7,6 +7,7 @@ import logging
 from typing import List, Dict
 from datetime import datetime
 from sqlalchemy.orm import joinedload
+from .session_cache import SessionCache
 
 
 # Set up logging
@@ -38,6 +39,7 @@ class SessionService(DatabaseService):
             raise HTTPException(status_code=404, detail="Session not found")
         db_session.name = name
         self.db.commit()
+        self._invalidate(session_id)
         self.db.refresh(db_session)
         
         return self._session_db_model_to_schema(db_session)
@@ -53,6 +55,7 @@ class SessionService(DatabaseService):
         if db_session is None:
             raise HTTPException(status_code=404, detail="Session not found")
         self.db.delete(db_session)
+        self._invalidate(session_id)
     
     def get_messages(self, session: Session) -> List[ChatMessage]:
         # Query messages with feedback relationship eagerly loaded
@@ -85,6 +88,7 @@ class SessionService(DatabaseService):
         
         db_session.messages.append(db_message)
         self.db.commit()
+        self._invalidate(session_id)
         self.db.refresh(db_session, ['messages'])        
   
         return self._session_db_model_to_schema(db_session)
@@ -95,6 +99,7 @@ class SessionService(DatabaseService):
         db_session.messages.append(db_message)
 
         self.db.commit()
+        self._invalidate(session_id)
         self.db.refresh(db_session, ['messages'])    
         
         logger.info(f"Added message with id: {db_message.id}")
@@ -105,6 +110,7 @@ class SessionService(DatabaseService):
         db_messages = self._messages_schema_to_db_model(messages)
         db_session.messages.extend(db_messages)
         self.db.commit()
+        self._invalidate(session_id)
         self.db.refresh(db_session, ['messages'])
         return self._session_db_model_to_schema(db_session)
 
@@ -122,8 +128,42 @@ class SessionService(DatabaseService):
         
         self.db.commit()
         self.db.refresh(db_message)
+        self._invalidate(db_message.session_id)
         return self._message_db_model_to_schema(db_message)
     
+    def save_turn(self, session_id: str, new_messages: List[ChatMessage], updated_messages: List[ChatMessage] = None, name: str = None):
+        """Persist the messages, message updates and session name of a chat turn in one transaction"""
+        try:
+            db_session = self._get_session(session_id)
+
+            sequence = len(db_session.messages)
+            for message in new_messages:
+                db_session.messages.append(self._message_schema_to_db_model(message, sequence))
+                sequence += 1
+
+            for message in updated_messages or []:
+                db_message = self.db.query(Message)\
+                    .filter(Message.id == message.id)\
+                    .first()
+                if db_message is None:
+                    raise HTTPException(status_code=404, detail="Message not found")
+                db_message.content = message.content
+                db_message.formatted_content = message.formatted_content
+
+            if name is not None:
+                db_session.name = name
+
+            self.db.commit()
+        except Exception:
+            self.db.rollback()
+            raise
+        self._invalidate(session_id)
+
+    @staticmethod
+    def _invalidate(session_id: str):
+        """Make the cached renderings of the session stale, after every write"""
+        SessionCache.get_instance().invalidate(session_id)
+
     def _get_session(self, session_id: str) -> SessionModel:
         db_session = self.db.query(SessionModel)\
             .options(joinedload(SessionModel.messages))\
@@ -225,7 +265,8 @@ class SessionService(DatabaseService):
         return SearchFilter(
             locations=db_search_filters.get("locations", []),
             date_range=db_search_filters.get("date_range", []),
-            rewrite_query=db_search_filters.get("rewrite_query", True)
+            rewrite_query=db_search_filters.get("rewrite_query", True),
+            group_by_document=db_search_filters.get("group_by_document", False)
         )
      
     # Convert schemas to DB models
@@ -286,7 +327,8 @@ class SessionService(DatabaseService):
         return {
             "locations": self._locations_to_db_model(search_filters.locations),
             "date_range": [date.isoformat() for date in search_filters.date_range] if search_filters.date_range else [],
-            "rewrite_query": search_filters.rewrite_query
+            "rewrite_query": search_filters.rewrite_query,
+            "group_by_document": search_filters.group_by_document
         }
         
     def _locations_to_db_model(self, locations: List[Location]):
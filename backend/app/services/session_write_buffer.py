@@ -0,0 +1,93 @@
+import logging
+import threading
+from typing import List, Optional
+from ..schemas import ChatMessage, Session
+from .. import metrics
+from .session_service import SessionService
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class SessionWriteBuffer:
+    """
+    Write-behind buffer for the database writes of a single chat turn.
+
+    The turn adds and updates its messages in memory, so the LLM stream can
+    start without waiting for MySQL, and flush() persists everything in one
+    transaction when the turn completes or is aborted.
+    """
+
+    def __init__(self, session_service: SessionService, session: Session):
+        self.session_service = session_service
+        self.session = session
+        self._new_messages: List[ChatMessage] = []
+        self._updated_messages: List[ChatMessage] = []
+        self._session_name: Optional[str] = None
+        self._lock = threading.Lock()
+
+    def add_message(self, message: ChatMessage) -> Session:
+        return self.add_messages([message])
+
+    def add_messages(self, messages: List[ChatMessage]) -> Session:
+        """Buffer new messages and return the session as it will look after the flush"""
+        with self._lock:
+            self._new_messages.extend(messages)
+        self.session = Session(
+            id=self.session.id,
+            name=self.session.name,
+            messages=self.session.messages + list(messages),
+        )
+        return self.session
+
+    def update_message(self, message: ChatMessage) -> ChatMessage:
+        """
+        Buffered messages are persisted in their final state, so updates to those
+        are free. Updates to messages that already exist are applied on flush.
+        """
+        with self._lock:
+            if not any(message is buffered for buffered in self._new_messages):
+                if message.id is None:
+                    raise ValueError("Cannot update a message that was never added")
+                self._updated_messages.append(message)
+        return message
+
+    def update_session_name(self, name: str):
+        with self._lock:
+            self._session_name = name
+        self.session.name = name
+
+    @property
+    def has_pending_writes(self) -> bool:
+        return bool(self._new_messages or self._updated_messages or self._session_name is not None)
+
+    def flush(self):
+        """Persist all buffered writes in a single transaction"""
+        with self._lock:
+            if not self.has_pending_writes:
+                return
+
+            new_messages, self._new_messages = self._new_messages, []
+            updated_messages, self._updated_messages = self._updated_messages, []
+            session_name, self._session_name = self._session_name, None
+
+            try:
+                with metrics.timed("session_write_buffer.flush_seconds"):
+                    self.session_service.save_turn(
+                        session_id=self.session.id,
+                        new_messages=new_messages,
+                        updated_messages=updated_messages,
+                        name=session_name
+                    )
+            except Exception:
+                metrics.increment("session_write_buffer.failed_flushes")
+                # Keep the writes so a later flush can retry them
+                self._new_messages = new_messages + self._new_messages
+                self._updated_messages = updated_messages + self._updated_messages
+                if self._session_name is None:
+                    self._session_name = session_name
+                raise
+
+        logger.info(f"Flushed {len(new_messages)} new and {len(updated_messages)} updated messages for session {self.session.id}")
+        metrics.increment("session_write_buffer.flushes")
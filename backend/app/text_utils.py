@@ -1,5 +1,6 @@
 from datetime import datetime
-import locale
+from functools import lru_cache
+import calendar
 import markdown
 import logging
 import re
@@ -8,6 +9,20 @@ import re
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Fixed name tables instead of locale.setlocale, which is process-global and not thread-safe.
+# They match strftime('%A, %d %B %Y') under the en_US.UTF-8 and nl_NL.UTF-8 locales.
+DAY_NAMES = {
+    "en": ("Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"),
+    "nl": ("maandag", "dinsdag", "woensdag", "donderdag", "vrijdag", "zaterdag", "zondag"),
+}
+MONTH_NAMES = {
+    "en": ("", "January", "February", "March", "April", "May", "June", "July", "August", "September", "October", "November", "December"),
+    "nl": ("", "januari", "februari", "maart", "april", "mei", "juni", "juli", "augustus", "september", "oktober", "november", "december"),
+}
+INVALID_DATE = "Invalid date format"
+# Words and punctuation marks, a rough approximation of subword tokens that needs no tokenizer
+TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+
 def get_formatted_current_date_dutch():
     return get_formatted_date_dutch(datetime.now())
 
@@ -15,44 +30,43 @@ def get_formatted_current_date_english():
     return get_formatted_date_english(datetime.now())
 
 def get_formatted_date_english(date):
-    logger.debug(f"Formatting date EN: {date}")
-    
-    if isinstance(date, str):
-        try:
-            date = datetime.fromisoformat(date)
-        except ValueError:
-            # If the string is not in ISO format, you might need to specify the format
-            # date = datetime.strptime(date, '%Y-%m-%d')
-            return "Invalid date format"
-            
-    try:
-        locale.setlocale(locale.LC_TIME, 'en_US.UTF-8')
-    except locale.Error:
-        logger.warning("Failed to set locale to en_US.UTF-8.")
-
-    
-    return date.strftime('%A, %d %B %Y')
+    logger.debug("Formatting date EN: %s", date)
+    return _format_date(date, "en")
 
 def get_formatted_current_year():
     return datetime.now().year
 
 def get_formatted_date_dutch(date):
-    logger.debug(f"Formatting date NL: {date}")
-    
+    logger.debug("Formatting date NL: %s", date)
+    return _format_date(date, "nl")
+
+def _format_date(date, language):
     if isinstance(date, str):
-        try:
-            date = datetime.fromisoformat(date)
-        except ValueError:
-            # If the string is not in ISO format, you might need to specify the format
-            # date = datetime.strptime(date, '%Y-%m-%d')
-            return "Invalid date format"
-        
+        return _format_iso_date(date, language)
+    return _format_day(date.year, date.month, date.day, language)
+
+@lru_cache(maxsize=8192)
+def _format_iso_date(value, language):
+    # Publication dates repeat across candidates and requests, so each string is parsed once
     try:
-        locale.setlocale(locale.LC_TIME, 'nl_NL.UTF-8')
-    except locale.Error:
-        logger.warning("Failed to set locale to nl_NL.UTF-8.")
+        date = datetime.fromisoformat(value)
+    except ValueError:
+        return INVALID_DATE
+    return _format_day(date.year, date.month, date.day, language)
 
-    return date.strftime('%A, %d %B %Y')
+@lru_cache(maxsize=8192)
+def _format_day(year, month, day, language):
+    weekday = calendar.weekday(year, month, day)
+    return f"{DAY_NAMES[language][weekday]}, {day:02d} {MONTH_NAMES[language][month]} {year}"
+
+def truncate_to_token_budget(text, max_tokens):
+    """Cut text after max_tokens words and punctuation marks, or return it as is when max_tokens is 0"""
+    if not text or max_tokens <= 0:
+        return text
+    for count, token in enumerate(TOKEN_PATTERN.finditer(text), 1):
+        if count == max_tokens:
+            return text[:token.end()]
+    return text
 
 def to_markdown(text):
     # Replace single line bullet points with properly formatted ones
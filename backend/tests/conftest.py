@@ -0,0 +1,39 @@
+import os
+import tempfile
+
+# app.config reads these when it is imported. Real values come from .env in
+# the containers, the tests only need something that parses.
+TEST_ENVIRONMENT = {
+    "ENVIRONMENT": "test",
+    "DATABASE_URL": f"sqlite:///{os.path.join(tempfile.gettempdir(), 'bron-test.db')}",
+    "ALLOWED_ORIGINS": "http://localhost",
+    "ADMIN_TOKEN": "test-admin-token",
+    "COHERE_API_KEY": "test",
+    "COHERE_EMBED_MODEL": "embed-multilingual-v3.0",
+    "COHERE_RERANK_MODEL": "rerank-multilingual-v3.0",
+    "SPARSE_EMBED_MODEL": "Qdrant/bm25",
+    "EMBEDDING_QUANTIZATION": "float",
+    "QDRANT_COLLECTION": "test",
+    "QDRANT_LOCATION": ":memory:",
+    "QDRANT_HYBRID_SEARCH_TIMEOUT": "10",
+    "QDRANT_SPARSE_RETRIEVE_LIMIT": "100",
+    "QDRANT_DENSE_RETRIEVE_LIMIT": "100",
+    "QDRANT_HYBRID_RETRIEVE_LIMIT": "100",
+    "RERANK_DOC_RETRIEVE_LIMIT": "20",
+    "MMR_DOC_RETRIEVE_LIMIT": "10",
+    "RERANK_RELEVANCE_THRESHOLD": "0.1",
+    "MMR_DOC_LAMBDA_PARAM": "0.7",
+    "QDRANT_POOL_SIZE": "2",
+    "QDRANT_POOL_TIMEOUT": "2",
+    "QDRANT_TIMEOUT": "5",
+    "SENTRY_DSN": "",
+    "OTEL_EXPORTER_OTLP_HEADER": "",
+    "PHOENIX_CLIENT_HEADERS": "",
+    "PHOENIX_COLLECTOR_ENDPOINT": "",
+    "PHOENIX_TRACER_ENDPOINT": "",
+    "PHOENIX_PROJECT_NAME": "",
+    "LITELLM_LOCAL_MODEL_COST_MAP": "True",
+}
+
+for name, value in TEST_ENVIRONMENT.items():
+    os.environ.setdefault(name, value)
@@ -0,0 +1,148 @@
+import threading
+import time
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+from app.schemas import ChatMessage, MessageRole, MessageType, Session
+from app.services.base_llm_service import BaseLLMService
+
+
+def make_session(session_id: str = "session-1", with_history: bool = True) -> Session:
+    """A session that already has a turn, so the chat turn doesn't name it"""
+    messages = []
+    if with_history:
+        messages = [
+            ChatMessage(id=1, role=MessageRole.SYSTEM, message_type=MessageType.SYSTEM_MESSAGE, content="system"),
+            ChatMessage(id=2, role=MessageRole.USER, message_type=MessageType.USER_MESSAGE, content="eerdere vraag"),
+        ]
+    return Session(id=session_id, name="Bestaande sessie", messages=messages)
+
+
+def make_documents(count: int = 2) -> List[Dict]:
+    return [
+        {
+            "chunk_id": f"chunk-{idx}",
+            "score": 1.0 - idx / 10,
+            "data": {
+                "title": f"Document {idx}",
+                "content": f"Inhoud van document {idx}",
+                "published": "2024-01-01T00:00:00",
+                "location_name": "Amsterdam",
+                "source": "poliflw",
+                "type": "nieuws",
+            },
+        }
+        for idx in range(count)
+    ]
+
+
+def content_delta(text: str):
+    return SimpleNamespace(
+        type="content-delta",
+        delta=SimpleNamespace(message=SimpleNamespace(content=SimpleNamespace(text=text)))
+    )
+
+
+class FakeSessionService:
+    """In-memory stand-in for SessionService that records every call"""
+
+    def __init__(self, session: Optional[Session] = None, fail_saves: int = 0):
+        self.session = session or make_session()
+        self.fail_saves = fail_saves
+        self.calls: List[str] = []
+        self.saved_turns: List[Dict] = []
+        self._next_id = 100
+
+    def get_session_with_relations(self, session_id: str) -> Session:
+        self.calls.append("get_session_with_relations")
+        return self.session.model_copy(deep=True)
+
+    def get_documents(self, session: Session) -> List:
+        self.calls.append("get_documents")
+        return []
+
+    def save_turn(self, session_id: str, new_messages: List[ChatMessage], updated_messages: List[ChatMessage] = None, name: str = None):
+        self.calls.append("save_turn")
+        if self.fail_saves:
+            self.fail_saves -= 1
+            raise RuntimeError("database unavailable")
+
+        for message in new_messages:
+            message.id = self._next_id
+            self._next_id += 1
+        self.saved_turns.append({
+            "new_messages": [message.model_copy(deep=True) for message in new_messages],
+            "updated_messages": [message.model_copy(deep=True) for message in updated_messages or []],
+            "name": name,
+        })
+        self.session.messages = self.session.messages + [message.model_copy(deep=True) for message in new_messages]
+        if name is not None:
+            self.session.name = name
+
+    @property
+    def saved_messages(self) -> List[ChatMessage]:
+        return [message for turn in self.saved_turns for message in turn["new_messages"]]
+
+
+class FakeLLMService(BaseLLMService):
+    """
+    LLM service with a synchronous chat_stream, like the Cohere service.
+
+    Before the chunk at index block_at the stream blocks its thread
+    (time.sleep, like a slow Cohere response) until release() is called or
+    block_seconds pass. entered is set once the stream is blocked there.
+    """
+
+    def __init__(self, chunks: List[str] = None, block_at: Optional[int] = None, block_seconds: float = 5.0):
+        self.chunks = chunks or ["Het ", "antwoord."]
+        self.block_at = block_at
+        self.block_seconds = block_seconds
+        self.entered = threading.Event()
+        self.released = threading.Event()
+        self.finished = threading.Event()
+
+    def release(self):
+        self.released.set()
+
+    def chat_stream(self, messages: list, documents: list):
+        try:
+            for idx, chunk in enumerate(self.chunks):
+                if idx == self.block_at:
+                    self._block()
+                yield content_delta(chunk)
+        finally:
+            self.finished.set()
+
+    def _block(self):
+        self.entered.set()
+        deadline = time.monotonic() + self.block_seconds
+        while not self.released.is_set() and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def rerank_documents(self, query: str, documents: list, top_n: int = 20, return_documents: bool = True) -> Dict:
+        return {"results": []}
+
+    def generate_dense_embedding(self, query: str) -> List[float]:
+        return [0.0]
+
+    def create_chat_session_name(self, user_message: ChatMessage) -> str:
+        return "Sessienaam"
+
+    def rewrite_query_for_vector_base(self, message: ChatMessage) -> str:
+        return message.content
+
+    def rewrite_query_for_llm(self, message: ChatMessage) -> str:
+        return message.content
+
+    def rewrite_query_with_history_for_vector_base(self, message: ChatMessage, messages: list) -> str:
+        return message.content
+
+
+class FakeQdrantService:
+    def __init__(self, documents: List[Dict] = None):
+        self.documents = make_documents() if documents is None else documents
+
+    async def retrieve_relevant_documents_async(self, query: str, **kwargs) -> List[Dict]:
+        return self.documents
+
+    def reorder_documents_by_publication_date(self, documents: List[Dict]) -> List[Dict]:
+        return documents
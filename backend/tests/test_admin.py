@@ -0,0 +1,48 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from app.config import settings
+from app.routers import admin as admin_router
+from app.services.payload_cache import ChunkPayloadCache
+from app.services.query_planner import QueryPlanner
+from app.services.retrieval_cache import RetrievalCache
+from app.services.semantic_cache import SemanticQueryCache
+
+SINGLETONS = (RetrievalCache, SemanticQueryCache, ChunkPayloadCache, QueryPlanner)
+
+
+@pytest.fixture(autouse=True)
+def fresh_caches():
+    for cls in SINGLETONS:
+        cls._instance = None
+    yield
+    for cls in SINGLETONS:
+        cls._instance = None
+
+
+def purge():
+    app = FastAPI()
+    app.include_router(admin_router.router)
+    return TestClient(app).post(
+        admin_router.base_api_url + "admin/cache/purge",
+        headers={"X-Admin-Token": settings.ADMIN_TOKEN}
+    )
+
+
+def test_purge_without_shared_cache_reaches_one_worker(monkeypatch):
+    monkeypatch.setattr(settings, "SHARED_CACHE_PATH", "")
+    response = purge()
+    assert response.status_code == 200
+    assert response.json()["scope"] == "worker"
+
+
+def test_purge_with_shared_cache_reaches_every_worker(monkeypatch, tmp_path):
+    monkeypatch.setattr(settings, "SHARED_CACHE_PATH", str(tmp_path / "shared.sqlite3"))
+    generation = ChunkPayloadCache.get_instance().generation.get()
+
+    response = purge()
+    assert response.status_code == 200
+    assert response.json()["scope"] == "all_workers"
+    # A worker that starts now reads the bumped generation from the shared file
+    ChunkPayloadCache._instance = None
+    assert ChunkPayloadCache.get_instance().generation.get() != generation
@@ -0,0 +1,78 @@
+import asyncio
+import json
+import time
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from app.config import settings
+from app.routers import metrics as metrics_router
+from app.routers.chat import event_generator, release_from_any_thread
+from app.schemas import SearchFilter
+from app.services.admission_controller import AdmissionController
+from app.services.chat_turn_guard import ChatTurnGuard
+from app.services.session_naming_service import SessionNamingService
+from fakes import FakeLLMService, FakeQdrantService, FakeSessionService, make_session
+
+
+def test_slot_is_released_before_waiting_for_the_session_name(monkeypatch):
+    monkeypatch.setattr(settings, "SESSION_NAMING_STREAM_WAIT", 5.0)
+
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        name_future = loop.create_future()
+        # The LLM never comes back with a name, so the stream waits the full SESSION_NAMING_STREAM_WAIT
+        monkeypatch.setattr(SessionNamingService, "enqueue", lambda self, *args: name_future)
+
+        admission = AdmissionController(max_in_flight=1, max_queue=0)
+        session_service = FakeSessionService(session=make_session(with_history=False))
+        stream = event_generator(
+            session_service.session.id,
+            "Wat zijn de regels voor zonnepanelen?",
+            time.time(),
+            session_service,
+            FakeLLMService(),
+            FakeQdrantService(),
+            SearchFilter(),
+            ChatTurnGuard(),
+            await admission.admit("client"),
+        )
+
+        async for chunk in stream:
+            if json.loads(chunk.split("data: ", 1)[1])["type"] == "full":
+                break
+        assert admission.get_stats()["in_flight"] == 1
+
+        waiting_for_name = asyncio.ensure_future(stream.__anext__())
+        await asyncio.sleep(0.1)
+        assert not waiting_for_name.done()
+        assert admission.get_stats()["in_flight"] == 0
+
+        name_future.set_result("Zonnepanelen")
+        assert json.loads((await waiting_for_name).split("data: ", 1)[1])["name"] == "Zonnepanelen"
+        await stream.aclose()
+        assert admission.get_stats()["in_flight"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_finalizer_release_ignores_a_closed_loop():
+    admission = AdmissionController(max_in_flight=1, max_queue=0)
+    loop = asyncio.new_event_loop()
+    slot = loop.run_until_complete(admission.admit("client"))
+    loop.close()
+
+    # Must not raise "Event loop is closed" when the stream is collected after shutdown
+    release_from_any_thread(loop, slot)
+
+
+def test_metrics_require_the_admin_token():
+    app = FastAPI()
+    app.include_router(metrics_router.router)
+    client = TestClient(app)
+    url = metrics_router.base_api_url + "metrics"
+
+    assert client.get(url).status_code == 403
+    assert client.get(url, headers={"X-Admin-Token": "wrong"}).status_code == 403
+
+    response = client.get(url, headers={"X-Admin-Token": settings.ADMIN_TOKEN})
+    assert response.status_code == 200
+    assert isinstance(response.json(), dict)
@@ -0,0 +1,126 @@
+import asyncio
+import threading
+import time
+import pytest
+from app import metrics
+from app.cache import CacheGeneration, SharedCache, TieredCache
+from app.config import settings
+
+
+@pytest.fixture(autouse=True)
+def short_flight_timeout(monkeypatch):
+    monkeypatch.setattr(settings, "CACHE_FLIGHT_TIMEOUT", 0.1)
+
+
+def test_follower_computes_itself_when_the_flight_hangs():
+    cache = TieredCache("test_hung_flight", max_entries=10, shared=False)
+    leader_started = threading.Event()
+    release_leader = threading.Event()
+
+    def hung_compute():
+        leader_started.set()
+        release_leader.wait(5)
+        return "leader"
+
+    leader = threading.Thread(target=cache.get_or_compute, args=("key", hung_compute))
+    leader.start()
+    leader_started.wait(1)
+
+    assert cache.get_or_compute("key", lambda: "follower") == "follower"
+
+    release_leader.set()
+    leader.join(1)
+    assert cache.get("key") == "leader"
+
+
+def test_follower_still_gets_the_error_of_a_timed_out_flight(monkeypatch):
+    monkeypatch.setattr(settings, "CACHE_FLIGHT_TIMEOUT", 5)
+    cache = TieredCache("test_failed_flight", max_entries=10, shared=False)
+    leader_started = threading.Event()
+    fail_leader = threading.Event()
+    follower_errors = []
+
+    def failing_compute():
+        leader_started.set()
+        fail_leader.wait(5)
+        raise TimeoutError("upstream timed out")
+
+    def follow():
+        try:
+            cache.get_or_compute("key", lambda: "follower")
+        except TimeoutError as e:
+            follower_errors.append(e)
+
+    leader = threading.Thread(target=lambda: pytest.raises(TimeoutError, cache.get_or_compute, "key", failing_compute))
+    leader.start()
+    leader_started.wait(1)
+    follower = threading.Thread(target=follow)
+    follower.start()
+    # Fail the leader once the follower waits for its flight
+    while not metrics.snapshot()["counters"].get("cache.test_failed_flight.collapsed"):
+        time.sleep(0.01)
+    fail_leader.set()
+    leader.join(1)
+    follower.join(1)
+
+    assert [str(e) for e in follower_errors] == ["upstream timed out"]
+
+
+def test_async_follower_computes_itself_when_the_flight_hangs():
+    cache = TieredCache("test_hung_flight_async", max_entries=10, shared=False)
+
+    async def scenario():
+        release_leader = asyncio.Event()
+
+        async def hung_compute():
+            await release_leader.wait()
+            return "leader"
+
+        async def follower_compute():
+            return "follower"
+
+        leader = asyncio.ensure_future(cache.get_or_compute_async("key", hung_compute))
+        await asyncio.sleep(0)
+
+        assert await cache.get_or_compute_async("key", follower_compute) == "follower"
+        assert not leader.done()
+
+        release_leader.set()
+        assert await leader == "leader"
+
+    asyncio.run(scenario())
+
+
+def test_async_lookups_read_the_shared_tier_off_the_event_loop(monkeypatch, tmp_path):
+    monkeypatch.setattr(settings, "SHARED_CACHE_PATH", str(tmp_path / "cache.db"))
+    cache = TieredCache("test_shared_async", max_entries=10)
+    generation = CacheGeneration("test_shared_async")
+    shared_threads = []
+    lookup = SharedCache.lookup
+
+    def recording_lookup(self, key):
+        shared_threads.append(threading.current_thread())
+        return lookup(self, key)
+
+    monkeypatch.setattr(SharedCache, "lookup", recording_lookup)
+
+    async def compute():
+        return {"value": 1}
+
+    async def scenario():
+        loop_thread = threading.current_thread()
+        assert await cache.get_or_compute_async("key", compute) == {"value": 1}
+        assert await generation.get_async() == CacheGeneration.INITIAL
+        assert shared_threads and loop_thread not in shared_threads
+
+        # A local hit is served on the loop, without touching the shared tier
+        shared_threads.clear()
+        assert await cache.get_or_compute_async("key", compute) == {"value": 1}
+        assert shared_threads == []
+
+        # Another worker only has the shared tier
+        cache.local.clear()
+        assert await cache.get_async("key") == {"value": 1}
+        assert shared_threads and loop_thread not in shared_threads
+
+    asyncio.run(scenario())
@@ -0,0 +1,90 @@
+import asyncio
+import json
+import time
+from app.concurrency import iterate_blocking
+from app.routers.chat import event_generator
+from app.schemas import SearchFilter
+from app.services.admission_controller import AdmissionController
+from app.services.chat_turn_guard import ChatTurnGuard
+from fakes import FakeLLMService, FakeQdrantService, FakeSessionService
+
+
+def parse_event(chunk: str):
+    data = chunk.split("data: ", 1)[1]
+    return json.loads(data)
+
+
+async def start_stream(llm_service: FakeLLMService, admission: AdmissionController, client_id: str):
+    return event_generator(
+        "session-1",
+        "Wat zijn de regels voor zonnepanelen?",
+        time.time(),
+        FakeSessionService(),
+        llm_service,
+        FakeQdrantService(),
+        SearchFilter(),
+        ChatTurnGuard(),
+        await admission.admit(client_id),
+    )
+
+
+async def first_partial(stream) -> dict:
+    async for chunk in stream:
+        event = parse_event(chunk)
+        if event["type"] == "partial":
+            return event
+    raise AssertionError("stream ended without a partial answer")
+
+
+def test_blocked_llm_stream_does_not_stall_other_streams():
+    async def scenario():
+        admission = AdmissionController(max_in_flight=2, max_queue=0)
+        blocked_llm = FakeLLMService(chunks=["Eerste"], block_at=0)
+        free_llm = FakeLLMService(chunks=["Tweede"])
+
+        blocked_stream = await start_stream(blocked_llm, admission, "client-a")
+        free_stream = await start_stream(free_llm, admission, "client-b")
+
+        blocked_task = asyncio.ensure_future(first_partial(blocked_stream))
+        # Wait until the first stream's LLM call sits in its blocking sleep
+        while not blocked_llm.entered.is_set():
+            await asyncio.sleep(0.01)
+
+        partial = await asyncio.wait_for(first_partial(free_stream), timeout=2)
+        assert partial["content"] == "Tweede"
+        assert not blocked_llm.released.is_set()
+        assert not blocked_task.done()
+
+        blocked_llm.release()
+        assert (await asyncio.wait_for(blocked_task, timeout=2))["content"] == "Eerste"
+        await blocked_stream.aclose()
+        await free_stream.aclose()
+
+    asyncio.run(scenario())
+
+
+def test_iterate_blocking_runs_next_off_the_loop():
+    async def scenario():
+        blocked_llm = FakeLLMService(chunks=["a", "b"], block_at=0)
+        chunks = []
+
+        async def consume():
+            async for event in iterate_blocking(blocked_llm.chat_stream([], [])):
+                chunks.append(event.delta.message.content.text)
+
+        consumer = asyncio.ensure_future(consume())
+        while not blocked_llm.entered.is_set():
+            await asyncio.sleep(0.01)
+
+        # The loop keeps running timers while the iterator blocks its thread
+        started_at = time.monotonic()
+        await asyncio.sleep(0.05)
+        assert time.monotonic() - started_at < 0.5
+        assert not consumer.done()
+
+        blocked_llm.release()
+        await asyncio.wait_for(consumer, timeout=2)
+        assert chunks == ["a", "b"]
+        assert blocked_llm.finished.is_set()
+
+    asyncio.run(scenario())
@@ -0,0 +1,54 @@
+import numpy as np
+from app.services.dedup import deduplicate
+
+
+def test_exact_duplicates_ignore_case_and_whitespace():
+    contents = ["Regels voor  zonnepanelen", "Windmolens in Almere", "regels voor zonnepanelen\n"]
+
+    deduplication = deduplicate(contents)
+
+    assert deduplication.kept == [0, 1]
+    assert (deduplication.exact_duplicates, deduplication.near_duplicates) == (1, 0)
+
+
+def test_the_first_in_rank_order_is_kept():
+    contents = ["Kopie", "Origineel", "kopie", "origineel", "KOPIE"]
+
+    assert deduplicate(contents).kept == [0, 1]
+
+
+def test_near_duplicates_at_the_threshold_are_dropped():
+    similar = np.array([0.6, 0.8])
+    embeddings = np.array([[1.0, 0.0], similar, [0.0, -1.0]])
+    # Cosine similarity of the second candidate to the first, as deduplicate computes it
+    similarity = float(similar @ np.array([1.0, 0.0]) / np.linalg.norm(similar))
+
+    at_threshold = deduplicate(["a", "b", "c"], embeddings, similarity_threshold=similarity)
+    assert at_threshold.kept == [0, 2]
+    assert (at_threshold.exact_duplicates, at_threshold.near_duplicates) == (0, 1)
+
+    above_threshold = deduplicate(["a", "b", "c"], embeddings, similarity_threshold=float(np.nextafter(similarity, 1.0)))
+    assert above_threshold.kept == [0, 1, 2]
+
+
+def test_near_duplicates_are_compared_with_kept_candidates_only():
+    # The third candidate is close to the dropped second one (0.95), but not to the first (0.90)
+    embeddings = np.array([[1.0, 0.0], [0.99, (1 - 0.99 ** 2) ** 0.5], [0.9, (1 - 0.9 ** 2) ** 0.5]])
+
+    deduplication = deduplicate(["a", "b", "c"], embeddings, similarity_threshold=0.95)
+
+    assert deduplication.kept == [0, 2]
+    assert (deduplication.exact_duplicates, deduplication.near_duplicates) == (0, 1)
+
+
+def test_without_embeddings_only_exact_duplicates_are_dropped():
+    contents = ["Regels voor zonnepanelen", "Regels voor zonnepaneel", "REGELS VOOR ZONNEPANELEN"]
+
+    deduplication = deduplicate(contents, None)
+
+    assert deduplication.kept == [0, 1]
+    assert (deduplication.exact_duplicates, deduplication.near_duplicates) == (1, 0)
+
+
+def test_no_candidates():
+    assert deduplicate([], None).kept == []
@@ -0,0 +1,24 @@
+import numpy as np
+import pytest
+from app.benchmark_cli import legacy_cosine_similarity, legacy_mmr, random_candidates
+from app.services.mmr import mmr_select
+
+
+@pytest.mark.parametrize("dtype", [np.float32, np.uint8])
+@pytest.mark.parametrize("lambda_param", [0.0, 0.7, 1.0])
+def test_selection_matches_the_old_loop_with_near_duplicates(dtype, lambda_param):
+    for seed in range(20):
+        embeddings, relevance_scores = random_candidates(60, 32, seed)
+        if dtype is np.uint8:
+            embeddings = np.clip((embeddings + 2) * 64, 0, 255).astype(np.uint8)
+        # Exact duplicates and equal rerank scores, where only the tie-break decides
+        embeddings[1::7] = embeddings[0]
+        relevance_scores[1::7] = [relevance_scores[0]] * len(relevance_scores[1::7])
+
+        expected = legacy_mmr(relevance_scores, legacy_cosine_similarity(embeddings.tolist()), lambda_param, 12)
+        assert mmr_select(embeddings, relevance_scores, lambda_param, 12) == expected
+
+
+def test_empty_selection():
+    assert mmr_select(np.empty((0, 4)), [], 0.7, 10) == []
+    assert mmr_select(np.ones((3, 4)), [0.1, 0.2, 0.3], 0.7, 0) == []
@@ -0,0 +1,91 @@
+import asyncio
+import threading
+import uuid
+import pytest
+from qdrant_client import models
+from app.config import settings
+from app.schemas import ChatDocument
+from app.services.payload_cache import ChunkPayloadCache
+from app.services.qdrant_pool import AsyncQdrantConnectionPool
+from app.services.qdrant_service import QdrantService
+from fakes import FakeLLMService
+
+
+def make_payload(title: str):
+    return {
+        "content": f"Inhoud van {title}",
+        "meta": {
+            "source_id": title,
+            "doc_url": f"https://example.org/{title}",
+            "url": "",
+            "title": title,
+            "location": "GM0363",
+            "location_name": "Amsterdam",
+            "published": "2024-01-01T00:00:00",
+            "type": "nieuws",
+            "source": "poliflw",
+        },
+    }
+
+
+@pytest.fixture(autouse=True)
+def fresh_caches(monkeypatch, tmp_path):
+    monkeypatch.setattr(settings, "SHARED_CACHE_PATH", str(tmp_path / "shared.sqlite3"))
+    ChunkPayloadCache._instance = None
+    AsyncQdrantConnectionPool._instance = None
+    AsyncQdrantConnectionPool._instance_lock = None
+    yield
+    ChunkPayloadCache._instance = None
+    if AsyncQdrantConnectionPool._instance is not None:
+        asyncio.run(AsyncQdrantConnectionPool.close_instance())
+    AsyncQdrantConnectionPool._instance_lock = None
+
+
+def test_documents_by_ids_use_the_payload_cache_off_the_event_loop(monkeypatch):
+    cached_id, fetched_id = str(uuid.uuid4()), str(uuid.uuid4())
+    payload_cache = ChunkPayloadCache.get_instance()
+    payload_cache.set_many({cached_id: make_payload("cached")})
+
+    cache_threads = []
+    for name in ("get_many", "set_many"):
+        method = getattr(ChunkPayloadCache, name)
+        def recording(self, *args, method=method):
+            cache_threads.append(threading.current_thread())
+            return method(self, *args)
+        monkeypatch.setattr(ChunkPayloadCache, name, recording)
+
+    async def scenario():
+        pool = await AsyncQdrantConnectionPool.get_instance()
+        async with pool.get_client() as client:
+            await client.create_collection(
+                collection_name=settings.QDRANT_COLLECTION,
+                vectors_config=models.VectorParams(size=2, distance=models.Distance.COSINE)
+            )
+            await client.upsert(
+                collection_name=settings.QDRANT_COLLECTION,
+                points=[models.PointStruct(id=fetched_id, vector=[1.0, 0.0], payload=make_payload("fetched"))]
+            )
+
+        documents = await QdrantService(FakeLLMService()).get_documents_by_ids_async([
+            ChatDocument(chunk_id=cached_id, score=0.9),
+            ChatDocument(chunk_id=fetched_id, score=0.8),
+        ])
+        return threading.current_thread(), documents
+
+    loop_thread, documents = asyncio.run(scenario())
+
+    assert [document["data"]["title"] for document in documents] == ["cached", "fetched"]
+    assert len(cache_threads) == 2
+    assert loop_thread not in cache_threads
+    # The fetched payload is cached for the next session view
+    assert payload_cache.get_many([fetched_id]) == ({fetched_id: make_payload("fetched")}, [])
+
+
+def test_payload_cache_is_bypassed_without_a_shared_generation(monkeypatch):
+    # A purge in one worker couldn't reach the others
+    monkeypatch.setattr(settings, "SHARED_CACHE_PATH", "")
+    payload_cache = ChunkPayloadCache.get_instance()
+    assert not payload_cache.enabled
+
+    payload_cache.set_many({"chunk-1": make_payload("cached")})
+    assert payload_cache.get_many(["chunk-1"]) == ({}, ["chunk-1"])
@@ -0,0 +1,110 @@
+import asyncio
+import pytest
+from qdrant_client import AsyncQdrantClient, models
+from app.config import settings
+from app.services.qdrant_pool import AsyncQdrantConnectionPool
+
+
+@pytest.fixture(autouse=True)
+def reset_pool():
+    AsyncQdrantConnectionPool._instance = None
+    AsyncQdrantConnectionPool._instance_lock = None
+    yield
+    if AsyncQdrantConnectionPool._instance is not None:
+        asyncio.run(AsyncQdrantConnectionPool.close_instance())
+    AsyncQdrantConnectionPool._instance_lock = None
+
+
+def test_pool_serves_an_in_memory_client():
+    async def scenario():
+        pool = await AsyncQdrantConnectionPool.get_instance()
+        assert pool.get_pool_stats()["available_connections"] == settings.QDRANT_POOL_SIZE
+
+        async with pool.get_client() as client:
+            assert isinstance(client, AsyncQdrantClient)
+            assert pool.get_pool_stats()["active_connections"] == 1
+            await client.create_collection(
+                collection_name=settings.QDRANT_COLLECTION,
+                vectors_config=models.VectorParams(size=2, distance=models.Distance.COSINE)
+            )
+            await client.upsert(
+                collection_name=settings.QDRANT_COLLECTION,
+                points=[models.PointStruct(id=1, vector=[1.0, 0.0], payload={"title": "Document"})]
+            )
+
+        # Local mode keeps its data per client, so every slot sees the same collection
+        async with pool.get_client() as first, pool.get_client() as second:
+            assert first is second
+            count = await second.count(collection_name=settings.QDRANT_COLLECTION)
+            assert count.count == 1
+
+        assert pool.get_pool_stats()["active_connections"] == 0
+        assert pool.get_pool_stats()["available_connections"] == settings.QDRANT_POOL_SIZE
+
+    asyncio.run(scenario())
+
+
+def test_pool_times_out_when_every_client_is_in_use(monkeypatch):
+    monkeypatch.setattr(settings, "QDRANT_POOL_TIMEOUT", 0.1)
+
+    async def scenario():
+        pool = await AsyncQdrantConnectionPool.get_instance()
+        clients = [pool.get_client() for _ in range(settings.QDRANT_POOL_SIZE)]
+        for client in clients:
+            await client.__aenter__()
+
+        with pytest.raises(RuntimeError):
+            async with pool.get_client():
+                pass
+        assert pool.get_pool_stats()["waiting_requests"] == 0
+
+        for client in clients:
+            await client.__aexit__(None, None, None)
+
+    asyncio.run(scenario())
+
+
+def test_pool_without_connections_is_not_cached(monkeypatch):
+    create_client = AsyncQdrantConnectionPool._create_client
+
+    def unreachable(self):
+        raise ConnectionError("Qdrant is down")
+
+    async def scenario():
+        monkeypatch.setattr(AsyncQdrantConnectionPool, "_create_client", unreachable)
+        with pytest.raises(RuntimeError):
+            await AsyncQdrantConnectionPool.get_instance()
+        assert AsyncQdrantConnectionPool._instance is None
+
+        # Qdrant is back, the next request connects
+        monkeypatch.setattr(AsyncQdrantConnectionPool, "_create_client", create_client)
+        pool = await AsyncQdrantConnectionPool.get_instance()
+        assert pool.get_pool_stats()["available_connections"] == settings.QDRANT_POOL_SIZE
+
+    asyncio.run(scenario())
+
+
+def test_health_check_refills_a_short_pool(monkeypatch):
+    create_client = AsyncQdrantConnectionPool._create_client
+    attempts = []
+
+    def first_connection_fails(self):
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise ConnectionError("Qdrant is restarting")
+        return create_client(self)
+
+    monkeypatch.setattr(AsyncQdrantConnectionPool, "_create_client", first_connection_fails)
+
+    async def scenario():
+        pool = await AsyncQdrantConnectionPool.get_instance()
+        assert pool.get_pool_stats()["total_connections"] == settings.QDRANT_POOL_SIZE - 1
+
+        # Force the next get_client to run the health check
+        pool._last_health_check = None
+        async with pool.get_client():
+            pass
+        assert pool.get_pool_stats()["total_connections"] == settings.QDRANT_POOL_SIZE
+        assert pool.get_pool_stats()["available_connections"] == settings.QDRANT_POOL_SIZE
+
+    asyncio.run(scenario())
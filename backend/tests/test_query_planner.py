@@ -0,0 +1,103 @@
+import asyncio
+import time
+import pytest
+from qdrant_client import models
+from app.config import settings
+from app.services.qdrant_pool import AsyncQdrantConnectionPool
+from app.services.qdrant_service import QdrantService
+from app.services.query_planner import QueryPlanner
+from fakes import FakeLLMService
+
+
+@pytest.fixture(autouse=True)
+def planner_settings(monkeypatch):
+    monkeypatch.setattr(settings, "QDRANT_PLANNER_ENABLED", True)
+    monkeypatch.setattr(settings, "QDRANT_SPARSE_RETRIEVE_LIMIT", 100)
+    monkeypatch.setattr(settings, "QDRANT_DENSE_RETRIEVE_LIMIT", 100)
+    monkeypatch.setattr(settings, "QDRANT_PLANNER_EXACT_THRESHOLD", 10000)
+    monkeypatch.setattr(settings, "QDRANT_PLANNER_SELECTIVE_RATIO", 0.05)
+    monkeypatch.setattr(settings, "QDRANT_PLANNER_FILTERED_HNSW_EF", 128)
+    monkeypatch.setattr(settings, "QDRANT_PLANNER_BROAD_LIMIT_FACTOR", 2.0)
+
+
+def test_exact_search_for_small_filters():
+    plan = QueryPlanner.choose(5000, 4_000_000)
+    assert plan.strategy == "exact"
+    assert plan.search_params.exact
+    assert (plan.sparse_limit, plan.dense_limit) == (100, 100)
+
+
+def test_filtered_limits_grow_with_selectivity():
+    # 1% of the collection is a fifth of the way to the selective ratio of 5%
+    small = QueryPlanner.choose(40_000, 4_000_000)
+    assert small.strategy == "hnsw_filtered"
+    assert (small.sparse_limit, small.dense_limit) == (120, 120)
+    assert small.search_params.hnsw_ef == 128
+
+    large = QueryPlanner.choose(180_000, 4_000_000)
+    assert large.strategy == "hnsw_filtered"
+    assert (large.sparse_limit, large.dense_limit) == (190, 190)
+    assert large.search_params.hnsw_ef == 190
+
+
+def test_broad_searches_get_the_broad_limits():
+    plan = QueryPlanner.choose(4_000_000, 4_000_000)
+    assert plan.strategy == "hnsw"
+    assert plan.search_params is None
+    assert (plan.sparse_limit, plan.dense_limit) == (200, 200)
+
+
+class SlowEmbeddingLLMService(FakeLLMService):
+    def __init__(self, delay: float):
+        super().__init__()
+        self.delay = delay
+        self.embedded_at = None
+
+    def generate_dense_embedding(self, query: str):
+        time.sleep(self.delay)
+        self.embedded_at = time.monotonic()
+        return [1.0, 0.0]
+
+
+def test_filter_count_runs_while_the_query_is_embedded(monkeypatch):
+    QueryPlanner._instance = None
+    AsyncQdrantConnectionPool._instance = None
+    AsyncQdrantConnectionPool._instance_lock = None
+    monkeypatch.setattr(QdrantService, "generate_sparse_embedding", lambda self, query: None)
+
+    counted_at = []
+    count_async = QueryPlanner._count_async
+
+    async def recording_count(pool, search_filter):
+        count = await count_async(pool, search_filter)
+        counted_at.append(time.monotonic())
+        return count
+
+    monkeypatch.setattr(QueryPlanner, "_count_async", staticmethod(recording_count))
+
+    async def scenario():
+        pool = await AsyncQdrantConnectionPool.get_instance()
+        async with pool.get_client() as client:
+            await client.create_collection(
+                collection_name=settings.QDRANT_COLLECTION,
+                vectors_config={QdrantService.DENSE_VECTORS_NAME: models.VectorParams(size=2, distance=models.Distance.COSINE)}
+            )
+            await client.upsert(
+                collection_name=settings.QDRANT_COLLECTION,
+                points=[models.PointStruct(id=1, vector={QdrantService.DENSE_VECTORS_NAME: [1.0, 0.0]}, payload={"content": "tekst"})]
+            )
+
+        llm_service = SlowEmbeddingLLMService(delay=0.3)
+        results = await QdrantService(llm_service).hybrid_search_async("zonnepanelen")
+        await AsyncQdrantConnectionPool.close_instance()
+        return llm_service, results
+
+    try:
+        llm_service, results = asyncio.run(scenario())
+    finally:
+        QueryPlanner._instance = None
+        AsyncQdrantConnectionPool._instance_lock = None
+
+    assert [result["id"] for result in results] == [1]
+    assert len(counted_at) == 1
+    assert counted_at[0] < llm_service.embedded_at
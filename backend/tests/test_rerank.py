@@ -0,0 +1,102 @@
+from types import SimpleNamespace
+import pytest
+import yaml
+from app.config import settings
+from app.services.rerank_cache import RerankDocumentCache, RerankScoreCache
+from app.services.qdrant_service import QdrantService
+from fakes import FakeLLMService
+
+RELEVANCE = {"a": 0.91, "b": 0.12, "c": 0.77, "d": 0.45, "e": 0.83, "f": 0.30}
+
+
+def make_candidate(title: str):
+    return {
+        "id": f"chunk-{title}",
+        "payload": {
+            "content": f"Inhoud van {title}",
+            "meta": {
+                "title": title,
+                "location_name": "Amsterdam",
+                "published": "2024-01-01T00:00:00",
+                "type": "nieuws",
+                "source": "poliflw",
+            },
+        },
+    }
+
+
+class FakeRerankLLMService(FakeLLMService):
+    """Scores every document on its own, like Cohere, and returns the top_n in reverse order"""
+
+    def __init__(self):
+        super().__init__()
+        self.requests = []
+
+    def rerank_documents(self, query: str, documents: list, top_n: int = 20, return_documents: bool = True):
+        self.requests.append(documents)
+        scored = [(idx, RELEVANCE[yaml.safe_load(document)["Title"]]) for idx, document in enumerate(documents)]
+        top = sorted(scored, key=lambda item: item[1], reverse=True)[:top_n]
+        return SimpleNamespace(results=[
+            SimpleNamespace(index=idx, relevance_score=score) for idx, score in reversed(top)
+        ])
+
+
+@pytest.fixture(autouse=True)
+def fresh_rerank_caches(monkeypatch):
+    monkeypatch.setattr(settings, "RERANK_DOC_RETRIEVE_LIMIT", 3)
+    RerankScoreCache._instance = None
+    RerankDocumentCache._instance = None
+    yield
+    RerankScoreCache._instance = None
+    RerankDocumentCache._instance = None
+
+
+def rerank(service: QdrantService, query: str, candidates):
+    rerank_documents, rerank_keys, rerank_scores = service._prepare_rerank(query, candidates)
+    uncached = [i for i, score in enumerate(rerank_scores) if score is None]
+    if uncached:
+        reranked_documents = service.llm_service.rerank_documents(**service._rerank_request(query, rerank_documents, uncached))
+        service._merge_rerank_results(reranked_documents, uncached, rerank_keys, rerank_scores)
+    return service._apply_rerank_top_n(rerank_scores)
+
+
+def test_merged_scores_equal_a_full_rerank():
+    candidates = [make_candidate(title) for title in RELEVANCE]
+    query = "zonnepanelen"
+
+    # What the baseline did: one rerank of every candidate with the top_n cut
+    full_llm_service = FakeRerankLLMService()
+    full_service = QdrantService(full_llm_service)
+    full = full_llm_service.rerank_documents(
+        query, full_service._rerank_documents(candidates), top_n=settings.RERANK_DOC_RETRIEVE_LIMIT
+    )
+    expected = [0.0] * len(candidates)
+    for result in full.results:
+        expected[result.index] = result.relevance_score
+    assert expected == [0.91, 0.0, 0.77, 0.0, 0.83, 0.0]
+
+    # An earlier query scored some of the candidates, including one that makes the top 3
+    llm_service = FakeRerankLLMService()
+    service = QdrantService(llm_service)
+    rerank(service, query, [candidates[1], candidates[2], candidates[5]])
+    llm_service.requests.clear()
+
+    scores = rerank(service, query, candidates)
+
+    assert [yaml.safe_load(document)["Title"] for document in llm_service.requests[0]] == ["a", "d", "e"]
+    assert scores == expected
+
+
+def test_reindexed_chunk_is_sent_with_its_new_content():
+    llm_service = FakeRerankLLMService()
+    service = QdrantService(llm_service)
+    candidate = make_candidate("a")
+    rerank(service, "zonnepanelen", [candidate])
+
+    # Same chunk id after a reindex, without a purge reaching this worker
+    reindexed = make_candidate("a")
+    reindexed["payload"]["content"] = "Nieuwe inhoud van a"
+    rerank(service, "zonnepanelen", [reindexed])
+
+    assert len(llm_service.requests) == 2
+    assert yaml.safe_load(llm_service.requests[1][0])["Content"] == "Nieuwe inhoud van a"
@@ -0,0 +1,94 @@
+import time
+import numpy as np
+import pytest
+from app.config import settings
+from app.schemas import Location
+from app.services.retrieval_cache import RetrievalCache
+from app.services.semantic_cache import SemanticQueryCache, normalize_vector
+
+AMSTERDAM = [Location(id="GM0363", name="Amsterdam", type="municipality")]
+ALMERE = [Location(id="GM0034", name="Almere", type="municipality")]
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache(monkeypatch):
+    monkeypatch.setattr(settings, "SHARED_CACHE_PATH", "")
+    monkeypatch.setattr(settings, "SEMANTIC_CACHE_SIMILARITY_THRESHOLD", 0.95)
+    monkeypatch.setattr(settings, "SEMANTIC_CACHE_MAX_ENTRIES", 100)
+    monkeypatch.setattr(settings, "SEMANTIC_CACHE_TTL", 60)
+    RetrievalCache._instance = None
+    yield
+    RetrievalCache._instance = None
+
+
+def documents(title: str):
+    return [{"id": title, "payload": {"title": title}}]
+
+
+def test_hit_at_or_above_the_threshold(monkeypatch):
+    cache = SemanticQueryCache()
+    cache.add("regels zonnepanelen", [1.0, 0.0], AMSTERDAM, None, documents("zon"))
+    # The cosine similarity of [3, 4] to [1, 0] is 0.6, as the cache computes it in float32
+    similarity = float(normalize_vector([3.0, 4.0]) @ normalize_vector([1.0, 0.0]))
+
+    monkeypatch.setattr(settings, "SEMANTIC_CACHE_SIMILARITY_THRESHOLD", similarity)
+    assert cache.lookup("zonnepanelen regels", [3.0, 4.0], AMSTERDAM, None) == documents("zon")
+    assert cache.lookup("regels zonnepanelen", [1.0, 0.0], AMSTERDAM, None) == documents("zon")
+
+    monkeypatch.setattr(settings, "SEMANTIC_CACHE_SIMILARITY_THRESHOLD", float(np.nextafter(similarity, 1.0)))
+    assert cache.lookup("zonnepanelen regels", [3.0, 4.0], AMSTERDAM, None) is None
+
+
+def test_returned_documents_are_copies():
+    cache = SemanticQueryCache()
+    cache.add("regels zonnepanelen", [1.0, 0.0], AMSTERDAM, None, documents("zon"))
+
+    cache.lookup("regels zonnepanelen", [1.0, 0.0], AMSTERDAM, None)[0]["id"] = "changed"
+    assert cache.lookup("regels zonnepanelen", [1.0, 0.0], AMSTERDAM, None) == documents("zon")
+
+
+def test_miss_for_other_filters():
+    cache = SemanticQueryCache()
+    cache.add("regels zonnepanelen", [1.0, 0.0], AMSTERDAM, None, documents("zon"))
+
+    assert cache.lookup("regels zonnepanelen", [1.0, 0.0], ALMERE, None) is None
+    assert cache.lookup("regels zonnepanelen", [1.0, 0.0], None, None) is None
+    assert cache.lookup("regels zonnepanelen", [1.0, 0.0], AMSTERDAM, None, group_by_document=True) is None
+
+
+def test_entries_expire_after_the_ttl(monkeypatch):
+    cache = SemanticQueryCache()
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now)
+    cache.add("regels zonnepanelen", [1.0, 0.0], AMSTERDAM, None, documents("zon"))
+    assert cache.lookup("regels zonnepanelen", [1.0, 0.0], AMSTERDAM, None) == documents("zon")
+
+    monkeypatch.setattr(time, "time", lambda: now + settings.SEMANTIC_CACHE_TTL)
+    assert cache.lookup("regels zonnepanelen", [1.0, 0.0], AMSTERDAM, None) is None
+    assert cache._entries == 0
+
+
+def test_eviction_drops_the_least_recently_used_filters(monkeypatch):
+    monkeypatch.setattr(settings, "SEMANTIC_CACHE_MAX_ENTRIES", 2)
+    cache = SemanticQueryCache()
+    cache.add("regels zonnepanelen", [1.0, 0.0], AMSTERDAM, None, documents("amsterdam"))
+    cache.add("regels zonnepanelen", [1.0, 0.0], ALMERE, None, documents("almere"))
+    # Amsterdam is used more recently than Almere
+    assert cache.lookup("regels zonnepanelen", [1.0, 0.0], AMSTERDAM, None) is not None
+
+    cache.add("regels zonnepanelen", [1.0, 0.0], None, None, documents("overal"))
+
+    assert cache._entries == 2
+    assert cache.lookup("regels zonnepanelen", [1.0, 0.0], ALMERE, None) is None
+    assert cache.lookup("regels zonnepanelen", [1.0, 0.0], AMSTERDAM, None) == documents("amsterdam")
+    assert cache.lookup("regels zonnepanelen", [1.0, 0.0], None, None) == documents("overal")
+
+
+def test_purging_the_retrieval_cache_clears_the_entries():
+    cache = SemanticQueryCache()
+    cache.add("regels zonnepanelen", [1.0, 0.0], AMSTERDAM, None, documents("zon"))
+
+    RetrievalCache.get_instance().purge()
+
+    assert cache.lookup("regels zonnepanelen", [1.0, 0.0], AMSTERDAM, None) is None
+    assert cache._entries == 0
@@ -0,0 +1,112 @@
+import time
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from app.config import settings
+from app.database import Base, SessionLocal, engine
+from app import models  # noqa: F401, registers the tables
+from app.routers import sessions as sessions_router
+from app.schemas import ChatMessage, MessageFeedbackCreate, MessageRole, MessageType, SessionCreate, SessionFeedbackCreate
+from app.services.bron_service import BronService, LocationsSnapshot
+from app.services.feedback_service import FeedbackService
+from app.services.payload_cache import ChunkPayloadCache
+from app.services.session_cache import SessionCache
+from app.services.session_service import SessionService
+from fakes import FakeLLMService
+
+
+@pytest.fixture(autouse=True)
+def shared_session_cache(monkeypatch, tmp_path):
+    monkeypatch.setattr(settings, "SHARED_CACHE_PATH", str(tmp_path / "shared.sqlite3"))
+    monkeypatch.setattr(settings, "SESSION_CACHE_ENABLED", True)
+    SessionCache._instance = None
+    ChunkPayloadCache._instance = None
+    Base.metadata.create_all(bind=engine)
+
+    snapshot = LocationsSnapshot.create([], time.time())
+
+    async def get_locations_snapshot(self):
+        return snapshot
+
+    monkeypatch.setattr(BronService, "get_locations_snapshot", get_locations_snapshot)
+    monkeypatch.setattr(sessions_router, "get_llm_service", FakeLLMService)
+    yield
+    SessionCache._instance = None
+    ChunkPayloadCache._instance = None
+
+
+@pytest.fixture
+def db():
+    db = SessionLocal()
+    yield db
+    db.close()
+
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+    app.include_router(sessions_router.router)
+    return TestClient(app)
+
+
+def session_url(session_id: str) -> str:
+    return sessions_router.base_api_url + f"sessions/{session_id}"
+
+
+def user_message(content: str) -> ChatMessage:
+    return ChatMessage(role=MessageRole.USER, message_type=MessageType.USER_MESSAGE, content=content)
+
+
+def get_etag(client: TestClient, session_id: str) -> str:
+    response = client.get(session_url(session_id))
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+    # The same version is answered with 304 and no body
+    not_modified = client.get(session_url(session_id), headers={"If-None-Match": etag})
+    assert not_modified.status_code == 304
+    assert not_modified.content == b""
+    return etag
+
+
+def test_every_write_to_a_session_changes_its_etag(client, db):
+    session_service = SessionService(db)
+    session_id = session_service.create_session(SessionCreate(name="Zonnepanelen", messages=[])).id
+    etags = [get_etag(client, session_id)]
+
+    session_service.add_message(session_id, user_message("vraag"))
+    etags.append(get_etag(client, session_id))
+
+    message = session_service.add_and_get_message(session_id, ChatMessage(
+        role=MessageRole.ASSISTANT, message_type=MessageType.ASSISTANT_MESSAGE, content="antwoord", formatted_content="antwoord"
+    ))
+    etags.append(get_etag(client, session_id))
+
+    message.content = message.formatted_content = "beter antwoord"
+    session_service.update_message(message)
+    etags.append(get_etag(client, session_id))
+
+    session_service.update_session_name(session_id, "Regels voor zonnepanelen")
+    etags.append(get_etag(client, session_id))
+
+    FeedbackService(db).create_message_feedback(MessageFeedbackCreate(message_id=message.id, feedback_type="positive"))
+    etags.append(get_etag(client, session_id))
+
+    FeedbackService(db).create_session_feedback(SessionFeedbackCreate(session_id=session_id, question="Klopt dit?"))
+    etags.append(get_etag(client, session_id))
+
+    assert len(set(etags)) == len(etags)
+    # A browser holding an old ETag gets the current session
+    stale = client.get(session_url(session_id), headers={"If-None-Match": etags[0]})
+    assert stale.status_code == 200
+    assert stale.json()["name"] == "Regels voor zonnepanelen"
+    assert [message["content"] for message in stale.json()["messages"]] == ["vraag", "beter antwoord"]
+
+
+def test_session_is_not_cached_without_shared_versions(client, db, monkeypatch):
+    monkeypatch.setattr(settings, "SHARED_CACHE_PATH", "")
+    SessionCache._instance = None
+    session_id = SessionService(db).create_session(SessionCreate(name="Zonnepanelen", messages=[])).id
+
+    response = client.get(session_url(session_id))
+    assert response.status_code == 200
+    assert "ETag" not in response.headers
@@ -0,0 +1,126 @@
+import asyncio
+import json
+import time
+import pytest
+from app.routers.chat import event_generator
+from app.schemas import ChatMessage, MessageRole, MessageType, SearchFilter
+from app.services.admission_controller import AdmissionController
+from app.services.chat_turn_guard import ChatTurnGuard
+from app.services.session_write_buffer import SessionWriteBuffer
+from fakes import FakeLLMService, FakeQdrantService, FakeSessionService, make_session
+
+
+def parse_event(chunk: str):
+    return json.loads(chunk.split("data: ", 1)[1])
+
+
+async def start_stream(session_service: FakeSessionService, llm_service: FakeLLMService):
+    admission = AdmissionController(max_in_flight=1, max_queue=0)
+    return event_generator(
+        session_service.session.id,
+        "Wat zijn de regels voor zonnepanelen?",
+        time.time(),
+        session_service,
+        llm_service,
+        FakeQdrantService(),
+        SearchFilter(),
+        ChatTurnGuard(),
+        await admission.admit("client"),
+    )
+
+
+def test_failed_flush_keeps_writes_for_retry():
+    session_service = FakeSessionService(fail_saves=1)
+    buffer = SessionWriteBuffer(session_service, make_session())
+    message = ChatMessage(role=MessageRole.USER, message_type=MessageType.USER_MESSAGE, content="vraag")
+    buffer.add_message(message)
+    buffer.update_session_name("Zonnepanelen")
+
+    with pytest.raises(RuntimeError):
+        buffer.flush()
+    assert buffer.has_pending_writes
+    assert session_service.saved_turns == []
+
+    buffer.flush()
+    assert not buffer.has_pending_writes
+    assert session_service.calls.count("save_turn") == 2
+    assert [saved.content for saved in session_service.saved_messages] == ["vraag"]
+    assert session_service.saved_turns[0]["name"] == "Zonnepanelen"
+
+
+def assert_partial_answer_saved(session_service: FakeSessionService, partial_text: str):
+    assert session_service.calls.count("save_turn") == 1
+    turn = session_service.saved_turns[0]
+    assistant_messages = [message for message in turn["new_messages"] if message.message_type == MessageType.ASSISTANT_MESSAGE]
+    assert [message.content for message in assistant_messages] == [partial_text]
+    status_message = next(message for message in turn["new_messages"] if message.message_type == MessageType.STATUS)
+    assert "onderbroken" in status_message.content
+
+
+def test_disconnect_mid_stream_persists_partial_answer():
+    session_service = FakeSessionService()
+
+    async def scenario():
+        stream = await start_stream(session_service, FakeLLMService(chunks=["Een ", "half ", "antwoord"]))
+        async for chunk in stream:
+            if parse_event(chunk)["type"] == "partial":
+                break
+        # The client goes away after the first chunk of the answer
+        await stream.aclose()
+
+    asyncio.run(scenario())
+    assert_partial_answer_saved(session_service, "Een ")
+
+
+def test_cancelled_stream_persists_partial_answer():
+    session_service = FakeSessionService()
+    llm_service = FakeLLMService(chunks=["Een ", "half ", "antwoord"], block_at=1)
+
+    async def scenario():
+        stream = await start_stream(session_service, llm_service)
+
+        async def consume():
+            async for chunk in stream:
+                pass
+
+        consumer = asyncio.ensure_future(consume())
+        while not llm_service.entered.is_set():
+            await asyncio.sleep(0.01)
+        # Cancelled while the LLM is blocked on the second chunk, as on a server shutdown
+        consumer.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await consumer
+        llm_service.release()
+
+    asyncio.run(scenario())
+    assert_partial_answer_saved(session_service, "Een ")
+
+
+def test_completed_turn_is_written_in_one_transaction_before_full():
+    async def scenario():
+        session_service = FakeSessionService()
+        stream = await start_stream(session_service, FakeLLMService(chunks=["Het ", "antwoord."]))
+
+        full = None
+        async for chunk in stream:
+            if not chunk.startswith("data: "):
+                continue
+            event = parse_event(chunk)
+            if event["type"] == "full":
+                # The turn is already persisted when the session is read back
+                assert session_service.calls.count("save_turn") == 1
+                full = event
+        return session_service, full
+
+    session_service, full = asyncio.run(scenario())
+
+    assert session_service.calls.count("save_turn") == 1
+    save_index = session_service.calls.index("save_turn")
+    assert session_service.calls[save_index + 1:] == ["get_session_with_relations"]
+
+    turn = session_service.saved_turns[0]
+    assert [message.message_type for message in turn["new_messages"]] == [
+        MessageType.USER_MESSAGE, MessageType.STATUS, MessageType.ASSISTANT_MESSAGE
+    ]
+    assert turn["new_messages"][-1].content == "Het antwoord."
+    assert full["session"]["messages"][-1]["content"] == "Het antwoord."
@@ -6,7 +6,8 @@ function createSessionStore() {
         messages: [],
         documents: [],
         sessionName: '',
-        locations: []
+        locations: [],
+        locationsVersion: null
     });
 
     return {
@@ -18,7 +19,8 @@ function createSessionStore() {
             messages: [],
             documents: [],
             sessionName: 'Bron chat - Doorzoek 3.5 miljoen overheidsdocumenten met AI',
-            locations: []
+            locations: [],
+            locationsVersion: null
         })
     };
 }
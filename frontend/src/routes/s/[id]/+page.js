@@ -24,7 +24,9 @@ export async function load({ params, fetch }) {
             messages: sessionData.messages || [],
             documents: sessionData.documents || [],
             sessionName: sessionData.name || 'Bron chat - Doorzoek 3.5 miljoen overheidsdocumenten met AI',
-            locations: sessionData.locations || []
+            // The session only carries the locations it used, the location filter loads the full list from /locations
+            locations: [],
+            locationsVersion: sessionData.locations_version || null
         };
     } catch (err) {
         if (err.status) throw err;